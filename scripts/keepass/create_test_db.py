@@ -1,22 +1,301 @@
 #!/usr/bin/env python3
 
 import argparse
+import array
+import base64
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import csv
+import functools
+import gzip
+import hashlib
+import importlib.metadata
+import io
+import itertools
+import json
 import os
 import pathlib
+import platform
 import random
+import re
+import shutil
+import statistics
+import struct
 import sys
 import tempfile
+import time
+import tracemalloc
+import urllib.parse
 import uuid
+import zlib
+from collections.abc import Iterator
+from collections.abc import Sequence
+from dataclasses import asdict
 from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import replace
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
 
+try:
+    from . import kdbx_stream
+except ImportError:
+    import kdbx_stream
+
 
 KEYGUARD_ENTRY_TYPE_KEY = "Keyguard: Entry Type"
 URI_FIELD_PREFIX = "KP2A_URL_"
 DEFAULT_PASSWORD = "test-password"
 BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+KDBX_EPOCH = datetime(1, 1, 1, tzinfo=timezone.utc)
+# Entries are generated in shards of this size, each from its own RNG
+# substream. Changing it changes the generated content for every seed.
+SHARD_SIZE = 1_024
+# Plans store entry types as indexes into this tuple to keep them compact.
+ENTRY_TYPES = ("login", "secure_note")
+LOGIN_CODE = ENTRY_TYPES.index("login")
+SECURE_NOTE_CODE = ENTRY_TYPES.index("secure_note")
+# v1 plans the whole vault from the seed's main stream and fills shards from
+# sequential substreams. v2 derives every entry directly from (seed, index).
+GENERATION_SCHEMES = ("v1", "v2")
+DEFAULT_GENERATION_SCHEME = "v1"
+# pykeepass builds the whole XML tree before saving it. The stream writer
+# emits each group and entry as it is built, with memory that does not grow
+# with the vault, and needs v2 to build each group's entries in turn.
+WRITERS = ("pykeepass", "stream")
+DEFAULT_WRITER = "pykeepass"
+FEISTEL_ROUNDS = 4
+# Keeps --group-depth and --group-fanout from requesting runaway trees.
+MAX_GROUP_COUNT = 1_000_000
+DEFAULT_SPOT_CHECK_ENTRIES = 32
+DEFAULT_LOW_FIELD_UPPER_BOUND_EXCLUSIVE = 30
+# Attachment payloads are produced and hashed in chunks of this size.
+ATTACHMENT_CHUNK_SIZE = 1 << 20
+BYTE_SIZE_UNITS = {"GiB": 1 << 30, "MiB": 1 << 20, "KiB": 1 << 10, "B": 1}
+DEFAULT_ATTACHMENT_SIZE_BUCKETS = ((1 << 10, 64 << 10, 90), (64 << 10, 2 << 20, 10))
+# (edge length in pixels, weight) buckets for custom icon sizes.
+DEFAULT_CUSTOM_ICON_SIZE_BUCKETS = ((16, 40), (32, 35), (64, 15), (128, 8), (256, 2))
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# (min bytes, max bytes, weight) buckets for oversized note and field values.
+DEFAULT_OVERSIZED_VALUE_SIZE_BUCKETS = (
+    (1 << 10, 64 << 10, 80),
+    (64 << 10, 1 << 20, 15),
+    (1 << 20, 32 << 20, 5),
+)
+OVERSIZED_VALUE_CHUNK_SIZE = 1 << 20
+OVERSIZED_VALUE_STYLES = ("lines", "single_line", "unicode")
+OVERSIZED_VALUE_LINE_WORDS = 12
+# Every word is at least three UTF-8 bytes long.
+OVERSIZED_VALUE_WORDS = (
+    "vault",
+    "entry",
+    "secret",
+    "recovery",
+    "rotate",
+    "backup",
+    "größe",
+    "naïve",
+    "пароль",
+    "密码",
+    "🔐",
+)
+OVERSIZED_VALUE_UNICODE_WORDS = (
+    "ключ",
+    "пароль",
+    "κλειδί",
+    "مفتاح",
+    "密码",
+    "保险库",
+    "パスワード",
+    "비밀번호",
+    "🔐",
+    "🗝️",
+)
+# KeePass's default HistoryMaxItems.
+DEFAULT_HISTORY_MAX_ITEMS = 10
+# Share of history revisions that change the password rather than another field.
+HISTORY_PASSWORD_CHANGE_RATIO = 0.5
+
+KDF_NAMES = tuple(kdbx_stream.KDF_UUIDS)
+DEFAULT_AES_KDF_ROUNDS = 60_000
+DEFAULT_ARGON2_ITERATIONS = 10
+DEFAULT_ARGON2_MEMORY_MIB = 64
+DEFAULT_ARGON2_PARALLELISM = 2
+CALIBRATION_TABLE_VERSION = 1
+CALIBRATION_AES_KDF_ROUNDS = (10_000, 60_000, 300_000, 1_000_000)
+CALIBRATION_ARGON2_ITERATIONS = (1, 2, 5, 10)
+CALIBRATION_ARGON2_MEMORY_MIB = (16, 64, 128)
+CALIBRATION_ARGON2_PARALLELISM = (1, 2)
+
+# Part of every fixture cache key. Bump it whenever a change to this script
+# alters the generated content for an unchanged preset, seed and KDF.
+GENERATOR_VERSION = 1
+CACHE_DIR_ENV = "KEYGUARD_TEST_DB_CACHE_DIR"
+CACHE_DATABASE_NAME = "database.kdbx"
+CACHE_MANIFEST_NAME = "manifest.json"
+DEFAULT_CACHE_MAX_MIB = 4_096
+REPORT_VERSION = 1
+FIXTURE_MANIFEST_VERSION = 1
+# Manifest names for the KDF parameters in the KDBX header. The salt is left out.
+KDF_PARAMETER_NAMES = {
+    "R": "rounds",
+    "I": "iterations",
+    "M": "memory_bytes",
+    "P": "parallelism",
+    "V": "version",
+}
+MUTATION_LOG_VERSION = 1
+DEFAULT_SNAPSHOT_COUNT = 5
+DEFAULT_MUTATION_EDITS = 10
+DEFAULT_MUTATION_ADDITIONS = 5
+DEFAULT_MUTATION_DELETIONS = 2
+DEFAULT_MUTATION_MOVES = 2
+# Snapshots are this far apart, starting after the newest input timestamp.
+SNAPSHOT_INTERVAL = timedelta(hours=1)
+MERGE_MANIFEST_VERSION = 1
+REPLICA_NAMES = ("a", "b")
+DEFAULT_REPLICA_CHANGES = 100
+DEFAULT_REPLICA_CONFLICT_RATIO = 0.1
+# What each side of a conflict does to the entry. The newer side wins edits
+# and delete-versus-edit; a move and an edit on different sides both apply.
+REPLICA_CONFLICTS = {
+    "edit": ("edit", "edit"),
+    "delete": ("delete", "edit"),
+    "move": ("move", "edit"),
+}
+# Replica-only changes cycle through these.
+REPLICA_CHANGE_KINDS = ("edit", "delete", "move")
+MATRIX_SUMMARY_VERSION = 1
+MATRIX_FORMATS = ((3, 1), (4, 0))
+MATRIX_CIPHERS = tuple(kdbx_stream.CIPHER_UUIDS)
+MATRIX_COMPRESSIONS = ("gzip", "none")
+DEFAULT_MATRIX_PROTECTED_SHARES = (0.0, 0.5, 1.0)
+# Elements the matrix transcoder streams through instead of parsing whole.
+MATRIX_CONTAINER_TAGS = ("KeePassFile", "Root", "Group")
+FLEET_INDEX_VERSION = 1
+FLEET_INDEX_NAME = "fleet.json"
+FLEET_SPEC_KEYS = ("vaults", "seed", "presets", "entries", "kdf", "scheme", "writer")
+DEFAULT_FLEET_PRESET = "10k-small-fields"
+# Distributions a --profile histogram file may give. Value lengths are those
+# of generated custom field values; URI counts apply to logins only.
+PROFILE_DISTRIBUTIONS = (
+    "entries_per_group",
+    "custom_fields",
+    "value_length",
+    "uris",
+    "tags",
+    "history",
+)
+DEFAULT_URI_COUNT_MAX = 3
+QUERY_WORKLOAD_VERSION = 1
+QUERY_KINDS = ("prefix", "substring", "token", "custom_field", "url_host")
+# Queries with more hits record only the count and digest of their hit set.
+MAX_LISTED_QUERY_HITS = 1_000
+QUERY_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Search skips these string fields.
+UNSEARCHABLE_FIELDS = ("Password", KEYGUARD_ENTRY_TYPE_KEY)
+
+# The watchtower presets aim URIs at the domain lists bundled with the app.
+APP_RESOURCES_DIR = (
+    pathlib.Path(__file__).resolve().parents[2] / "common/src/commonMain/composeResources/files"
+)
+WATCHTOWER_FINDINGS_VERSION = 1
+AUTOFILL_WORKLOAD_VERSION = 1
+PUBLIC_SUFFIX_LIST_PATH = APP_RESOURCES_DIR / "public_suffix_list.txt"
+# Match modes in Keyguard's order. Each one is applied to every URI in turn.
+AUTOFILL_MATCH_MODES = ("domain", "host", "starts_with", "exact", "regex", "never")
+# Every this many targets, one is an Android app rather than a web page.
+AUTOFILL_ANDROID_TARGET_INTERVAL = 5
+AUTOFILL_SUBDOMAINS = ("www", "login", "accounts", "app")
+AUTOFILL_PATHS = ("login", "signin", "account/login", "session/new")
+# How hit URIs relate to their target. Hits cycle through these, so each
+# match mode is exercised at a fixed rate.
+AUTOFILL_HIT_RELATIONS = ("exact", "prefix", "path", "port", "subdomain", "regex")
+DEFAULT_REUSE_GROUP_SIZE = 3
+# Dictionary words that, with a short numeric suffix, fall well inside the
+# "Weak" band (crack time under 1000 s at 1e4 guesses per second).
+WEAK_PASSWORD_WORDS = (
+    "password",
+    "sunshine",
+    "dragon",
+    "monkey",
+    "football",
+    "letmein",
+    "shadow",
+    "master",
+    "qwerty",
+    "baseball",
+    "welcome",
+    "princess",
+    "superman",
+    "iloveyou",
+    "starwars",
+    "freedom",
+    "whatever",
+    "charlie",
+    "summer",
+    "winter",
+    "hello",
+    "flower",
+    "cookie",
+    "soccer",
+    "hockey",
+    "batman",
+    "tigger",
+    "pepper",
+    "ginger",
+    "banana",
+)
+
+
+@dataclass(frozen=True)
+class AliasTable:
+    """Walker alias table over (low, high, weight) bins.
+
+    Each draw picks a column with one `randrange` and keeps it or takes its
+    alias with one `random`, so sampling costs the same for any bin count.
+    """
+
+    bins: tuple[tuple[int, int, float], ...]
+    probabilities: tuple[float, ...]
+    aliases: tuple[int, ...]
+
+    def sample(self, rng: random.Random) -> int:
+        column = rng.randrange(len(self.bins))
+        if rng.random() >= self.probabilities[column]:
+            column = self.aliases[column]
+        low, high, _ = self.bins[column]
+        return rng.randint(low, high)
+
+
+@dataclass(frozen=True)
+class Profile:
+    """Histograms of (low, high, weight) bins, as loaded by `load_profile`.
+
+    An empty histogram leaves that part of the vault to the preset.
+    """
+
+    name: str
+    entries_per_group: tuple[tuple[int, int, float], ...] = ()
+    custom_fields: tuple[tuple[int, int, float], ...] = ()
+    value_length: tuple[tuple[int, int, float], ...] = ()
+    uris: tuple[tuple[int, int, float], ...] = ()
+    tags: tuple[tuple[int, int, float], ...] = ()
+    history: tuple[tuple[int, int, float], ...] = ()
+
+    @functools.cached_property
+    def alias_tables(self) -> dict[str, AliasTable]:
+        # Built once per process; not a field, so presets compare and hash
+        # by their histograms alone.
+        return {
+            distribution: build_alias_table(getattr(self, distribution))
+            for distribution in PROFILE_DISTRIBUTIONS
+            if getattr(self, distribution)
+        }
 
 
 @dataclass(frozen=True)
@@ -30,6 +309,57 @@ class Preset:
     default_seed: int
     low_field_target_count: int | None = None
     low_field_upper_bound_exclusive: int | None = None
+    attachment_count: int = 0
+    # Share of attachments that reuse the content, and so the binary pool
+    # entry, of another attachment.
+    attachment_duplicate_ratio: float = 0.0
+    # (min bytes, max bytes, weight) buckets for attachment sizes.
+    attachment_size_buckets: tuple[tuple[int, int, int], ...] = ()
+    # Revisions drawn per entry before the HistoryMaxItems cap is applied.
+    history_min: int = 0
+    history_max: int = 0
+    history_max_items: int = DEFAULT_HISTORY_MAX_ITEMS
+    # Complete tree of subgroups below the preset group. Depth 0 keeps every
+    # entry in the preset group itself.
+    group_depth: int = 0
+    group_fanout: int = 0
+    tag_vocabulary: int = 0
+    tags_per_entry_max: int = 0
+    # Zipf exponent for tag popularity; 0 draws tags uniformly.
+    tag_skew: float = 0.0
+    # Shares of login entries. Reused and weak passwords are disjoint, and so
+    # are URIs on 2FA and passkey domains.
+    reused_password_ratio: float = 0.0
+    reuse_group_size: int = DEFAULT_REUSE_GROUP_SIZE
+    weak_password_ratio: float = 0.0
+    tfa_domain_ratio: float = 0.0
+    passkey_domain_ratio: float = 0.0
+    # Autofill targets, and the shares of logins whose URL is derived from a
+    # target (a hit) or is a lookalike that no match mode accepts (a miss).
+    autofill_target_count: int = 0
+    autofill_hit_ratio: float = 0.0
+    autofill_miss_ratio: float = 0.0
+    # PNG icons in Meta/CustomIcons, and the share of entries and preset
+    # groups that show one. Icons are shared once there are more users than
+    # icons.
+    custom_icon_count: int = 0
+    custom_icon_ratio: float = 0.0
+    custom_icon_size_buckets: tuple[tuple[int, int], ...] = ()
+    # Notes and custom field values of KiB to tens of MiB, at most one per
+    # entry, with (min bytes, max bytes, weight) size buckets.
+    oversized_value_count: int = 0
+    oversized_value_size_buckets: tuple[tuple[int, int, int], ...] = ()
+    # Empirical distributions that replace the ranges above where given.
+    profile: Profile | None = None
+
+
+@dataclass(frozen=True)
+class KdfSettings:
+    kdf: str
+    # AES-KDF rounds or Argon2 iterations.
+    rounds: int
+    memory_mib: int = 0
+    parallelism: int = 0
 
 
 PRESETS = {
@@ -53,13 +383,388 @@ PRESETS = {
         low_field_target_count=4_500,
         low_field_upper_bound_exclusive=30,
     ),
+    "1k-attachments": Preset(
+        name="1k-attachments",
+        entry_count=1_000,
+        login_count=800,
+        secure_note_count=200,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=1_003,
+        attachment_count=300,
+        attachment_duplicate_ratio=0.3,
+        attachment_size_buckets=(
+            (1 << 10, 64 << 10, 900),
+            (64 << 10, 2 << 20, 98),
+            (64 << 20, 128 << 20, 2),
+        ),
+    ),
+    "5k-history": Preset(
+        name="5k-history",
+        entry_count=5_000,
+        login_count=4_000,
+        secure_note_count=1_000,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=5_007,
+        history_min=0,
+        history_max=30,
+        history_max_items=20,
+    ),
+    "10k-deep-groups": Preset(
+        name="10k-deep-groups",
+        entry_count=10_000,
+        login_count=8_000,
+        secure_note_count=2_000,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=10_011,
+        group_depth=12,
+        group_fanout=2,
+        tag_vocabulary=50,
+        tags_per_entry_max=3,
+        tag_skew=1.0,
+    ),
+    "10k-wide-groups": Preset(
+        name="10k-wide-groups",
+        entry_count=10_000,
+        login_count=8_000,
+        secure_note_count=2_000,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=10_013,
+        group_depth=2,
+        group_fanout=150,
+        tag_vocabulary=5_000,
+        tags_per_entry_max=5,
+        tag_skew=1.2,
+    ),
+    "10k-watchtower": Preset(
+        name="10k-watchtower",
+        entry_count=10_000,
+        login_count=8_000,
+        secure_note_count=2_000,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=10_017,
+        reused_password_ratio=0.15,
+        weak_password_ratio=0.1,
+        tfa_domain_ratio=0.25,
+        passkey_domain_ratio=0.1,
+    ),
+    "10k-autofill": Preset(
+        name="10k-autofill",
+        entry_count=10_000,
+        login_count=8_000,
+        secure_note_count=2_000,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=10_019,
+        autofill_target_count=500,
+        autofill_hit_ratio=0.3,
+        autofill_miss_ratio=0.1,
+    ),
+    "5k-custom-icons": Preset(
+        name="5k-custom-icons",
+        entry_count=5_000,
+        login_count=4_000,
+        secure_note_count=1_000,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=5_011,
+        group_depth=1,
+        group_fanout=20,
+        custom_icon_count=2_000,
+        custom_icon_ratio=0.8,
+        custom_icon_size_buckets=DEFAULT_CUSTOM_ICON_SIZE_BUCKETS,
+    ),
+    "1k-oversized-values": Preset(
+        name="1k-oversized-values",
+        entry_count=1_000,
+        login_count=800,
+        secure_note_count=200,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=1_007,
+        oversized_value_count=100,
+        oversized_value_size_buckets=DEFAULT_OVERSIZED_VALUE_SIZE_BUCKETS,
+    ),
+    "100k-small-fields": Preset(
+        name="100k-small-fields",
+        entry_count=100_000,
+        login_count=80_000,
+        secure_note_count=20_000,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=100_003,
+    ),
+    "1m-small-fields": Preset(
+        name="1m-small-fields",
+        entry_count=1_000_000,
+        login_count=800_000,
+        secure_note_count=200_000,
+        custom_field_min=0,
+        custom_field_max=4,
+        default_seed=1_000_003,
+    ),
 }
 
 
-def parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(
-        description="Create deterministic KeePass test databases for Keyguard.",
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"Expected a positive integer, got {value!r}.")
+    return number
+
+
+def ratio(value: str) -> float:
+    number = float(value)
+    if not (0.0 <= number <= 1.0):
+        raise argparse.ArgumentTypeError(f"Expected a ratio between 0 and 1, got {value!r}.")
+    return number
+
+
+def custom_field_range(value: str) -> tuple[int, int, int | None]:
+    parts = value.split(":")
+    if len(parts) not in (2, 3) or not all(part.isdigit() for part in parts):
+        raise argparse.ArgumentTypeError(
+            f"Expected MIN:MAX or MIN:MAX:LOW_TARGET, got {value!r}."
+        )
+    custom_field_min, custom_field_max = int(parts[0]), int(parts[1])
+    if custom_field_min > custom_field_max:
+        raise argparse.ArgumentTypeError(
+            f"Custom field minimum {custom_field_min} is above maximum {custom_field_max}."
+        )
+    low_field_target_count = int(parts[2]) if len(parts) == 3 else None
+    return custom_field_min, custom_field_max, low_field_target_count
+
+
+def history_range(value: str) -> tuple[int, int]:
+    parts = value.split(":")
+    if len(parts) not in (1, 2) or not all(part.isdigit() for part in parts):
+        raise argparse.ArgumentTypeError(f"Expected N or MIN:MAX, got {value!r}.")
+    history_min, history_max = int(parts[0]), int(parts[-1])
+    if history_min > history_max:
+        raise argparse.ArgumentTypeError(
+            f"History minimum {history_min} is above maximum {history_max}."
+        )
+    return history_min, history_max
+
+
+def non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"Expected a non-negative integer, got {value!r}.")
+    return number
+
+
+def parse_byte_size(value: str) -> int:
+    for unit, multiplier in BYTE_SIZE_UNITS.items():
+        if value.endswith(unit):
+            number = value.removesuffix(unit)
+            break
+    else:
+        number, multiplier = value, 1
+    if not number.isdigit():
+        raise ValueError(f"Expected a size like 512, 64KiB or 2MiB, got {value!r}.")
+    return int(number) * multiplier
+
+
+def byte_size_buckets(value: str) -> tuple[tuple[int, int, int], ...]:
+    buckets = []
+    try:
+        for bucket in value.split(","):
+            size_range, _, weight = bucket.partition(":")
+            min_size, _, max_size = size_range.partition("-")
+            buckets.append(
+                (
+                    parse_byte_size(min_size),
+                    parse_byte_size(max_size or min_size),
+                    int(weight or "1"),
+                )
+            )
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+    if any(min_size > max_size or weight < 0 for min_size, max_size, weight in buckets):
+        raise argparse.ArgumentTypeError(f"Invalid size buckets {value!r}.")
+    return tuple(buckets)
+
+
+def ratio_list(value: str) -> tuple[float, ...]:
+    return tuple(sorted({ratio(part) for part in value.split(",")}))
+
+
+def custom_icon_size_buckets(value: str) -> tuple[tuple[int, int], ...]:
+    buckets = []
+    for bucket in value.split(","):
+        size, _, weight = bucket.partition(":")
+        if not size.isdigit() or not (weight or "1").isdigit() or int(size) < 1:
+            raise argparse.ArgumentTypeError(f"Invalid custom icon size buckets {value!r}.")
+        buckets.append((int(size), int(weight or "1")))
+    return tuple(buckets)
+
+
+def build_alias_table(histogram: tuple[tuple[int, int, float], ...]) -> AliasTable:
+    """Build the alias table for `histogram` with Vose's method."""
+    total = sum(weight for _, _, weight in histogram)
+    scaled = [weight * len(histogram) / total for _, _, weight in histogram]
+    probabilities = [1.0] * len(histogram)
+    aliases = list(range(len(histogram)))
+    small = [column for column, share in enumerate(scaled) if share < 1]
+    large = [column for column, share in enumerate(scaled) if share >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probabilities[less] = scaled[less]
+        aliases[less] = more
+        scaled[more] += scaled[less] - 1
+        (small if scaled[more] < 1 else large).append(more)
+    # Columns left on either list are full up to rounding error.
+    return AliasTable(
+        bins=histogram,
+        probabilities=tuple(probabilities),
+        aliases=tuple(aliases),
+    )
+
+
+def parse_profile_histogram(
+    distribution: str,
+    bins: object,
+) -> tuple[tuple[int, int, float], ...]:
+    """Parse {"N" or "MIN-MAX": weight} into sorted bins, dropping empty ones."""
+    if not isinstance(bins, dict):
+        raise ValueError(f"Profile {distribution!r} must map N or MIN-MAX to a weight.")
+    histogram = []
+    for key, weight in bins.items():
+        low, _, high = key.partition("-")
+        if not low.isdigit() or not (high or low).isdigit() or int(low) > int(high or low):
+            raise ValueError(f"Profile {distribution!r} has an invalid bin {key!r}.")
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight < 0:
+            raise ValueError(f"Profile {distribution!r} bin {key!r} needs a weight of 0 or more.")
+        if weight:
+            histogram.append((int(low), int(high or low), weight))
+    histogram.sort()
+    if not histogram:
+        raise ValueError(f"Profile {distribution!r} has no bin with a positive weight.")
+    for (_, previous_high, _), (low, _, _) in itertools.pairwise(histogram):
+        if low <= previous_high:
+            raise ValueError(f"Profile {distribution!r} has overlapping bins.")
+    return tuple(histogram)
+
+
+def load_profile(path: pathlib.Path) -> Profile:
+    """Load a JSON object of histograms keyed by `PROFILE_DISTRIBUTIONS`.
+
+    `name` defaults to the file name without its suffix.
+    """
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as exc:
+        raise ValueError(f"Could not read profile {path}: {exc}") from exc
+    if not isinstance(data, dict):
+        raise ValueError(f"Profile {path} must be a JSON object.")
+    unknown = sorted(set(data) - {"name", *PROFILE_DISTRIBUTIONS})
+    if unknown:
+        raise ValueError(f"Unknown profile keys: {', '.join(unknown)}.")
+    return Profile(
+        name=str(data.get("name", path.stem)),
+        **{
+            distribution: parse_profile_histogram(distribution, data[distribution])
+            for distribution in PROFILE_DISTRIBUTIONS
+            if distribution in data
+        },
+    )
+
+
+def add_kdf_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--kdf",
+        choices=KDF_NAMES,
+        help="Key derivation function. Defaults to pykeepass's Argon2d settings.",
+    )
+    parser.add_argument(
+        "--kdf-rounds",
+        type=positive_int,
+        help=(
+            "AES-KDF rounds or Argon2 iterations. Defaults to "
+            f"{DEFAULT_AES_KDF_ROUNDS} or {DEFAULT_ARGON2_ITERATIONS}."
+        ),
+    )
+    parser.add_argument(
+        "--kdf-memory",
+        type=positive_int,
+        metavar="MIB",
+        help=f"Argon2 memory in MiB. Defaults to {DEFAULT_ARGON2_MEMORY_MIB}.",
+    )
+    parser.add_argument(
+        "--kdf-parallelism",
+        type=positive_int,
+        help=f"Argon2 parallelism. Defaults to {DEFAULT_ARGON2_PARALLELISM}.",
+    )
+    parser.add_argument(
+        "--kdf-target-ms",
+        type=positive_int,
+        help=(
+            "Pick the --kdf parameters whose calibrated unlock time is closest to "
+            "this many milliseconds. Requires --kdf-calibration."
+        ),
+    )
+    parser.add_argument(
+        "--kdf-calibration",
+        help="Calibration table written by the calibrate subcommand.",
+    )
+
+
+def add_calibrate_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="Path to the output JSON table.",
+    )
+    parser.add_argument(
+        "--kdf",
+        nargs="+",
+        choices=KDF_NAMES,
+        default=list(KDF_NAMES),
+        help="Key derivation functions to measure. Defaults to all of them.",
+    )
+    parser.add_argument(
+        "--aes-rounds",
+        nargs="+",
+        type=positive_int,
+        default=list(CALIBRATION_AES_KDF_ROUNDS),
+        help="AES-KDF round counts to measure.",
+    )
+    parser.add_argument(
+        "--argon2-iterations",
+        nargs="+",
+        type=positive_int,
+        default=list(CALIBRATION_ARGON2_ITERATIONS),
+        help="Argon2 iteration counts to measure.",
+    )
+    parser.add_argument(
+        "--argon2-memory",
+        nargs="+",
+        type=positive_int,
+        metavar="MIB",
+        default=list(CALIBRATION_ARGON2_MEMORY_MIB),
+        help="Argon2 memory sizes to measure, in MiB.",
+    )
+    parser.add_argument(
+        "--argon2-parallelism",
+        nargs="+",
+        type=positive_int,
+        default=list(CALIBRATION_ARGON2_PARALLELISM),
+        help="Argon2 parallelism values to measure.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=positive_int,
+        default=3,
+        help="Measurements per parameter set; the median is reported. Defaults to 3.",
     )
+
+
+def add_generate_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "--preset",
         required=True,
@@ -81,63 +786,1052 @@ def parse_args() -> argparse.Namespace:
         type=int,
         help="Override the preset's deterministic seed.",
     )
+    parser.add_argument(
+        "--writer",
+        choices=WRITERS,
+        help=(
+            "How the database is written. stream writes KDBX 4 directly with flat "
+            "memory use and needs --scheme v2. Presets with attachments or oversized "
+            f"values need stream, which is their default. Others default to {DEFAULT_WRITER}."
+        ),
+    )
+    parser.add_argument(
+        "--scheme",
+        choices=GENERATION_SCHEMES,
+        help=(
+            "Generation scheme. v2 derives each entry from (seed, index) alone, so "
+            "entries can be rebuilt and spot-checked individually. The same seed "
+            "gives different content under each scheme. Defaults to v2 with the "
+            f"stream writer and to {DEFAULT_GENERATION_SCHEME} otherwise."
+        ),
+    )
+    parser.add_argument(
+        "--spot-check",
+        type=non_negative_int,
+        metavar="K",
+        help=(
+            "With --scheme v2, rebuild K sampled entries with entry_at() and compare "
+            f"them with the saved file. Defaults to {DEFAULT_SPOT_CHECK_ENTRIES}."
+        ),
+    )
     parser.add_argument(
         "--overwrite",
         action="store_true",
         help="Overwrite the output file if it already exists.",
     )
-    return parser.parse_args()
-
-
-def load_pykeepass():
-    try:
-        from pykeepass import PyKeePass, create_database
-    except ModuleNotFoundError as exc:
-        raise SystemExit(
-            "pykeepass is not installed. Install it with "
-            "`python3 -m pip install pykeepass`."
-        ) from exc
-
-    return PyKeePass, create_database
-
-
-def build_entry_types(preset: Preset, rng: random.Random) -> list[str]:
-    entry_types = (["login"] * preset.login_count) + (
-        ["secure_note"] * preset.secure_note_count
+    parser.add_argument(
+        "--entries",
+        type=positive_int,
+        help=(
+            "Override the preset's entry count. Login share and low-field target "
+            "are scaled to the new count."
+        ),
     )
-    rng.shuffle(entry_types)
-    return entry_types
-
-
-def build_title(preset: Preset, entry_type: str, index: int) -> str:
-    kind = "login" if entry_type == "login" else "note"
-    return f"{preset.name}-{kind}-{index:05d}"
-
-
-def build_username(rng: random.Random, index: int) -> str:
-    domains = (
-        "example.test",
-        "mail.test",
-        "acme.test",
-        "demo.test",
-        "internal.test",
+    parser.add_argument(
+        "--login-ratio",
+        type=ratio,
+        help="Override the share of login entries, from 0 to 1.",
     )
-    domain = domains[(index + rng.randrange(len(domains))) % len(domains)]
-    return f"user{index:05d}@{domain}"
-
-
-def build_password(rng: random.Random, index: int) -> str:
-    alphabet = "abcdefghijkmnopqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789"
-    prefix = "".join(rng.choice(alphabet) for _ in range(12))
-    suffix = f"{index:05d}"
-    return f"{prefix}!{suffix}"
-
-
-def build_notes(entry_type: str, index: int, rng: random.Random, force: bool) -> str | None:
-    if entry_type == "secure_note":
-        return (
-            f"Secure note payload for entry {index:05d}.\n"
-            f"Reference code: NOTE-{(index * 17) % 10000:04d}."
+    parser.add_argument(
+        "--custom-fields",
+        type=custom_field_range,
+        metavar="MIN:MAX[:LOW_TARGET]",
+        help=(
+            "Override the custom field count range. LOW_TARGET is the exact number "
+            f"of entries kept below the preset's low-field bound (or "
+            f"{DEFAULT_LOW_FIELD_UPPER_BOUND_EXCLUSIVE} fields); without it, "
+            "counts are uniform."
+        ),
+    )
+    parser.add_argument(
+        "--attachments",
+        type=non_negative_int,
+        help="Override the preset's total number of attachments.",
+    )
+    parser.add_argument(
+        "--attachment-duplicate-ratio",
+        type=ratio,
+        help="Share of attachments that reuse another attachment's content.",
+    )
+    parser.add_argument(
+        "--attachment-sizes",
+        type=byte_size_buckets,
+        metavar="MIN-MAX:WEIGHT[,...]",
+        help=(
+            "Attachment size buckets, for example 1KiB-64KiB:90,64KiB-2MiB:9,"
+            "64MiB-256MiB:1. The largest bucket is always used at least once."
+        ),
+    )
+    parser.add_argument(
+        "--oversized-values",
+        type=non_negative_int,
+        metavar="N",
+        help=(
+            "Override the number of oversized notes and custom field values, at most "
+            "one per entry."
+        ),
+    )
+    parser.add_argument(
+        "--oversized-value-sizes",
+        type=byte_size_buckets,
+        metavar="MIN-MAX:WEIGHT[,...]",
+        help=(
+            "Oversized value sizes in UTF-8 bytes, for example 1KiB-64KiB:80,"
+            "1MiB-32MiB:5. The largest bucket is always used at least once."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help=(
+            "JSON histograms of entries per group, custom fields per entry, custom "
+            "field value lengths, URIs per login, tags per entry and history depth. "
+            "Each one given replaces the preset's range."
+        ),
+    )
+    parser.add_argument(
+        "--custom-icons",
+        type=non_negative_int,
+        metavar="N",
+        help="Override the number of PNG custom icons.",
+    )
+    parser.add_argument(
+        "--custom-icon-ratio",
+        type=ratio,
+        metavar="RATIO",
+        help="Override the share of entries and groups that show a custom icon.",
+    )
+    parser.add_argument(
+        "--custom-icon-sizes",
+        type=custom_icon_size_buckets,
+        metavar="PX:WEIGHT[,...]",
+        help=(
+            "Custom icon edge lengths in pixels, for example 16:40,32:35,256:2. "
+            "The largest size is always used at least once."
+        ),
+    )
+    parser.add_argument(
+        "--history",
+        type=history_range,
+        metavar="N|MIN:MAX",
+        help=(
+            "Override the number of history revisions per entry. The first entry "
+            "always gets MAX revisions, before the --history-max-items cap."
+        ),
+    )
+    parser.add_argument(
+        "--history-max-items",
+        type=non_negative_int,
+        help=(
+            "Keep at most this many revisions per entry and write it as the "
+            f"database's HistoryMaxItems. Defaults to {DEFAULT_HISTORY_MAX_ITEMS}."
+        ),
+    )
+    parser.add_argument(
+        "--group-depth",
+        type=non_negative_int,
+        help="Override the depth of the subgroup tree below the preset group.",
+    )
+    parser.add_argument(
+        "--group-fanout",
+        type=non_negative_int,
+        help="Override the number of child groups of every non-leaf group.",
+    )
+    parser.add_argument(
+        "--tags",
+        type=non_negative_int,
+        metavar="N",
+        help="Override the size of the tag vocabulary. Every tag is used when N <= entries.",
+    )
+    parser.add_argument(
+        "--tags-per-entry",
+        type=non_negative_int,
+        metavar="MAX",
+        help="Override the maximum number of tags per entry.",
+    )
+    parser.add_argument(
+        "--tag-skew",
+        type=float,
+        metavar="S",
+        help="Override the Zipf exponent of tag popularity. 0 draws tags uniformly.",
+    )
+    parser.add_argument(
+        "--reused-passwords",
+        type=ratio,
+        metavar="RATIO",
+        help="Override the share of logins whose password is shared with other logins.",
+    )
+    parser.add_argument(
+        "--reuse-group-size",
+        type=positive_int,
+        help=(
+            "Override the number of logins sharing each reused password. Defaults to "
+            f"{DEFAULT_REUSE_GROUP_SIZE}."
+        ),
+    )
+    parser.add_argument(
+        "--weak-passwords",
+        type=ratio,
+        metavar="RATIO",
+        help="Override the share of logins with a low-entropy password.",
+    )
+    parser.add_argument(
+        "--tfa-domains",
+        type=ratio,
+        metavar="RATIO",
+        help="Override the share of logins with a URI on a TOTP domain from tfa.json.",
+    )
+    parser.add_argument(
+        "--passkey-domains",
+        type=ratio,
+        metavar="RATIO",
+        help="Override the share of logins with a URI on a domain from passkeys.json.",
+    )
+    parser.add_argument(
+        "--autofill-targets",
+        type=non_negative_int,
+        metavar="N",
+        help="Override the number of autofill target URLs and Android apps.",
+    )
+    parser.add_argument(
+        "--autofill-hits",
+        type=ratio,
+        metavar="RATIO",
+        help="Override the share of logins with a URL derived from an autofill target.",
+    )
+    parser.add_argument(
+        "--autofill-misses",
+        type=ratio,
+        metavar="RATIO",
+        help="Override the share of logins with a lookalike URL that matches no target.",
+    )
+    parser.add_argument(
+        "--bitwarden-json",
+        metavar="PATH",
+        help="Also write the vault as an unencrypted Bitwarden JSON export.",
+    )
+    parser.add_argument(
+        "--keepass-xml",
+        metavar="PATH",
+        help=(
+            "Also write the vault as an unencrypted KeePass 2 XML export. Attachments "
+            "are left out and group trees are not supported."
+        ),
+    )
+    parser.add_argument(
+        "--csv",
+        metavar="PATH",
+        help="Also write the vault as a Bitwarden-style CSV export.",
+    )
+    parser.add_argument(
+        "--raw-xml",
+        metavar="PATH",
+        help=(
+            "Also write the decrypted inner XML document of the vault to PATH, and "
+            "gzip-compressed to PATH.gz."
+        ),
+    )
+    parser.add_argument(
+        "--queries",
+        type=non_negative_int,
+        default=0,
+        metavar="N",
+        help=(
+            "Also write N search queries of each kind, with their expected hits, to "
+            "<output>.queries.json."
+        ),
+    )
+    parser.add_argument(
+        "--replicas",
+        action="store_true",
+        help=(
+            "Also write two replicas that diverged from the output, and the expected "
+            "merge result as <output>.merge.json."
+        ),
+    )
+    parser.add_argument(
+        "--replica-changes",
+        type=non_negative_int,
+        default=DEFAULT_REPLICA_CHANGES,
+        help=f"Entries changed on each replica. Defaults to {DEFAULT_REPLICA_CHANGES}.",
+    )
+    for conflict, description in (
+        ("edit", "edited on both replicas"),
+        ("delete", "deleted on one replica and edited on the other"),
+        ("move", "moved on one replica and edited on the other"),
+    ):
+        parser.add_argument(
+            f"--{conflict}-conflicts",
+            type=ratio,
+            default=DEFAULT_REPLICA_CONFLICT_RATIO,
+            metavar="RATIO",
+            help=(
+                f"Share of replica changes that are {description}. "
+                f"Defaults to {DEFAULT_REPLICA_CONFLICT_RATIO}."
+            ),
+        )
+    parser.add_argument(
+        "--matrix",
+        action="store_true",
+        help=(
+            "Also write the vault as every KDBX 3.1/4.0 format, cipher, compression "
+            "and protected-field share combination to <output>.matrix/, with file "
+            "sizes and save times in <output>.matrix.json."
+        ),
+    )
+    parser.add_argument(
+        "--matrix-protected",
+        type=ratio_list,
+        default=DEFAULT_MATRIX_PROTECTED_SHARES,
+        metavar="RATIOS",
+        help=(
+            "Comma-separated shares of string fields stored as protected values in "
+            "the matrix variants. Defaults to "
+            f"{','.join(f'{share:g}' for share in DEFAULT_MATRIX_PROTECTED_SHARES)}."
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=1,
+        help=(
+            "Number of processes that generate entry shards. The output does not "
+            "depend on this value. Defaults to 1."
+        ),
+    )
+    add_kdf_arguments(parser)
+    parser.add_argument(
+        "--cache-dir",
+        default=os.environ.get(CACHE_DIR_ENV),
+        help=(
+            "Reuse generated databases from this directory, keyed by everything "
+            f"that affects their content. Defaults to ${CACHE_DIR_ENV}; caching is "
+            "off when neither is set."
+        ),
+    )
+    parser.add_argument(
+        "--cache-max-mib",
+        type=positive_int,
+        default=DEFAULT_CACHE_MAX_MIB,
+        help=(
+            "Evict least recently used cache entries above this total size. "
+            f"Defaults to {DEFAULT_CACHE_MAX_MIB} MiB."
+        ),
+    )
+    parser.add_argument(
+        "--cache-link",
+        action="store_true",
+        help=(
+            "Hardlink cached databases instead of copying them. Do not modify the "
+            "output in place when using this."
+        ),
+    )
+    parser.add_argument(
+        "--report-json",
+        metavar="PATH",
+        help=(
+            "Write per-phase wall and CPU time, peak RSS, tracemalloc peak, "
+            "entries per second and output size to this JSON file. Tracing "
+            "allocations slows generation down."
+        ),
+    )
+    parser.add_argument(
+        "--max-rss",
+        type=positive_int,
+        metavar="MIB",
+        help="Fail when the peak resident set size of any process exceeds this budget.",
+    )
+
+
+def add_mutate_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--input",
+        required=True,
+        help="Generated database the snapshot series starts from.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        required=True,
+        help="Directory for the snapshots and their changes.json log.",
+    )
+    parser.add_argument(
+        "--password",
+        default=DEFAULT_PASSWORD,
+        help=f"Master password of the input database. Defaults to {DEFAULT_PASSWORD!r}.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed that picks the changed entries. Defaults to 0.",
+    )
+    parser.add_argument(
+        "--snapshots",
+        type=positive_int,
+        default=DEFAULT_SNAPSHOT_COUNT,
+        help=f"Number of snapshots to write. Defaults to {DEFAULT_SNAPSHOT_COUNT}.",
+    )
+    parser.add_argument(
+        "--edits",
+        type=non_negative_int,
+        default=DEFAULT_MUTATION_EDITS,
+        help=(
+            "Entries edited per snapshot. The previous version moves to the entry's "
+            f"history. Defaults to {DEFAULT_MUTATION_EDITS}."
+        ),
+    )
+    parser.add_argument(
+        "--additions",
+        type=non_negative_int,
+        default=DEFAULT_MUTATION_ADDITIONS,
+        help=f"Entries added per snapshot. Defaults to {DEFAULT_MUTATION_ADDITIONS}.",
+    )
+    parser.add_argument(
+        "--deletions",
+        type=non_negative_int,
+        default=DEFAULT_MUTATION_DELETIONS,
+        help=(
+            "Entries deleted per snapshot and recorded in DeletedObjects. "
+            f"Defaults to {DEFAULT_MUTATION_DELETIONS}."
+        ),
+    )
+    parser.add_argument(
+        "--moves",
+        type=non_negative_int,
+        default=DEFAULT_MUTATION_MOVES,
+        help=(
+            "Entries moved to another group per snapshot. "
+            f"Defaults to {DEFAULT_MUTATION_MOVES}."
+        ),
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Overwrite existing snapshots and change log.",
+    )
+
+
+def add_fleet_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--spec",
+        required=True,
+        help="JSON fleet spec. See scripts/keepass/README.md for its keys.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        required=True,
+        help=f"Directory for the vaults, their manifests and {FLEET_INDEX_NAME}.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=1,
+        help="Number of processes that generate vaults, one vault each. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Regenerate vaults that already exist.",
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help=(
+            f"Keep vaults whose spec, file and manifest match {FLEET_INDEX_NAME}, and "
+            "regenerate the rest."
+        ),
+    )
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Create deterministic KeePass test databases for Keyguard.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    add_generate_arguments(
+        subparsers.add_parser(
+            "generate",
+            help="Generate a test database. This is the default command.",
+        )
+    )
+    add_calibrate_arguments(
+        subparsers.add_parser(
+            "calibrate",
+            help="Measure local unlock time for a grid of KDF parameters.",
+        )
+    )
+    add_mutate_arguments(
+        subparsers.add_parser(
+            "mutate",
+            help="Write a series of edited snapshots of a generated database.",
+        )
+    )
+    add_fleet_arguments(
+        subparsers.add_parser(
+            "fleet",
+            help="Generate several vaults, each with its own seed, size and password.",
+        )
+    )
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in subparsers.choices and argv[0] not in ("-h", "--help"):
+        argv = ["generate", *argv]
+    return parser.parse_args(argv)
+
+
+def apply_preset_overrides(
+    preset: Preset,
+    entry_count: int | None = None,
+    login_ratio: float | None = None,
+    custom_fields: tuple[int, int, int | None] | None = None,
+    attachment_count: int | None = None,
+    attachment_duplicate_ratio: float | None = None,
+    attachment_sizes: tuple[tuple[int, int, int], ...] | None = None,
+    history: tuple[int, int] | None = None,
+    history_max_items: int | None = None,
+    group_depth: int | None = None,
+    group_fanout: int | None = None,
+    tag_vocabulary: int | None = None,
+    tags_per_entry_max: int | None = None,
+    tag_skew: float | None = None,
+    reused_password_ratio: float | None = None,
+    reuse_group_size: int | None = None,
+    weak_password_ratio: float | None = None,
+    tfa_domain_ratio: float | None = None,
+    passkey_domain_ratio: float | None = None,
+    autofill_target_count: int | None = None,
+    autofill_hit_ratio: float | None = None,
+    autofill_miss_ratio: float | None = None,
+    custom_icon_count: int | None = None,
+    custom_icon_ratio: float | None = None,
+    custom_icon_sizes: tuple[tuple[int, int], ...] | None = None,
+    oversized_value_count: int | None = None,
+    oversized_value_sizes: tuple[tuple[int, int, int], ...] | None = None,
+    profile: Profile | None = None,
+) -> Preset:
+    if profile is None:
+        profile = preset.profile
+    elif (
+        profile.custom_fields and custom_fields is not None or
+        profile.history and history is not None or
+        profile.tags and tags_per_entry_max is not None
+    ):
+        raise ValueError(
+            "The profile's histograms replace --custom-fields, --history and "
+            "--tags-per-entry; pass one or the other."
+        )
+
+    if entry_count is None:
+        entry_count = preset.entry_count
+    if login_ratio is None:
+        login_ratio = preset.login_count / preset.entry_count
+    login_count = round(entry_count * login_ratio)
+
+    custom_field_min = preset.custom_field_min
+    custom_field_max = preset.custom_field_max
+    low_field_target_count = preset.low_field_target_count
+    low_field_upper_bound_exclusive = preset.low_field_upper_bound_exclusive
+    if custom_fields is not None:
+        custom_field_min, custom_field_max, low_field_target_count = custom_fields
+        if low_field_target_count is None:
+            low_field_upper_bound_exclusive = None
+        elif low_field_upper_bound_exclusive is None:
+            low_field_upper_bound_exclusive = DEFAULT_LOW_FIELD_UPPER_BOUND_EXCLUSIVE
+    elif profile is not None and profile.custom_fields:
+        custom_field_min = profile.custom_fields[0][0]
+        custom_field_max = profile.custom_fields[-1][1]
+        low_field_target_count = None
+        low_field_upper_bound_exclusive = None
+    elif low_field_target_count is not None:
+        # Leave at least one entry for the forced wide entry above the bound.
+        low_field_target_count = min(
+            round(low_field_target_count * entry_count / preset.entry_count),
+            entry_count - 1,
+        )
+
+    if low_field_target_count is not None:
+        if low_field_target_count > entry_count:
+            raise ValueError(
+                f"Low-field target {low_field_target_count} exceeds {entry_count} entries."
+            )
+        if not (custom_field_min < low_field_upper_bound_exclusive <= custom_field_max):
+            raise ValueError(
+                f"Custom field range {custom_field_min}:{custom_field_max} must straddle "
+                f"the low-field bound {low_field_upper_bound_exclusive}."
+            )
+
+    if attachment_count is None:
+        attachment_count = preset.attachment_count
+    if attachment_duplicate_ratio is None:
+        attachment_duplicate_ratio = preset.attachment_duplicate_ratio
+    if attachment_sizes is None:
+        attachment_sizes = preset.attachment_size_buckets or DEFAULT_ATTACHMENT_SIZE_BUCKETS
+    if attachment_count == 0:
+        attachment_duplicate_ratio = 0.0
+        attachment_sizes = ()
+
+    history_min, history_max = history or (preset.history_min, preset.history_max)
+    if history_max_items is None:
+        history_max_items = preset.history_max_items
+        if profile is not None and profile.history:
+            # Keep the default cap from clipping the profile's deepest bin.
+            history_max_items = max(history_max_items, profile.history[-1][1])
+    if profile is not None and profile.history:
+        history_min, history_max = profile.history[0][0], profile.history[-1][1]
+
+    if group_depth is None:
+        group_depth = preset.group_depth
+    if group_fanout is None:
+        group_fanout = preset.group_fanout
+    group_count = count_groups(group_depth, group_fanout)
+    if group_count > MAX_GROUP_COUNT:
+        raise ValueError(
+            f"Depth {group_depth} with fan-out {group_fanout} gives {group_count} groups; "
+            f"the limit is {MAX_GROUP_COUNT}."
+        )
+
+    if tag_vocabulary is None:
+        tag_vocabulary = preset.tag_vocabulary
+    if tags_per_entry_max is None:
+        tags_per_entry_max = preset.tags_per_entry_max
+    if tag_skew is None:
+        tag_skew = preset.tag_skew
+    if tag_skew < 0:
+        raise ValueError(f"Tag skew must not be negative, got {tag_skew}.")
+    if profile is not None and profile.tags:
+        tags_per_entry_max = profile.tags[-1][1]
+        if tag_vocabulary < tags_per_entry_max:
+            raise ValueError(
+                f"The profile draws up to {tags_per_entry_max} tags per entry; pass "
+                f"--tags with a vocabulary of at least that many."
+            )
+    if tag_vocabulary and not tags_per_entry_max:
+        tags_per_entry_max = 1
+    tags_per_entry_max = min(tags_per_entry_max, tag_vocabulary)
+
+    if reused_password_ratio is None:
+        reused_password_ratio = preset.reused_password_ratio
+    if reuse_group_size is None:
+        reuse_group_size = preset.reuse_group_size
+    if weak_password_ratio is None:
+        weak_password_ratio = preset.weak_password_ratio
+    if tfa_domain_ratio is None:
+        tfa_domain_ratio = preset.tfa_domain_ratio
+    if passkey_domain_ratio is None:
+        passkey_domain_ratio = preset.passkey_domain_ratio
+    if reused_password_ratio + weak_password_ratio > 1:
+        raise ValueError("Reused and weak password ratios must add up to at most 1.")
+    if tfa_domain_ratio + passkey_domain_ratio > 1:
+        raise ValueError("2FA and passkey domain ratios must add up to at most 1.")
+    if reuse_group_size < 2:
+        raise ValueError("Reused passwords need groups of at least 2 logins.")
+
+    if autofill_target_count is None:
+        autofill_target_count = preset.autofill_target_count
+    if autofill_hit_ratio is None:
+        autofill_hit_ratio = preset.autofill_hit_ratio
+    if autofill_miss_ratio is None:
+        autofill_miss_ratio = preset.autofill_miss_ratio
+    if autofill_hit_ratio + autofill_miss_ratio > 1:
+        raise ValueError("Autofill hit and miss ratios must add up to at most 1.")
+    if (autofill_hit_ratio or autofill_miss_ratio) and not autofill_target_count:
+        raise ValueError("Autofill hits and misses need at least one target.")
+    if autofill_hit_ratio + autofill_miss_ratio and tfa_domain_ratio + passkey_domain_ratio:
+        # Both rewrite the login URL.
+        raise ValueError("Autofill targets cannot be combined with 2FA or passkey domains.")
+
+    if custom_icon_count is None:
+        custom_icon_count = preset.custom_icon_count
+    if custom_icon_ratio is None:
+        custom_icon_ratio = preset.custom_icon_ratio
+    if custom_icon_sizes is None:
+        custom_icon_sizes = preset.custom_icon_size_buckets or DEFAULT_CUSTOM_ICON_SIZE_BUCKETS
+    if custom_icon_count == 0:
+        custom_icon_ratio = 0.0
+        custom_icon_sizes = ()
+
+    if oversized_value_count is None:
+        oversized_value_count = preset.oversized_value_count
+    if oversized_value_sizes is None:
+        oversized_value_sizes = (
+            preset.oversized_value_size_buckets or DEFAULT_OVERSIZED_VALUE_SIZE_BUCKETS
+        )
+    if oversized_value_count > entry_count:
+        raise ValueError(
+            f"{oversized_value_count} oversized values do not fit {entry_count} entries, "
+            "at most one per entry."
+        )
+    if oversized_value_count == 0:
+        oversized_value_sizes = ()
+
+    return replace(
+        preset,
+        entry_count=entry_count,
+        login_count=login_count,
+        secure_note_count=entry_count - login_count,
+        custom_field_min=custom_field_min,
+        custom_field_max=custom_field_max,
+        low_field_target_count=low_field_target_count,
+        low_field_upper_bound_exclusive=low_field_upper_bound_exclusive,
+        attachment_count=attachment_count,
+        attachment_duplicate_ratio=attachment_duplicate_ratio,
+        attachment_size_buckets=attachment_sizes,
+        history_min=history_min,
+        history_max=history_max,
+        history_max_items=history_max_items,
+        group_depth=group_depth,
+        group_fanout=group_fanout,
+        tag_vocabulary=tag_vocabulary,
+        tags_per_entry_max=tags_per_entry_max,
+        tag_skew=tag_skew,
+        reused_password_ratio=reused_password_ratio,
+        reuse_group_size=reuse_group_size,
+        weak_password_ratio=weak_password_ratio,
+        tfa_domain_ratio=tfa_domain_ratio,
+        passkey_domain_ratio=passkey_domain_ratio,
+        autofill_target_count=autofill_target_count,
+        autofill_hit_ratio=autofill_hit_ratio,
+        autofill_miss_ratio=autofill_miss_ratio,
+        custom_icon_count=custom_icon_count,
+        custom_icon_ratio=custom_icon_ratio,
+        custom_icon_size_buckets=custom_icon_sizes,
+        oversized_value_count=oversized_value_count,
+        oversized_value_size_buckets=oversized_value_sizes,
+        profile=profile,
+    )
+
+
+def build_kdf_settings(
+    kdf: str,
+    rounds: int | None = None,
+    memory_mib: int | None = None,
+    parallelism: int | None = None,
+) -> KdfSettings:
+    if kdf == "aeskdf":
+        if memory_mib is not None or parallelism is not None:
+            raise ValueError("AES-KDF has no memory or parallelism parameters.")
+        return KdfSettings(
+            kdf=kdf,
+            rounds=DEFAULT_AES_KDF_ROUNDS if rounds is None else rounds,
+        )
+
+    return KdfSettings(
+        kdf=kdf,
+        rounds=DEFAULT_ARGON2_ITERATIONS if rounds is None else rounds,
+        memory_mib=DEFAULT_ARGON2_MEMORY_MIB if memory_mib is None else memory_mib,
+        parallelism=DEFAULT_ARGON2_PARALLELISM if parallelism is None else parallelism,
+    )
+
+
+def build_kdf_parameters(kdf: KdfSettings, salt: bytes) -> dict:
+    return kdbx_stream.build_kdf_parameters(
+        kdf=kdf.kdf,
+        rounds=kdf.rounds,
+        memory_kib=kdf.memory_mib * 1024,
+        parallelism=kdf.parallelism,
+        salt=salt,
+    )
+
+
+def measure_unlock_seconds(kdf: KdfSettings, repeat: int) -> list[float]:
+    composite_key = kdbx_stream.compute_composite_key(DEFAULT_PASSWORD)
+    samples = []
+    for _ in range(repeat):
+        parameters = build_kdf_parameters(kdf, salt=os.urandom(32))
+        started = time.perf_counter()
+        kdbx_stream.transform_key(parameters, composite_key)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def build_calibration_grid(
+    kdfs: Sequence[str],
+    aes_rounds: Sequence[int],
+    argon2_iterations: Sequence[int],
+    argon2_memory_mib: Sequence[int],
+    argon2_parallelism: Sequence[int],
+) -> list[KdfSettings]:
+    grid = []
+    for kdf in kdfs:
+        if kdf == "aeskdf":
+            grid.extend(KdfSettings(kdf=kdf, rounds=rounds) for rounds in aes_rounds)
+            continue
+        grid.extend(
+            KdfSettings(
+                kdf=kdf,
+                rounds=iterations,
+                memory_mib=memory_mib,
+                parallelism=parallelism,
+            )
+            for iterations, memory_mib, parallelism in itertools.product(
+                argon2_iterations,
+                argon2_memory_mib,
+                argon2_parallelism,
+            )
+        )
+    return grid
+
+
+def calibrate(grid: Sequence[KdfSettings], repeat: int) -> dict:
+    """Time the key derivation that dominates unlocking, per parameter set."""
+    results = []
+    for kdf in grid:
+        samples = measure_unlock_seconds(kdf, repeat=repeat)
+        results.append(
+            {
+                **asdict(kdf),
+                "unlock_ms": round(statistics.median(samples) * 1000, 3),
+                "samples_ms": [round(sample * 1000, 3) for sample in samples],
+            }
+        )
+    return {
+        "version": CALIBRATION_TABLE_VERSION,
+        "host": {
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+
+
+def pick_calibrated_kdf(table: dict, kdf: str, target_ms: float) -> KdfSettings:
+    if table.get("version") != CALIBRATION_TABLE_VERSION:
+        raise ValueError(f"Unsupported calibration table version {table.get('version')!r}.")
+    candidates = [row for row in table["results"] if row["kdf"] == kdf]
+    if not candidates:
+        raise ValueError(f"Calibration table has no {kdf} measurements.")
+
+    closest = min(candidates, key=lambda row: abs(row["unlock_ms"] - target_ms))
+    return KdfSettings(
+        kdf=closest["kdf"],
+        rounds=closest["rounds"],
+        memory_mib=closest["memory_mib"],
+        parallelism=closest["parallelism"],
+    )
+
+
+def resolve_kdf_settings(args: argparse.Namespace) -> KdfSettings | None:
+    if args.kdf_target_ms is not None:
+        if args.kdf is None or args.kdf_calibration is None:
+            raise ValueError("--kdf-target-ms requires --kdf and --kdf-calibration.")
+        table = json.loads(pathlib.Path(args.kdf_calibration).read_text(encoding="utf-8"))
+        return pick_calibrated_kdf(table, kdf=args.kdf, target_ms=args.kdf_target_ms)
+
+    if args.kdf is None:
+        if (args.kdf_rounds, args.kdf_memory, args.kdf_parallelism) != (None, None, None):
+            raise ValueError("KDF parameter flags require --kdf.")
+        return None
+
+    return build_kdf_settings(
+        kdf=args.kdf,
+        rounds=args.kdf_rounds,
+        memory_mib=args.kdf_memory,
+        parallelism=args.kdf_parallelism,
+    )
+
+
+def get_cpu_seconds() -> float:
+    """Return CPU time used by this process and its reaped worker processes.
+
+    Worker processes only count once they have been reaped, so their CPU
+    time lands in the phase that shuts their pool down rather than spread
+    over the phases they worked in.
+    """
+    cpu_seconds = time.process_time()
+    try:
+        import resource
+    except ImportError:
+        return cpu_seconds
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return cpu_seconds + children.ru_utime + children.ru_stime
+
+
+def get_peak_rss_bytes() -> tuple[int, int] | None:
+    """Return the peak RSS of this process and of its largest worker process."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kibibytes on Linux and in bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    )
+
+
+@dataclass
+class GenerationReport:
+    phases: dict[str, dict[str, float]] = field(default_factory=dict)
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        wall_started = time.perf_counter()
+        cpu_started = get_cpu_seconds()
+        try:
+            yield
+        finally:
+            timing = self.phases.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+            timing["wall_seconds"] += time.perf_counter() - wall_started
+            timing["cpu_seconds"] += get_cpu_seconds() - cpu_started
+            if tracing:
+                timing["tracemalloc_peak_bytes"] = max(
+                    timing.get("tracemalloc_peak_bytes", 0),
+                    tracemalloc.get_traced_memory()[1],
+                )
+
+    def add_nested(self, parent: str | None, timings: dict[str, dict[str, float]]) -> None:
+        """Add `timings` as phases of their own and take them out of `parent`."""
+        for name, timing in timings.items():
+            total = self.phases.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+            for key in ("wall_seconds", "cpu_seconds"):
+                total[key] += timing[key]
+                if parent is not None:
+                    self.phases[parent][key] -= timing[key]
+
+
+def load_pykeepass():
+    try:
+        from pykeepass import PyKeePass
+    except ModuleNotFoundError as exc:
+        raise SystemExit(
+            "pykeepass is not installed. Install it with "
+            "`python3 -m pip install pykeepass`."
+        ) from exc
+
+    return PyKeePass
+
+
+def open_blank_database(path: pathlib.Path, password: str):
+    PyKeePass = load_pykeepass()
+    from pykeepass.pykeepass import BLANK_DATABASE_LOCATION
+    from pykeepass.pykeepass import BLANK_DATABASE_PASSWORD
+
+    # This is `pykeepass.create_database` without its initial save, which
+    # would run the KDF once more for a database that is about to be replaced.
+    kp = PyKeePass(BLANK_DATABASE_LOCATION, BLANK_DATABASE_PASSWORD)
+    kp.filename = str(path)
+    kp.password = password
+    kp.keyfile = None
+    return kp
+
+
+def open_database(path: pathlib.Path, password: str):
+    """Open an existing vault with pykeepass, oversized values included.
+
+    pykeepass parses the payload with lxml's default parser, which rejects
+    text nodes above 10 MB, so its XML adapter gets a `huge_tree` parser for
+    the duration of the load.
+    """
+    PyKeePass = load_pykeepass()
+    from lxml import etree
+    from pykeepass.kdbx_parsing.common import XML
+
+    def decode(adapter, data, con, path):
+        parser = etree.XMLParser(remove_blank_text=True, huge_tree=True)
+        return etree.parse(io.BytesIO(data), parser)
+
+    original_decode = XML._decode  # noqa: SLF001
+    XML._decode = decode  # noqa: SLF001
+    try:
+        return PyKeePass(str(path), password=password)
+    finally:
+        XML._decode = original_decode  # noqa: SLF001
+
+
+def set_kdf_parameters(kp, parameters: dict) -> None:
+    from construct import Container
+
+    keys = list(parameters)
+    items = Container()
+    for position, key in enumerate(keys):
+        value_type = kdbx_stream.KDF_PARAMETER_TYPES[key]
+        next_key = keys[position + 1] if position + 1 < len(keys) else None
+        items[key] = Container(
+            type=value_type,
+            key=key,
+            value=parameters[key],
+            # pykeepass stops building the dictionary at the item whose
+            # look-ahead byte is the 0x00 terminator.
+            next_byte=0 if next_key is None else kdbx_stream.KDF_PARAMETER_TYPES[next_key],
+        )
+    kp.kdbx.header.value.dynamic_header.kdf_parameters.data.dict = items
+
+
+def save_database(
+    kp,
+    password: str,
+    kdf: KdfSettings | None,
+    report: GenerationReport | None = None,
+) -> bytes:
+    """Save `kp` with a fresh KDF salt and return the file's transformed key.
+
+    The key is derived here, once, and handed to both pykeepass and the
+    validator, so neither of them runs the KDF again.
+    """
+    report = report or GenerationReport()
+    salt = os.urandom(32)
+    if kdf is None:
+        current = kp.kdbx.header.value.dynamic_header.kdf_parameters.data.dict
+        parameters = {key: item.value for key, item in current.items()}
+        parameters["S"] = salt
+    else:
+        parameters = build_kdf_parameters(kdf, salt=salt)
+    set_kdf_parameters(kp, parameters)
+
+    with report.phase("kdf"):
+        transformed_key = kdbx_stream.transform_key(
+            parameters,
+            kdbx_stream.compute_composite_key(password),
+        )
+    # pykeepass serializes, compresses and encrypts the payload in one pass.
+    with report.phase("save"):
+        kp.save(transformed_key=transformed_key)
+    return transformed_key
+
+
+def build_entry_types(preset: Preset, rng: random.Random) -> array.array:
+    """Return one `ENTRY_TYPES` code per entry, one byte each."""
+    entry_types = array.array("B", [LOGIN_CODE]) * preset.login_count
+    entry_types.extend(array.array("B", [SECURE_NOTE_CODE]) * preset.secure_note_count)
+    rng.shuffle(entry_types)
+    return entry_types
+
+
+def build_title(preset: Preset, entry_type: str, index: int) -> str:
+    kind = "login" if entry_type == "login" else "note"
+    return f"{preset.name}-{kind}-{index:05d}"
+
+
+def build_username(rng: random.Random, index: int) -> str:
+    domains = (
+        "example.test",
+        "mail.test",
+        "acme.test",
+        "demo.test",
+        "internal.test",
+    )
+    domain = domains[(index + rng.randrange(len(domains))) % len(domains)]
+    return f"user{index:05d}@{domain}"
+
+
+def build_password(rng: random.Random, index: int) -> str:
+    alphabet = "abcdefghijkmnopqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+    prefix = "".join(rng.choice(alphabet) for _ in range(12))
+    suffix = f"{index:05d}"
+    return f"{prefix}!{suffix}"
+
+
+def build_notes(entry_type: str, index: int, rng: random.Random, force: bool) -> str | None:
+    if entry_type == "secure_note":
+        return (
+            f"Secure note payload for entry {index:05d}.\n"
+            f"Reference code: NOTE-{(index * 17) % 10000:04d}."
         )
 
     if force or rng.random() < 0.35:
@@ -146,401 +1840,4706 @@ def build_notes(entry_type: str, index: int, rng: random.Random, force: bool) ->
             f"Generated hint: recovery-{(index * 19) % 1000:03d}."
         )
 
-    return None
+    return None
+
+
+def sample_profile(preset: Preset, distribution: str, rng: random.Random) -> int | None:
+    """Draw from the preset profile's `distribution`, or return None when the
+    preset has no such histogram."""
+    if preset.profile is None or distribution not in preset.profile.alias_tables:
+        return None
+    return preset.profile.alias_tables[distribution].sample(rng)
+
+
+def get_uri_count_max(preset: Preset) -> int:
+    if preset.profile is not None and preset.profile.uris:
+        return preset.profile.uris[-1][1]
+    return DEFAULT_URI_COUNT_MAX
+
+
+def build_uri_count(preset: Preset, rng: random.Random, force_max: bool) -> int:
+    if force_max:
+        return get_uri_count_max(preset)
+    uri_count = sample_profile(preset, "uris", rng)
+    return rng.randint(0, DEFAULT_URI_COUNT_MAX) if uri_count is None else uri_count
+
+
+def build_uri(index: int, ordinal: int, rng: random.Random) -> str:
+    hosts = (
+        "vault.example.test",
+        "accounts.demo.test",
+        "services.acme.test",
+        "portal.internal.test",
+        "login.mail.test",
+    )
+    host = hosts[(index + ordinal + rng.randrange(len(hosts))) % len(hosts)]
+    path = f"/app/{index % 97}/{ordinal}"
+    query = f"?view={(index + ordinal) % 11}"
+    return f"https://{host}{path}{query}"
+
+
+def build_custom_field_count(preset: Preset, rng: random.Random) -> int:
+    custom_field_count = sample_profile(preset, "custom_fields", rng)
+    if custom_field_count is None:
+        return rng.randint(preset.custom_field_min, preset.custom_field_max)
+    return custom_field_count
+
+
+def build_custom_field_counts(preset: Preset, rng: random.Random) -> array.array:
+    if preset.low_field_target_count is None:
+        counts = array.array(
+            "I",
+            (build_custom_field_count(preset, rng) for _ in range(preset.entry_count)),
+        )
+        counts[0] = preset.custom_field_max
+        return counts
+
+    low_field_upper_bound_exclusive = preset.low_field_upper_bound_exclusive
+    if low_field_upper_bound_exclusive is None:
+        raise ValueError("Preset is missing low-field bounds.")
+
+    counts = array.array(
+        "I",
+        (
+            rng.randint(preset.custom_field_min, low_field_upper_bound_exclusive - 1)
+            for _ in range(preset.low_field_target_count)
+        ),
+    )
+    high_start = len(counts)
+    counts.extend(
+        rng.randint(low_field_upper_bound_exclusive, preset.custom_field_max)
+        for _ in range(preset.entry_count - preset.low_field_target_count)
+    )
+    if high_start < len(counts):
+        counts[high_start] = min(321, preset.custom_field_max)
+
+    rng.shuffle(counts)
+    return counts
+
+
+def build_custom_field_value(
+    index: int,
+    field_index: int,
+    rng: random.Random,
+    length: int | None = None,
+) -> str:
+    words = (
+        "alpha",
+        "bravo",
+        "charlie",
+        "delta",
+        "echo",
+        "foxtrot",
+        "gamma",
+        "hotel",
+    )
+    word = words[(index + field_index + rng.randrange(len(words))) % len(words)]
+    value = f"{word}-{index:05d}-{field_index:03d}"
+    if length is None:
+        return value
+    return " ".join(itertools.repeat(value, length // len(value) + 1))[:length]
+
+
+def encode_kdbx_time(timestamp: datetime) -> str:
+    seconds = int((timestamp - KDBX_EPOCH).total_seconds())
+    return base64.b64encode(struct.pack("<Q", seconds)).decode("ascii")
+
+
+def decode_kdbx_time(text: str) -> int:
+    """Return a KDBX4 timestamp as seconds since the KDBX epoch."""
+    (seconds,) = struct.unpack("<Q", base64.b64decode(text))
+    return seconds
+
+
+def encode_kdbx_uuid(value: uuid.UUID) -> str:
+    return base64.b64encode(value.bytes).decode("ascii")
+
+
+def append_string_field(element, key: str, value: str, protected: bool | None = None) -> None:
+    from lxml.builder import E
+
+    if protected is None:
+        element.append(E.String(E.Key(key), E.Value(value)))
+        return
+
+    element.append(E.String(E.Key(key), E.Value(value, Protected=str(protected))))
+
+
+def build_times_element(timestamp: datetime):
+    from lxml.builder import E
+
+    encoded = encode_kdbx_time(timestamp)
+    return E.Times(
+        E.CreationTime(encoded),
+        E.LastModificationTime(encoded),
+        E.LastAccessTime(encoded),
+        E.ExpiryTime(encoded),
+        E.Expires("False"),
+        E.UsageCount("0"),
+        E.LocationChanged(encoded),
+    )
+
+
+def build_auto_type_element():
+    from lxml.builder import E
+
+    return E.AutoType(
+        E.Enabled("True"),
+        E.DataTransferObfuscation("0"),
+        E.DefaultSequence(""),
+        E.Association(E.Window(""), E.KeystrokeSequence("")),
+    )
+
+
+def apply_stable_metadata(element, stable_uuid: uuid.UUID, timestamp: datetime) -> None:
+    element.uuid = stable_uuid
+    element.ctime = timestamp
+    element.mtime = timestamp
+    element.atime = timestamp
+    element.expiry_time = timestamp
+    element._set_times_property("LocationChanged", timestamp)  # noqa: SLF001
+
+
+def add_entry_type_marker(entry, entry_type: str) -> None:
+    value = "Login" if entry_type == "login" else "Note"
+    append_string_field(entry, KEYGUARD_ENTRY_TYPE_KEY, value)
+
+
+def add_uris(entry, uri_count: int, index: int, rng: random.Random) -> None:
+    if uri_count <= 0:
+        return
+
+    append_string_field(entry, "URL", build_uri(index=index, ordinal=0, rng=rng))
+    for ordinal in range(1, uri_count):
+        append_string_field(
+            entry,
+            f"{URI_FIELD_PREFIX}{ordinal}",
+            build_uri(index=index, ordinal=ordinal, rng=rng),
+        )
+
+
+def add_custom_fields(
+    entry,
+    preset: Preset,
+    custom_field_count: int,
+    index: int,
+    rng: random.Random,
+) -> None:
+    for field_index in range(custom_field_count):
+        key = f"field_{field_index:03d}"
+        value = build_custom_field_value(
+            index=index,
+            field_index=field_index,
+            rng=rng,
+            length=sample_profile(preset, "value_length", rng),
+        )
+        append_string_field(entry, key, value)
+
+
+def build_group_uuid(preset: Preset, node: int = 0) -> uuid.UUID:
+    if node == 0:
+        return uuid.uuid5(uuid.NAMESPACE_URL, f"keyguard/{preset.name}/group")
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"keyguard/{preset.name}/group/{node}")
+
+
+def count_groups(depth: int, fanout: int) -> int:
+    """Return the number of groups below the preset group."""
+    return sum(fanout ** level for level in range(1, depth + 1)) if fanout else 0
+
+
+def has_profile_groups(preset: Preset) -> bool:
+    return preset.profile is not None and bool(preset.profile.entries_per_group)
+
+
+@functools.lru_cache(maxsize=8)
+def build_group_offsets(preset: Preset, seed: int) -> tuple[int, ...]:
+    """Return the first entry index of each node, then the entry count, for a
+    preset whose profile sizes its groups.
+
+    Every node draws a size from the profile; the sizes are then scaled to the
+    preset's entry count, largest remainders first, and laid out in node order.
+    """
+    rng = random.Random(derive_seed(seed, "profile", "groups"))
+    node_count = count_groups(preset.group_depth, preset.group_fanout) + 1
+    sizes = [sample_profile(preset, "entries_per_group", rng) for _ in range(node_count)]
+    if not any(sizes):
+        sizes = [1] * node_count
+    shares = [size * preset.entry_count / sum(sizes) for size in sizes]
+    scaled = [int(share) for share in shares]
+    by_remainder = sorted(
+        range(node_count),
+        key=lambda node: shares[node] - scaled[node],
+        reverse=True,
+    )
+    for node in by_remainder[:preset.entry_count - sum(scaled)]:
+        scaled[node] += 1
+    return (0, *itertools.accumulate(scaled))
+
+
+def get_group_entries(preset: Preset, seed: int, node: int) -> range:
+    """Return the indexes of the entries in tree node `node`.
+
+    Nodes are numbered breadth first with the preset group as node 0, so the
+    children of node n are n * fanout + 1 .. n * fanout + fanout. Entries are
+    dealt round robin over the nodes unless the profile sizes the groups.
+    """
+    if has_profile_groups(preset):
+        offsets = build_group_offsets(preset, seed)
+        return range(offsets[node], offsets[node + 1])
+    step = count_groups(preset.group_depth, preset.group_fanout) + 1
+    return range(node, preset.entry_count, step)
+
+
+def get_entry_group(preset: Preset, seed: int, index: int) -> int:
+    """Return the tree node holding entry `index`."""
+    if has_profile_groups(preset):
+        return bisect.bisect_right(build_group_offsets(preset, seed), index) - 1
+    return index % (count_groups(preset.group_depth, preset.group_fanout) + 1)
+
+
+def build_group_element(preset: Preset, node: int):
+    from lxml.builder import E
+
+    return E.Group(
+        E.UUID(encode_kdbx_uuid(build_group_uuid(preset, node))),
+        build_times_element(build_timestamp(0)),
+        E.Name(preset.name if node == 0 else f"group-{node:06d}"),
+    )
+
+
+def get_child_groups(preset: Preset, node: int) -> range:
+    first = node * preset.group_fanout + 1
+    if first > count_groups(preset.group_depth, preset.group_fanout):
+        return range(0)
+    return range(first, first + preset.group_fanout)
+
+
+def iter_group_nodes(preset: Preset, node: int = 0) -> Iterator[int]:
+    """Yield the tree's nodes depth first, in the order KeePass XML lists them."""
+    yield node
+    for child in get_child_groups(preset, node):
+        yield from iter_group_nodes(preset, child)
+
+
+def build_tag(ordinal: int) -> str:
+    return f"tag-{ordinal:05d}"
+
+
+@functools.lru_cache(maxsize=8)
+def build_tag_cum_weights(vocabulary: int, skew: float) -> tuple[float, ...]:
+    return tuple(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(vocabulary)))
+
+
+def add_tags(entry, preset: Preset, index: int, rng: random.Random) -> None:
+    if not preset.tag_vocabulary:
+        return
+    from lxml.builder import E
+
+    ordinals = set()
+    tag_count = sample_profile(preset, "tags", rng)
+    if tag_count is None:
+        tag_count = rng.randint(0, preset.tags_per_entry_max)
+    if index < preset.tag_vocabulary:
+        # The first entries introduce the vocabulary in order, so every tag
+        # is used once the vault has at least as many entries as tags.
+        ordinals.add(index)
+        tag_count = max(tag_count, 1)
+    cum_weights = build_tag_cum_weights(preset.tag_vocabulary, preset.tag_skew)
+    population = range(preset.tag_vocabulary)
+    while len(ordinals) < tag_count:
+        ordinals.add(rng.choices(population, cum_weights=cum_weights)[0])
+    if ordinals:
+        entry.append(E.Tags(";".join(build_tag(ordinal) for ordinal in sorted(ordinals))))
+
+
+def build_entry_uuid(preset: Preset, entry_type: str, index: int) -> uuid.UUID:
+    return uuid.uuid5(
+        uuid.NAMESPACE_URL,
+        f"keyguard/{preset.name}/{entry_type}/{index}",
+    )
+
+
+def build_timestamp(index: int) -> datetime:
+    return BASE_TIME + timedelta(minutes=index)
+
+
+def build_entry_element(
+    preset: Preset,
+    entry_type: str,
+    index: int,
+    custom_field_count: int,
+    force_login_profile: bool,
+    rng: random.Random,
+    attachments: Sequence[tuple[int, int]] = (),
+):
+    from lxml.builder import E
+
+    notes = build_notes(
+        entry_type=entry_type,
+        index=index,
+        rng=rng,
+        force=index == 0 or force_login_profile,
+    )
+    entry = E.Entry(
+        E.UUID(
+            encode_kdbx_uuid(
+                build_entry_uuid(preset=preset, entry_type=entry_type, index=index),
+            ),
+        ),
+        build_times_element(build_timestamp(index + 1)),
+    )
+    append_string_field(
+        entry,
+        "Title",
+        build_title(preset=preset, entry_type=entry_type, index=index),
+    )
+
+    if entry_type == "login":
+        append_string_field(entry, "UserName", build_username(rng=rng, index=index))
+        append_string_field(
+            entry,
+            "Password",
+            build_password(rng=rng, index=index),
+            protected=True,
+        )
+        if notes:
+            append_string_field(entry, "Notes", notes)
+        add_uris(
+            entry=entry,
+            uri_count=build_uri_count(preset, rng=rng, force_max=force_login_profile),
+            index=index,
+            rng=rng,
+        )
+    elif notes:
+        append_string_field(entry, "Notes", notes)
+
+    add_entry_type_marker(entry, entry_type=entry_type)
+    add_custom_fields(
+        entry=entry,
+        preset=preset,
+        custom_field_count=custom_field_count,
+        index=index,
+        rng=rng,
+    )
+    add_tags(entry, preset=preset, index=index, rng=rng)
+    add_attachments(entry, attachments)
+    entry.append(build_auto_type_element())
+    return entry
+
+
+def count_history_revisions(preset: Preset, index: int, rng: random.Random) -> int:
+    if index == 0:
+        # The first entry always fills its history up to the cap.
+        revision_count = preset.history_max
+    else:
+        revision_count = sample_profile(preset, "history", rng)
+        if revision_count is None:
+            revision_count = rng.randint(preset.history_min, preset.history_max)
+    return min(revision_count, preset.history_max_items)
+
+
+def build_revision_value(key: str, value: str, index: int, rng: random.Random) -> str:
+    if key == "Password":
+        return build_password(rng=rng, index=index)
+    if key == "UserName":
+        return build_username(rng=rng, index=index)
+    if key == "URL" or key.startswith(URI_FIELD_PREFIX):
+        ordinal = int(key.removeprefix(URI_FIELD_PREFIX)) if key != "URL" else 0
+        return build_uri(index=index, ordinal=ordinal, rng=rng)
+    if key == "Notes" or key.startswith("oversized_"):
+        # Toggle a trailing edit line so the notes always change. Oversized
+        # values are edited the same way rather than rebuilt.
+        notes, _, last_line = value.rpartition("\n")
+        if notes and last_line.startswith("Edited"):
+            return notes
+        return f"{value}\nEdited {rng.choice(('draft', 'typo', 'recovery hint'))}."
+    field_index = int(key.removeprefix("field_"))
+    return build_custom_field_value(index=index, field_index=field_index, rng=rng)
+
+
+def mutate_revision(revision, index: int, rng: random.Random) -> str:
+    """Change one string field of `revision` the way a user edit would.
+
+    Returns the key of the changed field.
+    """
+    values = {
+        string.findtext("Key"): string.find("Value")
+        for string in revision.findall("String")
+    }
+    if "Password" in values and rng.random() < HISTORY_PASSWORD_CHANGE_RATIO:
+        key = "Password"
+    else:
+        key = rng.choice(
+            [key for key in values if key != "Title" and key != KEYGUARD_ENTRY_TYPE_KEY],
+        )
+    value = values[key].text or ""
+    new_value = build_revision_value(key=key, value=value, index=index, rng=rng)
+    if new_value == value:
+        # Some builders draw from a small vocabulary. Fall back to a field
+        # that always changes.
+        key = "Password" if "Password" in values else "Notes"
+        value = values[key].text or ""
+        new_value = build_revision_value(key=key, value=value, index=index, rng=rng)
+    values[key].text = new_value
+    return key
+
+
+def add_history(entry, revision_count: int, index: int, rng: random.Random) -> None:
+    """Append `revision_count` older revisions of `entry` as its <History>.
+
+    Revisions are derived backwards from the current entry, one edit and one
+    day apart, and stored oldest first as KeePass does.
+    """
+    from lxml.builder import E
+
+    if revision_count == 0:
+        return
+    timestamp = build_timestamp(index + 1)
+    revisions = []
+    revision = entry
+    for age in range(1, revision_count + 1):
+        revision = copy.deepcopy(revision)
+        mutate_revision(revision, index=index, rng=rng)
+        revision.replace(
+            revision.find("Times"),
+            build_times_element(timestamp - timedelta(days=age)),
+        )
+        revisions.append(revision)
+    entry.append(E.History(*reversed(revisions)))
+
+
+def derive_seed(seed: int, *parts) -> int:
+    path = "/".join(str(part) for part in (seed, *parts))
+    digest = hashlib.sha256(f"keyguard/{path}".encode("utf-8")).digest()
+    return int.from_bytes(digest, "big")
+
+
+def derive_shard_rng(seed: int, shard: int) -> random.Random:
+    return random.Random(derive_seed(seed, "shard", shard))
+
+
+def derive_key(seed: int, *parts) -> bytes:
+    return derive_seed(seed, *parts).to_bytes(32, "big")
+
+
+class CounterRandom(random.Random):
+    """`random.Random` whose bits come from keyed BLAKE2b over a block counter.
+
+    Unlike the Mersenne Twister, a stream keyed by (seed, index) is cheap to
+    set up, so every entry can own one and be generated on its own.
+    """
+
+    def seed(self, a: bytes = b"", version: int = 2) -> None:
+        self._key = bytes(a)
+        self._block = 0
+        self._buffer = b""
+
+    def _read(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            self._buffer += hashlib.blake2b(
+                self._block.to_bytes(8, "little"),
+                key=self._key,
+            ).digest()
+            self._block += 1
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def getrandbits(self, k: int) -> int:
+        if k < 0:
+            raise ValueError("number of bits must be non-negative")
+        size = (k + 7) // 8
+        return int.from_bytes(self._read(size), "little") >> (size * 8 - k)
+
+    def random(self) -> float:
+        return self.getrandbits(53) * 2.0 ** -53
+
+    def randbytes(self, n: int) -> bytes:
+        return self._read(n)
+
+    def getstate(self):
+        return self._key, self._block, self._buffer
+
+    def setstate(self, state) -> None:
+        self._key, self._block, self._buffer = state
+
+
+@dataclass(frozen=True)
+class IndexPermutation:
+    """Keyed bijection on range(size), computed one index at a time.
+
+    A balanced Feistel network permutes the smallest even-width power of two
+    that covers `size`; cycle walking maps values outside `size` back in.
+    """
+
+    size: int
+    key: bytes
+
+    def forward(self, index: int) -> int:
+        half_bits = max(1, ((self.size - 1).bit_length() + 1) // 2)
+        mask = (1 << half_bits) - 1
+        value = index
+        while True:
+            left, right = value >> half_bits, value & mask
+            for round_index in range(FEISTEL_ROUNDS):
+                digest = hashlib.blake2b(
+                    right.to_bytes(8, "little"),
+                    key=self.key,
+                    digest_size=8,
+                    person=round_index.to_bytes(16, "little"),
+                ).digest()
+                left, right = right, left ^ (int.from_bytes(digest, "little") & mask)
+            value = (left << half_bits) | right
+            if value < self.size:
+                return value
+
+
+def count_attachment_blobs(preset: Preset) -> int:
+    if preset.attachment_count == 0:
+        return 0
+    duplicates = round(preset.attachment_count * preset.attachment_duplicate_ratio)
+    return max(1, preset.attachment_count - duplicates)
+
+
+def get_entry_attachments(preset: Preset, index: int) -> range:
+    """Return the attachment ordinals of entry `index`.
+
+    Attachment `j` belongs to entry `j * entry_count // attachment_count`,
+    which spreads attachments evenly and lets any shard find its own.
+    """
+    attachment_count = preset.attachment_count
+    entry_count = preset.entry_count
+    return range(
+        -(-index * attachment_count // entry_count),
+        -(-(index + 1) * attachment_count // entry_count),
+    )
+
+
+def get_attachment_blob(preset: Preset, seed: int, attachment: int) -> int:
+    """Map an attachment ordinal to the binary pool entry holding its content.
+
+    The first attachments introduce every pool entry once; the rest are
+    duplicates of a pool entry chosen from the seed.
+    """
+    blob_count = count_attachment_blobs(preset)
+    if attachment < blob_count:
+        return attachment
+    return derive_seed(seed, "attachment", attachment) % blob_count
+
+
+def get_attachment_blob_size(preset: Preset, seed: int, blob: int) -> int:
+    buckets = preset.attachment_size_buckets
+    rng = random.Random(derive_seed(seed, "blob-size", blob))
+    if blob == 0:
+        # Every vault gets one attachment from the largest bucket.
+        bucket = max(buckets, key=lambda bucket: bucket[1])
+    else:
+        bucket = rng.choices(buckets, weights=[weight for _, _, weight in buckets])[0]
+    min_size, max_size, _ = bucket
+    return rng.randint(min_size, max_size)
+
+
+def iter_attachment_chunks(seed: int, blob: int, size: int) -> Iterator[bytes]:
+    rng = random.Random(derive_seed(seed, "blob-content", blob))
+    remaining = size
+    while remaining:
+        chunk_size = min(remaining, ATTACHMENT_CHUNK_SIZE)
+        yield rng.randbytes(chunk_size)
+        remaining -= chunk_size
+
+
+def build_attachment_name(attachment: int) -> str:
+    return f"attachment-{attachment:06d}.bin"
+
+
+def add_attachments(entry, attachments: Sequence[tuple[int, int]]) -> None:
+    from lxml.builder import E
+
+    for attachment, blob in attachments:
+        entry.append(
+            E.Binary(E.Key(build_attachment_name(attachment)), E.Value(Ref=str(blob))),
+        )
+
+
+def add_attachment_pool(kp, preset: Preset, seed: int) -> None:
+    # pykeepass serializes the inner header from memory, so each pool entry is
+    # joined here. Payloads are still produced chunk by chunk from the seed.
+    for blob in range(count_attachment_blobs(preset)):
+        size = get_attachment_blob_size(preset=preset, seed=seed, blob=blob)
+        kp.add_binary(b"".join(iter_attachment_chunks(seed=seed, blob=blob, size=size)))
+
+
+def count_custom_icon_references(preset: Preset) -> int:
+    """Return how many entries and groups of the preset show a custom icon."""
+    if not preset.custom_icon_count:
+        return 0
+    item_count = preset.entry_count + count_groups(preset.group_depth, preset.group_fanout) + 1
+    return round(item_count * preset.custom_icon_ratio)
+
+
+def get_custom_icon(preset: Preset, seed: int, item: int) -> int | None:
+    """Return the icon of item `item`, or None when it keeps its standard icon.
+
+    Items are the entries by index, followed by the preset group and its
+    subgroups by node. The first users of each icon come first in a keyed
+    permutation, so every icon is used once before any is shared.
+    """
+    reference_count = count_custom_icon_references(preset)
+    if not reference_count:
+        return None
+    position = IndexPermutation(
+        size=preset.entry_count + count_groups(preset.group_depth, preset.group_fanout) + 1,
+        key=derive_key(seed, "custom-icons"),
+    ).forward(item)
+    if position >= reference_count:
+        return None
+    return position % preset.custom_icon_count
+
+
+def build_custom_icon_uuid(preset: Preset, icon: int) -> uuid.UUID:
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"keyguard/{preset.name}/icon/{icon}")
+
+
+def get_custom_icon_size(preset: Preset, seed: int, icon: int) -> int:
+    buckets = preset.custom_icon_size_buckets
+    if icon == 0:
+        # Every vault gets one icon of the largest size.
+        return max(size for size, _ in buckets)
+    rng = random.Random(derive_seed(seed, "icon-size", icon))
+    return rng.choices(buckets, weights=[weight for _, weight in buckets])[0][0]
+
+
+def build_png(width: int, height: int, rows: Sequence[bytes]) -> bytes:
+    """Encode 8-bit RGBA `rows` as a PNG, with no filtering."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data)) + kind + data +
+            struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    pixels = b"".join(b"\x00" + row for row in rows)
+    return (
+        PNG_SIGNATURE +
+        chunk(b"IHDR", header) +
+        chunk(b"IDAT", zlib.compress(pixels, 9)) +
+        chunk(b"IEND", b"")
+    )
+
+
+def build_custom_icon_png(seed: int, icon: int, size: int) -> bytes:
+    rng = random.Random(derive_seed(seed, "icon-pixels", icon))
+    return build_png(size, size, [rng.randbytes(size * 4) for _ in range(size)])
+
+
+def set_custom_icon(element, icon_uuid: uuid.UUID) -> None:
+    from lxml.builder import E
+
+    anchor = element.find("IconID")
+    if anchor is None:
+        anchor = element.find("UUID")
+    anchor.addnext(E.CustomIconUUID(encode_kdbx_uuid(icon_uuid)))
+
+
+def apply_custom_icon(element, preset: Preset, seed: int, item: int) -> None:
+    icon = get_custom_icon(preset, seed=seed, item=item)
+    if icon is not None:
+        set_custom_icon(element, build_custom_icon_uuid(preset, icon))
+
+
+def add_custom_icons(custom_icons, preset: Preset, seed: int) -> None:
+    """Encode every custom icon once into a Meta/CustomIcons element."""
+    from lxml.builder import E
+
+    for icon in range(preset.custom_icon_count):
+        size = get_custom_icon_size(preset, seed=seed, icon=icon)
+        custom_icons.append(
+            E.Icon(
+                E.UUID(encode_kdbx_uuid(build_custom_icon_uuid(preset, icon))),
+                E.Data(
+                    base64.b64encode(build_custom_icon_png(seed, icon=icon, size=size)).decode(
+                        "ascii",
+                    ),
+                ),
+            )
+        )
+
+
+def get_entry_oversized_value(preset: Preset, index: int) -> int | None:
+    """Return the oversized value of entry `index`, if it has one.
+
+    Values are spread evenly over the entries, like attachments, and there
+    are never more values than entries.
+    """
+    values = range(
+        -(-index * preset.oversized_value_count // preset.entry_count),
+        -(-(index + 1) * preset.oversized_value_count // preset.entry_count),
+    )
+    return values[0] if values else None
+
+
+def get_oversized_value_key(value: int) -> str:
+    # Even values replace the entry's notes, odd ones are an extra custom field.
+    return "Notes" if value % 2 == 0 else f"oversized_{value:06d}"
+
+
+def get_oversized_value_size(preset: Preset, seed: int, value: int) -> int:
+    buckets = preset.oversized_value_size_buckets
+    rng = random.Random(derive_seed(seed, "oversized-value-size", value))
+    if value == 0:
+        bucket = max(buckets, key=lambda bucket: bucket[1])
+    else:
+        bucket = rng.choices(buckets, weights=[weight for _, _, weight in buckets])[0]
+    min_size, max_size, _ = bucket
+    return rng.randint(min_size, max_size)
+
+
+def iter_oversized_value_chunks(seed: int, value: int, size: int) -> Iterator[str]:
+    """Yield the text of oversized value `value`, `size` UTF-8 bytes in all,
+    in chunks of at most `OVERSIZED_VALUE_CHUNK_SIZE` bytes.
+
+    Values cycle through `OVERSIZED_VALUE_STYLES`: lines of mixed words, one
+    long line, and lines of multi-byte words only.
+    """
+    style = OVERSIZED_VALUE_STYLES[value % len(OVERSIZED_VALUE_STYLES)]
+    words = OVERSIZED_VALUE_UNICODE_WORDS if style == "unicode" else OVERSIZED_VALUE_WORDS
+    rng = random.Random(derive_seed(seed, "oversized-value", value))
+    remaining = size
+    while remaining:
+        budget = min(remaining, OVERSIZED_VALUE_CHUNK_SIZE)
+        # Each word and its separator take at least four bytes.
+        tokens = rng.choices(words, k=budget // 4 + 1)
+        if style == "single_line":
+            text = " ".join(tokens)
+        else:
+            text = "\n".join(
+                " ".join(tokens[start:start + OVERSIZED_VALUE_LINE_WORDS])
+                for start in range(0, len(tokens), OVERSIZED_VALUE_LINE_WORDS)
+            )
+        chunk = text.encode("utf-8")[:budget].decode("utf-8", errors="ignore")
+        # Pad where the cut dropped part of a multi-byte character.
+        yield chunk + "." * (budget - len(chunk.encode("utf-8")))
+        remaining -= budget
+
+
+def apply_oversized_value(
+    entry,
+    preset: Preset,
+    seed: int,
+    index: int,
+    placeholder: bool = False,
+) -> None:
+    """Give entry `index` its oversized value, if it has one.
+
+    With `placeholder`, the field is added with an empty value, for
+    `write_oversized_entry` to fill in chunk by chunk.
+    """
+    value = get_entry_oversized_value(preset, index)
+    if value is None:
+        return
+    if placeholder:
+        set_string_field(entry, get_oversized_value_key(value), "")
+        return
+    size = get_oversized_value_size(preset, seed=seed, value=value)
+    set_string_field(
+        entry,
+        get_oversized_value_key(value),
+        "".join(iter_oversized_value_chunks(seed=seed, value=value, size=size)),
+    )
+
+
+def write_oversized_entry(xml_file, entry, preset: Preset, seed: int, value: int) -> None:
+    """Write `entry`, streaming oversized value `value` into its placeholder
+    one chunk at a time."""
+    key = get_oversized_value_key(value)
+    size = get_oversized_value_size(preset, seed=seed, value=value)
+    with xml_file.element(entry.tag, entry.attrib):
+        for child in entry:
+            if child.tag != "String" or child.findtext("Key") != key:
+                xml_file.write(child)
+                continue
+            with xml_file.element("String"):
+                xml_file.write(child.find("Key"))
+                with xml_file.element("Value"):
+                    for chunk in iter_oversized_value_chunks(seed=seed, value=value, size=size):
+                        xml_file.write(chunk)
+
+
+def build_oversized_value_digests(preset: Preset, seed: int) -> dict[int, tuple[str, int, str]]:
+    """Map each entry index with an oversized value to the value's key, size
+    and SHA-256, hashing the value chunk by chunk."""
+    digests = {}
+    for value in range(preset.oversized_value_count):
+        size = get_oversized_value_size(preset, seed=seed, value=value)
+        digest = hashlib.sha256()
+        for chunk in iter_oversized_value_chunks(seed=seed, value=value, size=size):
+            digest.update(chunk.encode("utf-8"))
+        index = value * preset.entry_count // preset.oversized_value_count
+        digests[index] = (get_oversized_value_key(value), size, digest.hexdigest())
+    return digests
+
+
+@functools.lru_cache(maxsize=1)
+def load_watchtower_domains() -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """Return domains that only trigger the inactive 2FA check and domains that
+    only trigger the inactive passkey check.
+
+    Watchtower matches hosts against these lists exactly, so domains listed
+    in both files are left out to keep the two finding counts independent.
+    """
+    def load(name: str) -> list[dict]:
+        return json.loads((APP_RESOURCES_DIR / name).read_text(encoding="utf-8"))
+
+    def get_domains(service: dict) -> set[str]:
+        return {service["domain"], *service.get("additional-domains", ())}
+
+    tfa_services = load("tfa.json")
+    passkey_services = load("passkeys.json")
+    all_tfa_domains = set().union(*map(get_domains, tfa_services))
+    all_passkey_domains = set().union(*map(get_domains, passkey_services))
+    tfa_domains = {
+        service["domain"]
+        for service in tfa_services
+        if "totp" in service.get("tfa", ())
+    }
+    passkey_domains = {
+        service["domain"]
+        for service in passkey_services
+        if "signin" in service.get("features", ())
+    }
+    # Skip entries that are not a plain lowercase host, such as ones with a path.
+    return (
+        tuple(sorted(
+            domain for domain in tfa_domains - all_passkey_domains
+            if re.fullmatch(r"[a-z0-9.-]+", domain)
+        )),
+        tuple(sorted(
+            domain for domain in passkey_domains - all_tfa_domains
+            if re.fullmatch(r"[a-z0-9.-]+", domain)
+        )),
+    )
+
+
+def has_watchtower_roles(preset: Preset) -> bool:
+    return any(
+        (
+            preset.reused_password_ratio,
+            preset.weak_password_ratio,
+            preset.tfa_domain_ratio,
+            preset.passkey_domain_ratio,
+        )
+    )
+
+
+def count_watchtower_roles(preset: Preset) -> dict[str, int]:
+    """Return how many logins get each watchtower role."""
+    logins = preset.login_count
+    reused = round(logins * preset.reused_password_ratio)
+    if reused == 1:
+        # A password needs at least two logins to count as reused.
+        reused = 2 if logins >= 2 else 0
+    return {
+        "reused": reused,
+        "reuse_groups": max(1, reused // preset.reuse_group_size) if reused else 0,
+        "weak": min(round(logins * preset.weak_password_ratio), logins - reused),
+        "tfa": round(logins * preset.tfa_domain_ratio),
+        "passkey": min(
+            round(logins * preset.passkey_domain_ratio),
+            logins - round(logins * preset.tfa_domain_ratio),
+        ),
+    }
+
+
+def build_weak_password(ordinal: int) -> str:
+    word = WEAK_PASSWORD_WORDS[ordinal % len(WEAK_PASSWORD_WORDS)]
+    return f"{word}{ordinal // len(WEAK_PASSWORD_WORDS)}"
+
+
+def is_weak_password(password: str) -> bool:
+    word = password.rstrip("0123456789")
+    return word in WEAK_PASSWORD_WORDS and word != password
+
+
+def set_string_field(entry, key: str, value: str) -> None:
+    from lxml.builder import E
+
+    string_elements = entry.findall("String")
+    for string_element in string_elements:
+        if string_element.findtext("Key") == key:
+            string_element.find("Value").text = value
+            return
+    string_elements[-1].addnext(E.String(E.Key(key), E.Value(value)))
+
+
+def apply_watchtower_role(entry, preset: Preset, seed: int, login_rank: int) -> None:
+    """Give login `login_rank` its reused or weak password and 2FA or passkey URI.
+
+    Roles are assigned through keyed permutations of the login ranks, so the
+    counts in `count_watchtower_roles` are exact and spread over the vault.
+    """
+    if not has_watchtower_roles(preset):
+        return
+    counts = count_watchtower_roles(preset)
+
+    position = IndexPermutation(
+        size=preset.login_count,
+        key=derive_key(seed, "watchtower", "passwords"),
+    ).forward(login_rank)
+    if position < counts["reused"]:
+        group = min(position // preset.reuse_group_size, counts["reuse_groups"] - 1)
+        rng = CounterRandom(derive_key(seed, "watchtower", "reuse", group))
+        set_string_field(entry, "Password", build_password(rng=rng, index=group))
+    elif position < counts["reused"] + counts["weak"]:
+        set_string_field(entry, "Password", build_weak_password(position - counts["reused"]))
+
+    position = IndexPermutation(
+        size=preset.login_count,
+        key=derive_key(seed, "watchtower", "domains"),
+    ).forward(login_rank)
+    tfa_domains, passkey_domains = load_watchtower_domains()
+    if position < counts["tfa"]:
+        domain = tfa_domains[position % len(tfa_domains)]
+    elif position < counts["tfa"] + counts["passkey"]:
+        domain = passkey_domains[(position - counts["tfa"]) % len(passkey_domains)]
+    else:
+        return
+    set_string_field(entry, "URL", f"https://{domain}/login")
+
+
+@functools.lru_cache(maxsize=1)
+def load_public_suffix_rules() -> tuple[frozenset[str], frozenset[str], frozenset[str]]:
+    """Return the plain, wildcard and exception rules of the bundled public
+    suffix list. Wildcard and exception rules are stored without their
+    `*.` or `!` prefix."""
+    rules, wildcards, exceptions = set(), set(), set()
+    for line in PUBLIC_SUFFIX_LIST_PATH.read_text(encoding="utf-8").splitlines():
+        rule = line.strip().lower()
+        if not rule or rule.startswith("//"):
+            continue
+        if rule.startswith("*."):
+            wildcards.add(rule[2:])
+        elif rule.startswith("!"):
+            exceptions.add(rule[1:])
+        else:
+            rules.add(rule)
+    return frozenset(rules), frozenset(wildcards), frozenset(exceptions)
+
+
+def get_registrable_domain(host: str) -> str:
+    """Return the public suffix of `host` plus one label.
+
+    Hosts that are a public suffix themselves, and IP addresses, are returned
+    unchanged.
+    """
+    host = host.lower().rstrip(".")
+    if re.fullmatch(r"[0-9.]+|\[.*\]", host):
+        return host
+    rules, wildcards, exceptions = load_public_suffix_rules()
+    labels = host.split(".")
+    # Without a matching rule, the public suffix is the last label.
+    suffix_length = 1
+    for start in range(len(labels)):
+        candidate = ".".join(labels[start:])
+        if candidate in exceptions:
+            suffix_length = len(labels) - start - 1
+            break
+        if candidate in rules or ".".join(labels[start + 1 :]) in wildcards:
+            suffix_length = len(labels) - start
+            break
+    if suffix_length >= len(labels):
+        return host
+    return ".".join(labels[-suffix_length - 1 :])
+
+
+@functools.lru_cache(maxsize=8)
+def build_autofill_targets(target_count: int, seed: int) -> tuple[str, ...]:
+    """Return the autofill target URLs and `androidapp://` URIs.
+
+    Web targets sit on suffixes drawn from the public suffix list, so
+    registrable domains span one to several labels.
+    """
+    rules, wildcards, _ = load_public_suffix_rules()
+    suffixes = sorted(
+        rule for rule in rules if re.fullmatch(r"[a-z0-9.-]+", rule) and rule not in wildcards
+    )
+    rng = random.Random(derive_seed(seed, "autofill", "targets"))
+    targets = []
+    for ordinal in range(target_count):
+        suffix = rng.choice(suffixes)
+        name = f"brand{ordinal:05d}"
+        if ordinal % AUTOFILL_ANDROID_TARGET_INTERVAL == AUTOFILL_ANDROID_TARGET_INTERVAL - 1:
+            package = ".".join((*reversed(suffix.split(".")), name, "android"))
+            targets.append(f"androidapp://{package}")
+        else:
+            subdomain = rng.choice(AUTOFILL_SUBDOMAINS)
+            path = rng.choice(AUTOFILL_PATHS)
+            targets.append(f"https://{subdomain}.{name}.{suffix}/{path}")
+    return tuple(targets)
+
+
+def count_autofill_roles(preset: Preset) -> dict[str, int]:
+    hits = round(preset.login_count * preset.autofill_hit_ratio)
+    return {
+        "hits": hits,
+        "misses": min(
+            round(preset.login_count * preset.autofill_miss_ratio),
+            preset.login_count - hits,
+        ),
+    }
+
+
+def build_autofill_hit_uri(target: str, relation: str) -> str:
+    """Return a URI that relates to `target` as `relation` describes."""
+    parts = urllib.parse.urlsplit(target)
+    if parts.scheme == "androidapp":
+        # App origins only have a package name to match on.
+        return target
+    host = parts.hostname
+    if relation == "exact":
+        return target
+    if relation == "prefix":
+        return f"https://{host}/{parts.path.lstrip('/').split('/')[0]}"
+    if relation == "path":
+        return f"https://{host}/settings"
+    if relation == "port":
+        return f"https://{host}:8443{parts.path}"
+    if relation == "subdomain":
+        subdomain, _, domain = host.partition(".")
+        other = AUTOFILL_SUBDOMAINS[
+            (AUTOFILL_SUBDOMAINS.index(subdomain) + 1) % len(AUTOFILL_SUBDOMAINS)
+        ]
+        return f"https://{other}.{domain}{parts.path}"
+    return f"^https://{re.escape(host)}/.*$"
+
+
+def build_autofill_miss_uri(target: str) -> str:
+    """Return a lookalike of `target` on another registrable domain or app."""
+    parts = urllib.parse.urlsplit(target)
+    if parts.scheme == "androidapp":
+        return f"{target}.lite"
+    subdomain, _, domain = parts.hostname.partition(".")
+    name, _, suffix = domain.partition(".")
+    return f"https://{subdomain}.{name}-secure.{suffix}{parts.path}"
+
+
+def apply_autofill_role(entry, preset: Preset, seed: int, login_rank: int) -> None:
+    """Point login `login_rank` at an autofill target, or at a lookalike.
+
+    Like the watchtower roles, hits and misses are assigned through a keyed
+    permutation of the login ranks, so their counts are exact.
+    """
+    if not preset.autofill_target_count:
+        return
+    counts = count_autofill_roles(preset)
+    position = IndexPermutation(
+        size=preset.login_count,
+        key=derive_key(seed, "autofill", "roles"),
+    ).forward(login_rank)
+    targets = build_autofill_targets(preset.autofill_target_count, seed)
+    if position < counts["hits"]:
+        # Consecutive hits share a target and cover each relation in turn.
+        ordinal, relation = divmod(position, len(AUTOFILL_HIT_RELATIONS))
+        uri = build_autofill_hit_uri(
+            targets[ordinal % len(targets)],
+            AUTOFILL_HIT_RELATIONS[relation],
+        )
+    elif position < counts["hits"] + counts["misses"]:
+        uri = build_autofill_miss_uri(targets[(position - counts["hits"]) % len(targets)])
+    else:
+        return
+    set_string_field(entry, "URL", uri)
+
+
+def find_first_login_index(entry_types: Sequence[int]) -> int | None:
+    for index, entry_type in enumerate(entry_types):
+        if entry_type == LOGIN_CODE:
+            return index
+    return None
+
+
+def iter_shard_entries(
+    preset: Preset,
+    seed: int,
+    shard: int,
+    start: int,
+    entry_types: Sequence[int],
+    custom_field_counts: Sequence[int],
+    first_login_index: int | None,
+    login_start: int = 0,
+) -> Iterator:
+    rng = derive_shard_rng(seed=seed, shard=shard)
+    history_rng = random.Random(derive_seed(seed, "shard", shard, "history"))
+    login_rank = login_start
+    for offset, entry_type in enumerate(entry_types):
+        index = start + offset
+        entry = build_entry_element(
+            preset=preset,
+            entry_type=ENTRY_TYPES[entry_type],
+            index=index,
+            custom_field_count=custom_field_counts[offset],
+            force_login_profile=index == first_login_index,
+            rng=rng,
+            attachments=[
+                (attachment, get_attachment_blob(preset, seed=seed, attachment=attachment))
+                for attachment in get_entry_attachments(preset, index)
+            ],
+        )
+        if entry_type == LOGIN_CODE:
+            apply_watchtower_role(entry, preset=preset, seed=seed, login_rank=login_rank)
+            apply_autofill_role(entry, preset=preset, seed=seed, login_rank=login_rank)
+            login_rank += 1
+        apply_custom_icon(entry, preset=preset, seed=seed, item=index)
+        if preset.history_max:
+            add_history(
+                entry,
+                revision_count=count_history_revisions(preset, index=index, rng=history_rng),
+                index=index,
+                rng=history_rng,
+            )
+        # Added after the history, so revisions do not repeat the value.
+        apply_oversized_value(entry, preset=preset, seed=seed, index=index)
+        yield entry
+
+
+def get_custom_field_count_at(
+    preset: Preset,
+    seed: int,
+    index: int,
+    rng: random.Random,
+) -> int:
+    """v2 counterpart of `build_custom_field_counts` for a single entry."""
+    if preset.low_field_target_count is None:
+        if index == 0:
+            return preset.custom_field_max
+        return build_custom_field_count(preset, rng)
+
+    low_field_upper_bound_exclusive = preset.low_field_upper_bound_exclusive
+    if low_field_upper_bound_exclusive is None:
+        raise ValueError("Preset is missing low-field bounds.")
+    position = IndexPermutation(
+        size=preset.entry_count,
+        key=derive_key(seed, "v2", "custom-fields"),
+    ).forward(index)
+    if position < preset.low_field_target_count:
+        return rng.randint(preset.custom_field_min, low_field_upper_bound_exclusive - 1)
+    if position == preset.low_field_target_count:
+        return min(321, preset.custom_field_max)
+    return rng.randint(low_field_upper_bound_exclusive, preset.custom_field_max)
+
+
+def entry_at(preset: Preset, seed: int, index: int, oversized_values: bool = True):
+    """Return entry `index` of the preset's v2 vault for `seed`.
+
+    Entry types and low-field buckets come from keyed permutations of the
+    entry indexes, which keeps their totals exact. Everything else comes from
+    a counter-based stream keyed by (seed, index), so any entry can be built
+    without building the ones before it. Without `oversized_values`, an
+    oversized value is left as an empty placeholder.
+    """
+    if not 0 <= index < preset.entry_count:
+        raise ValueError(f"Entry index {index} is outside 0..{preset.entry_count - 1}.")
+
+    type_position = IndexPermutation(
+        size=preset.entry_count,
+        key=derive_key(seed, "v2", "entry-types"),
+    ).forward(index)
+    rng = CounterRandom(derive_key(seed, "v2", "entry", index))
+    custom_field_count = get_custom_field_count_at(preset, seed=seed, index=index, rng=rng)
+    is_login = type_position < preset.login_count
+    entry = build_entry_element(
+        preset=preset,
+        entry_type="login" if is_login else "secure_note",
+        index=index,
+        custom_field_count=custom_field_count,
+        # Position 0 is always a login whenever the preset has any.
+        force_login_profile=type_position == 0 and preset.login_count > 0,
+        rng=rng,
+        attachments=[
+            (attachment, get_attachment_blob(preset, seed=seed, attachment=attachment))
+            for attachment in get_entry_attachments(preset, index)
+        ],
+    )
+    if is_login:
+        # Logins occupy the first login_count type positions, so the position
+        # doubles as the login rank.
+        apply_watchtower_role(entry, preset=preset, seed=seed, login_rank=type_position)
+        apply_autofill_role(entry, preset=preset, seed=seed, login_rank=type_position)
+    apply_custom_icon(entry, preset=preset, seed=seed, item=index)
+    if preset.history_max:
+        history_rng = CounterRandom(derive_key(seed, "v2", "history", index))
+        add_history(
+            entry,
+            revision_count=count_history_revisions(preset, index=index, rng=history_rng),
+            index=index,
+            rng=history_rng,
+        )
+    apply_oversized_value(
+        entry, preset=preset, seed=seed, index=index, placeholder=not oversized_values
+    )
+    return entry
+
+
+def iter_counter_shard_entries(
+    preset: Preset,
+    seed: int,
+    start: int,
+    stop: int,
+    step: int = 1,
+    oversized_values: bool = True,
+) -> Iterator:
+    for index in range(start, stop, step):
+        yield entry_at(preset, seed=seed, index=index, oversized_values=oversized_values)
+
+
+def build_shard_xml(iter_shard, **shard_kwargs) -> bytes:
+    from lxml import etree
+
+    return b"".join(etree.tostring(entry) for entry in iter_shard(**shard_kwargs))
+
+
+def build_entry_plan(
+    preset: Preset,
+    seed: int,
+) -> tuple[array.array, array.array, int | None]:
+    """Lay out entry types and custom field counts from the seed's main stream."""
+    rng = random.Random(seed)
+    entry_types = build_entry_types(preset, rng)
+    custom_field_counts = build_custom_field_counts(preset, rng)
+    return entry_types, custom_field_counts, find_first_login_index(entry_types)
+
+
+def iter_plan_shards(
+    preset: Preset,
+    seed: int,
+    plan: tuple[array.array, array.array, int | None],
+) -> Iterator[dict]:
+    entry_types, custom_field_counts, first_login_index = plan
+    login_start = 0
+    for shard, start in enumerate(range(0, preset.entry_count, SHARD_SIZE)):
+        shard_entry_types = entry_types[start:start + SHARD_SIZE]
+        yield dict(
+            preset=preset,
+            seed=seed,
+            shard=shard,
+            start=start,
+            entry_types=shard_entry_types,
+            custom_field_counts=custom_field_counts[start:start + SHARD_SIZE],
+            first_login_index=first_login_index,
+            login_start=login_start,
+        )
+        login_start += shard_entry_types.count(LOGIN_CODE)
+
+
+def iter_entry_elements(
+    preset: Preset,
+    seed: int,
+    workers: int,
+    plan: tuple[array.array, array.array, int | None] | None = None,
+    scheme: str = DEFAULT_GENERATION_SCHEME,
+) -> Iterator:
+    """Yield the preset's <Entry> elements in index order.
+
+    Under v1, the seed's main stream only lays out entry types and custom
+    field counts. Entry content comes from one RNG substream per fixed-size
+    shard, so the output does not depend on how many worker processes build
+    the shards. Under v2, every entry is derived from (seed, index) alone.
+    """
+    if scheme == "v2":
+        iter_shard = iter_counter_shard_entries
+        shards = (
+            dict(
+                preset=preset,
+                seed=seed,
+                start=start,
+                stop=min(start + SHARD_SIZE, preset.entry_count),
+            )
+            for start in range(0, preset.entry_count, SHARD_SIZE)
+        )
+    else:
+        if plan is None:
+            plan = build_entry_plan(preset, seed)
+        iter_shard = iter_shard_entries
+        shards = iter_plan_shards(preset, seed=seed, plan=plan)
+    yield from iter_shard_elements(iter_shard, shards=shards, workers=workers)
+
+
+def iter_shard_elements(iter_shard, shards: Iterator[dict], workers: int) -> Iterator:
+    """Yield the entries of `shards` in order, built by up to `workers` processes."""
+    if workers <= 1:
+        for shard_kwargs in shards:
+            yield from iter_shard(**shard_kwargs)
+        return
+
+    from lxml import etree
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded window of shards in flight so finished shards that are
+        # still waiting for their turn do not pile up in the parent.
+        pending = collections.deque(
+            executor.submit(build_shard_xml, iter_shard, **shard_kwargs)
+            for shard_kwargs in itertools.islice(shards, workers * 2)
+        )
+        while pending:
+            shard_xml = pending.popleft().result()
+            shard_kwargs = next(shards, None)
+            if shard_kwargs is not None:
+                pending.append(executor.submit(build_shard_xml, iter_shard, **shard_kwargs))
+            yield from etree.fromstring(
+                b"<Entries>" + shard_xml + b"</Entries>",
+                # Oversized values exceed libxml2's default text node limit.
+                etree.XMLParser(huge_tree=True),
+            )
+
+
+def create_entries(
+    kp,
+    preset: Preset,
+    seed: int,
+    workers: int = 1,
+    report: GenerationReport | None = None,
+    scheme: str = DEFAULT_GENERATION_SCHEME,
+    exporters: Sequence = (),
+) -> None:
+    report = report or GenerationReport()
+    plan = None
+    if scheme == "v1":
+        with report.phase("plan"):
+            plan = build_entry_plan(preset, seed)
+
+    group = kp.add_group(kp.root_group, preset.name)
+    apply_stable_metadata(
+        element=group,
+        stable_uuid=build_group_uuid(preset),
+        timestamp=build_timestamp(0),
+    )
+
+    # Entries are built as plain <Entry> subtrees and appended directly to the
+    # group elements. `kp.add_entry` runs a duplicate-title XPath search over the
+    # whole group on every insert, which makes generation quadratic.
+    group_elements = [group._element]  # noqa: SLF001
+    group_elements.extend(
+        build_group_element(preset, node)
+        for node in range(1, count_groups(preset.group_depth, preset.group_fanout) + 1)
+    )
+    for node, group_element in enumerate(group_elements):
+        apply_custom_icon(group_element, preset=preset, seed=seed, item=preset.entry_count + node)
+    with report.phase("build"):
+        for index, entry in enumerate(
+            iter_entry_elements(
+                preset=preset,
+                seed=seed,
+                workers=workers,
+                plan=plan,
+                scheme=scheme,
+            )
+        ):
+            node = get_entry_group(preset, seed=seed, index=index)
+            for export in exporters:
+                export(entry, node)
+            group_elements[node].append(entry)
+        # Subgroups are linked last so each group lists its entries before its
+        # child groups, as KeePass writes them.
+        for node in range(1, len(group_elements)):
+            group_elements[(node - 1) // preset.group_fanout].append(group_elements[node])
+    with report.phase("attachments"):
+        add_attachment_pool(kp, preset=preset, seed=seed)
+    with report.phase("icons"):
+        add_custom_icons(kp.tree.find("Meta/CustomIcons"), preset=preset, seed=seed)
+
+
+def get_group_path(preset: Preset, node: int) -> str:
+    names = []
+    while node:
+        names.append(f"group-{node:06d}")
+        node = (node - 1) // preset.group_fanout
+    names.append(preset.name)
+    return "/".join(reversed(names))
+
+
+def decode_entry_uuid(entry) -> str:
+    return str(uuid.UUID(bytes=base64.b64decode(entry.findtext("UUID"))))
+
+
+def format_export_time(text: str) -> str:
+    timestamp = KDBX_EPOCH + timedelta(seconds=decode_kdbx_time(text))
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def split_export_fields(fields: dict[str, str]) -> tuple[list[str], dict[str, str]]:
+    """Split string fields into URIs and custom fields for flat export formats."""
+    uris = [fields["URL"]] if fields.get("URL") else []
+    custom_fields = {}
+    for key, value in fields.items():
+        if key.startswith(URI_FIELD_PREFIX):
+            uris.append(value)
+        elif key not in ("Title", "UserName", "Password", "URL", "Notes"):
+            custom_fields[key] = value
+    return uris, custom_fields
+
+
+def build_bitwarden_item(entry, folder_id: str) -> dict:
+    fields = get_string_fields(entry)
+    uris, custom_fields = split_export_fields(fields)
+    is_login = fields.get(KEYGUARD_ENTRY_TYPE_KEY) == "Login"
+    # Bitwarden only records revisions that changed the password, newest first.
+    password_history = []
+    newer_password = fields.get("Password")
+    for revision in reversed(entry.findall("History/Entry")):
+        password = get_string_fields(revision).get("Password")
+        if password and password != newer_password:
+            password_history.append(
+                {
+                    "lastUsedDate": format_export_time(
+                        revision.findtext("Times/LastModificationTime"),
+                    ),
+                    "password": password,
+                }
+            )
+        newer_password = password
+    return {
+        "id": decode_entry_uuid(entry),
+        "organizationId": None,
+        "folderId": folder_id,
+        "type": 1 if is_login else 2,
+        "reprompt": 0,
+        "name": fields.get("Title", ""),
+        "notes": fields.get("Notes"),
+        "favorite": False,
+        "fields": [
+            {"name": key, "value": value, "type": 0, "linkedId": None}
+            for key, value in custom_fields.items()
+        ],
+        "login": {
+            "uris": [{"match": None, "uri": uri} for uri in uris],
+            "username": fields.get("UserName"),
+            "password": fields.get("Password"),
+            "totp": None,
+        } if is_login else None,
+        "secureNote": None if is_login else {"type": 0},
+        "collectionIds": None,
+        "passwordHistory": password_history or None,
+        "revisionDate": format_export_time(entry.findtext("Times/LastModificationTime")),
+        "creationDate": format_export_time(entry.findtext("Times/CreationTime")),
+    }
+
+
+@contextlib.contextmanager
+def open_bitwarden_json_export(path: pathlib.Path, preset: Preset, seed: int) -> Iterator:
+    """Stream items into a Bitwarden JSON export.
+
+    Items are written as they arrive; folders only depend on the preset, so
+    they are written after the item array.
+    """
+    with path.open("w", encoding="utf-8") as stream:
+        stream.write('{\n  "encrypted": false,\n  "items": [')
+        item_count = 0
+
+        def write(entry, node: int) -> None:
+            nonlocal item_count
+            folder_id = str(build_group_uuid(preset, node))
+            stream.write("\n    " if item_count == 0 else ",\n    ")
+            stream.write(json.dumps(build_bitwarden_item(entry, folder_id=folder_id)))
+            item_count += 1
+
+        yield write
+        stream.write('\n  ],\n  "folders": [')
+        group_count = count_groups(preset.group_depth, preset.group_fanout) + 1
+        for node in range(group_count):
+            folder = {
+                "id": str(build_group_uuid(preset, node)),
+                "name": get_group_path(preset, node),
+            }
+            stream.write(("\n    " if node == 0 else ",\n    ") + json.dumps(folder))
+        stream.write("\n  ]\n}\n")
+
+
+CSV_EXPORT_COLUMNS = (
+    "folder",
+    "favorite",
+    "type",
+    "name",
+    "notes",
+    "fields",
+    "reprompt",
+    "login_uri",
+    "login_username",
+    "login_password",
+    "login_totp",
+)
+
+
+@contextlib.contextmanager
+def open_csv_export(path: pathlib.Path, preset: Preset, seed: int) -> Iterator:
+    with path.open("w", encoding="utf-8", newline="") as stream:
+        writer = csv.writer(stream)
+        writer.writerow(CSV_EXPORT_COLUMNS)
+
+        def write(entry, node: int) -> None:
+            fields = get_string_fields(entry)
+            uris, custom_fields = split_export_fields(fields)
+            is_login = fields.get(KEYGUARD_ENTRY_TYPE_KEY) == "Login"
+            writer.writerow(
+                (
+                    get_group_path(preset, node),
+                    "",
+                    "login" if is_login else "note",
+                    fields.get("Title", ""),
+                    fields.get("Notes", ""),
+                    "\n".join(f"{key}: {value}" for key, value in custom_fields.items()),
+                    0,
+                    ",".join(uris),
+                    fields.get("UserName", ""),
+                    fields.get("Password", ""),
+                    "",
+                )
+            )
+
+        yield write
+
+
+def iter_base64_chunks(chunks: Iterator[bytes]) -> Iterator[str]:
+    """Base64-encode a byte stream chunk by chunk, without inner padding."""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        usable = len(pending) - len(pending) % 3
+        yield base64.b64encode(pending[:usable]).decode("ascii")
+        pending = pending[usable:]
+    yield base64.b64encode(pending).decode("ascii")
+
+
+def write_binary_pool(xml_file, preset: Preset, seed: int) -> None:
+    """Write the attachment pool as Meta/Binaries, as KDBX 3.1 and KeePass
+    XML exports hold it, one chunk at a time."""
+    blob_count = count_attachment_blobs(preset)
+    if not blob_count:
+        return
+    with xml_file.element("Binaries"):
+        for blob in range(blob_count):
+            size = get_attachment_blob_size(preset=preset, seed=seed, blob=blob)
+            with xml_file.element("Binary", ID=str(blob)):
+                for text in iter_base64_chunks(
+                    iter_attachment_chunks(seed=seed, blob=blob, size=size)
+                ):
+                    xml_file.write(text)
+
+
+def build_keepass_xml_element(element):
+    """Return a copy of an entry or group the way KeePass writes it to an XML
+    export."""
+    element = copy.deepcopy(element)
+    for value in element.iter("Value"):
+        if value.attrib.pop("Protected", None) == "True":
+            value.set("ProtectInMemory", "True")
+    for times in element.iter("Times"):
+        for child in times:
+            if child.tag.endswith("Time") or child.tag == "LocationChanged":
+                child.text = format_export_time(child.text)
+    return element
+
+
+def write_keepass_xml_group(
+    xml_file,
+    preset: Preset,
+    seed: int,
+    node: int,
+    item: tuple | None,
+) -> Iterator[None]:
+    """Write group `node` and its subgroups from the (entry, node) pairs sent
+    in, and return the first pair that belongs after them.
+
+    `item` is the pair already received, or None once every entry has been
+    sent. Like `write_streamed_group`, a group lists its entries before its
+    subgroups, so the pairs must arrive in `iter_group_nodes` order.
+    """
+    group = build_group_element(preset, node)
+    apply_custom_icon(group, preset=preset, seed=seed, item=preset.entry_count + node)
+    with xml_file.element("Group"):
+        for element in build_keepass_xml_element(group):
+            xml_file.write(element)
+        while item is not None and item[1] == node:
+            xml_file.write(build_keepass_xml_element(item[0]))
+            item = yield
+        for child in get_child_groups(preset, node):
+            item = yield from write_keepass_xml_group(xml_file, preset, seed, child, item)
+    return item
+
+
+def write_keepass_xml_groups(xml_file, preset: Preset, seed: int) -> Iterator[None]:
+    item = yield
+    item = yield from write_keepass_xml_group(xml_file, preset, seed, 0, item)
+    if item is not None:
+        raise ValueError("KeePass XML exports need the entries group by group.")
+
+
+@contextlib.contextmanager
+def open_keepass_xml_export(path: pathlib.Path, preset: Preset, seed: int) -> Iterator:
+    """Stream entries into a KeePass 2 XML export.
+
+    Entries are nested into the preset's group tree as they arrive, which
+    needs them group by group, as `write_streamed_group` hands them over.
+    Custom icons and the attachment pool go into Meta, so entries keep their
+    CustomIconUUID and Binary references.
+    """
+    from lxml import etree
+    from lxml.builder import E
+
+    custom_icons = E.CustomIcons()
+    add_custom_icons(custom_icons, preset=preset, seed=seed)
+    with etree.xmlfile(str(path), encoding="utf-8") as xml_file:
+        xml_file.write_declaration(standalone=True)
+        with xml_file.element("KeePassFile"):
+            with xml_file.element("Meta"):
+                xml_file.write(
+                    E.Generator("Keyguard create_test_db.py"),
+                    E.DatabaseName(f"Keyguard test dataset: {preset.name}"),
+                    custom_icons,
+                    E.HistoryMaxItems(str(preset.history_max_items)),
+                )
+                write_binary_pool(xml_file, preset, seed)
+            with (
+                xml_file.element("Root"),
+                contextlib.closing(write_keepass_xml_groups(xml_file, preset, seed)) as groups,
+            ):
+                next(groups)
+
+                def write(entry, node: int) -> None:
+                    groups.send((entry, node))
+
+                yield write
+                with contextlib.suppress(StopIteration):
+                    groups.send(None)
+
+
+EXPORT_WRITERS = {
+    "bitwarden_json": open_bitwarden_json_export,
+    "keepass_xml": open_keepass_xml_export,
+    "csv": open_csv_export,
+}
+
+
+def check_exports(preset: Preset, exports: dict[str, pathlib.Path], writer: str) -> None:
+    if (
+        "keepass_xml" in exports and writer != "stream" and
+        count_groups(preset.group_depth, preset.group_fanout)
+    ):
+        # The pykeepass writer builds entries in index order, which interleaves
+        # the groups of a tree, while the XML nests entries inside their group.
+        raise ValueError(
+            "KeePass XML exports of presets with group trees need --writer stream, "
+            "which builds the entries group by group."
+        )
+
+
+def tokenize(text: str) -> set[str]:
+    return set(QUERY_TOKEN_PATTERN.findall(text.lower()))
+
+
+def add_posting(postings: dict, key, position: int) -> None:
+    positions = postings.get(key)
+    if positions is None:
+        positions = postings[key] = array.array("I")
+    positions.append(position)
+
+
+@dataclass
+class QueryIndex:
+    """Inverted indexes over the searchable text of a vault.
+
+    Postings hold entry positions in the order entries were added, which is
+    increasing, so every posting list is sorted and free of duplicates.
+    """
+
+    uuids: bytearray = field(default_factory=bytearray)
+    tokens: dict[str, array.array] = field(default_factory=dict)
+    field_tokens: dict[tuple[str, str], array.array] = field(default_factory=dict)
+    hosts: dict[str, array.array] = field(default_factory=dict)
+    # Tokens by first appearance, and the ids of the tokens holding each
+    # trigram of "^token$", so substring queries never scan the vocabulary.
+    token_list: list[str] = field(default_factory=list)
+    trigrams: dict[str, array.array] = field(default_factory=dict)
+
+    @property
+    def entry_count(self) -> int:
+        return len(self.uuids) // 16
+
+    def add_token(self, token: str) -> None:
+        token_id = len(self.token_list)
+        self.token_list.append(token)
+        marked = f"^{token}$"
+        for trigram in {marked[start : start + 3] for start in range(len(marked) - 2)}:
+            add_posting(self.trigrams, trigram, token_id)
+
+    def find_substring_tokens(self, text: str) -> list[str]:
+        """Return the tokens containing `text`.
+
+        Longer texts intersect the token lists of their trigrams. Texts of one
+        or two characters look through the trigrams themselves, of which there
+        are at most 38 ** 3 however large the vault is.
+        """
+        if len(text) >= 3:
+            token_lists = sorted(
+                (self.trigrams.get(text[start : start + 3], ()) for start in range(len(text) - 2)),
+                key=len,
+            )
+            token_ids = set(token_lists[0]).intersection(*token_lists[1:])
+        else:
+            token_ids = set().union(
+                *(ids for trigram, ids in self.trigrams.items() if text in trigram)
+            )
+        return [
+            self.token_list[token_id]
+            for token_id in token_ids
+            if text in self.token_list[token_id]
+        ]
+
+    def add(self, entry) -> None:
+        position = self.entry_count
+        self.uuids += base64.b64decode(entry.findtext("UUID"))
+        fields = get_string_fields(entry)
+        texts = [value for key, value in fields.items() if key not in UNSEARCHABLE_FIELDS]
+        texts.append(entry.findtext("Tags") or "")
+        for token in set().union(*map(tokenize, texts)):
+            if token not in self.tokens:
+                self.add_token(token)
+            add_posting(self.tokens, token, position)
+        for key, value in fields.items():
+            if key.startswith("field_"):
+                for token in tokenize(value):
+                    add_posting(self.field_tokens, (key, token), position)
+        uris, _ = split_export_fields(fields)
+        for host in {urllib.parse.urlsplit(uri).hostname for uri in uris} - {None}:
+            add_posting(self.hosts, host, position)
+
+    def get_uuid(self, position: int) -> str:
+        return str(uuid.UUID(bytes=bytes(self.uuids[position * 16 : position * 16 + 16])))
+
+
+def match_query(index: QueryIndex, vocabulary: Sequence[str], kind: str, text: str) -> set[int]:
+    """Return the positions of the entries that `text` finds, by index lookup.
+
+    Matching is case-insensitive and works on the alphanumeric tokens of every
+    string field except the password, plus tags:
+
+    - `token` finds entries with that exact token
+    - `prefix` finds entries with a token starting with `text`
+    - `substring` finds entries with a token containing `text`
+    - `custom_field` takes `KEY:TOKEN` and only looks at custom field `KEY`
+    - `url_host` finds entries with a URI on exactly that host
+
+    `vocabulary` is the sorted list of `index.tokens`.
+    """
+    postings = index.tokens
+    if kind == "token":
+        keys = [text]
+    elif kind == "prefix":
+        start = bisect.bisect_left(vocabulary, text)
+        stop = bisect.bisect_left(vocabulary, text + "\uffff", lo=start)
+        keys = vocabulary[start:stop]
+    elif kind == "substring":
+        keys = index.find_substring_tokens(text)
+    elif kind == "custom_field":
+        key, _, token = text.partition(":")
+        keys = [(key, token)]
+        postings = index.field_tokens
+    elif kind == "url_host":
+        keys = [text]
+        postings = index.hosts
+    else:
+        raise ValueError(f"Unknown query kind {kind!r}.")
+
+    hits = set()
+    for key in keys:
+        hits.update(postings.get(key, ()))
+    return hits
+
+
+def pick_stratified(candidates: Sequence, count: int, rng: random.Random) -> list:
+    """Pick `count` items spread evenly over `candidates`, one per stratum."""
+    if len(candidates) <= count:
+        return list(candidates)
+    stratum = len(candidates) // count
+    return [
+        candidates[ordinal * len(candidates) // count + rng.randrange(stratum)]
+        for ordinal in range(count)
+    ]
+
+
+def build_query_texts(index: QueryIndex, kind: str, count: int, rng: random.Random) -> list:
+    """Pick query texts for `kind` that span rare to common keys.
+
+    Keys are grouped by the number of entries they match and the groups are
+    sampled evenly. Most generated tokens are unique to one entry, so
+    sampling keys directly would almost only yield single-hit queries.
+    """
+    if kind == "custom_field":
+        postings = index.field_tokens
+    elif kind == "url_host":
+        postings = index.hosts
+    else:
+        postings = index.tokens
+    min_length = {"prefix": 2, "substring": 4}.get(kind, 0)
+    by_frequency = collections.defaultdict(list)
+    for key in sorted(postings):
+        if len(key) >= min_length:
+            by_frequency[len(postings[key])].append(key)
+    if not by_frequency:
+        return []
+    frequencies = sorted(by_frequency)
+    picked = pick_stratified(frequencies, count, rng)
+    picked += [frequencies[ordinal % len(frequencies)] for ordinal in range(count - len(picked))]
+
+    texts = []
+    for frequency in picked:
+        key = rng.choice(by_frequency[frequency])
+        if kind == "prefix":
+            texts.append(key[: rng.randint(1, len(key) - 1)])
+        elif kind == "substring":
+            length = rng.randint(3, min(len(key) - 1, 5))
+            start = rng.randint(1, len(key) - length)
+            texts.append(key[start : start + length])
+        elif kind == "custom_field":
+            texts.append(f"{key[0]}:{key[1]}")
+        else:
+            texts.append(key)
+    return list(dict.fromkeys(texts))
+
+
+def build_query_workload(index: QueryIndex, seed: int, queries_per_kind: int) -> dict:
+    rng = random.Random(derive_seed(seed, "queries"))
+    vocabulary = sorted(index.tokens)
+    queries = []
+    for kind in QUERY_KINDS:
+        for text in build_query_texts(index, kind=kind, count=queries_per_kind, rng=rng):
+            hits = sorted(
+                index.get_uuid(position)
+                for position in match_query(index, vocabulary, kind=kind, text=text)
+            )
+            query = {
+                "kind": kind,
+                "query": text,
+                "hit_count": len(hits),
+                "hits_sha256": hashlib.sha256("\n".join(hits).encode("ascii")).hexdigest(),
+            }
+            if len(hits) <= MAX_LISTED_QUERY_HITS:
+                query["hits"] = hits
+            queries.append(query)
+    return {
+        "version": QUERY_WORKLOAD_VERSION,
+        "seed": seed,
+        "entry_count": index.entry_count,
+        "queries": queries,
+    }
+
+
+@contextlib.contextmanager
+def open_query_workload(
+    path: pathlib.Path,
+    seed: int,
+    queries_per_kind: int,
+) -> Iterator:
+    """Index entries as they are generated, then write the query workload."""
+    index = QueryIndex()
+
+    def write(entry, node: int) -> None:
+        index.add(entry)
+
+    yield write
+    workload = build_query_workload(index, seed=seed, queries_per_kind=queries_per_kind)
+    path.write_text(json.dumps(workload, indent=2) + "\n", encoding="utf-8")
+
+
+def split_autofill_uri(uri: str) -> urllib.parse.SplitResult | None:
+    text = uri.strip()
+    if "://" not in text:
+        text = f"https://{text}"
+    try:
+        parts = urllib.parse.urlsplit(text)
+        # Reading the port raises for one that is out of range or not a number.
+        parts.port  # noqa: B018
+    except ValueError:
+        return None
+    return parts if parts.hostname else None
+
+
+def get_autofill_uri_domain(uri: str) -> str | None:
+    """Return the registrable domain a URI can match on.
+
+    Regular expression URIs are placed under the host they spell out.
+    """
+    if uri.startswith("^"):
+        uri = re.sub(r"\\(.)", r"\1", uri[1:])
+    parts = split_autofill_uri(uri)
+    return None if parts is None else get_registrable_domain(parts.hostname)
+
+
+def match_autofill_uri(uri: str, target: str, mode: str) -> bool:
+    """Return whether a login URI offers autofill for `target` under `mode`.
+
+    This follows Keyguard's URI checks without equivalent domains: `domain`
+    falls back to `host` for app URIs, and `host` ignores the port unless
+    both sides specify one.
+    """
+    if mode == "never":
+        return False
+    if mode == "exact":
+        return uri.strip().removesuffix("/") == target.strip().removesuffix("/")
+    if mode == "starts_with":
+        return target.strip().startswith(uri.strip().removesuffix("/"))
+    if mode == "regex":
+        try:
+            return re.fullmatch(uri, target, flags=re.IGNORECASE) is not None
+        except re.error:
+            return False
+
+    uri_parts = split_autofill_uri(uri)
+    target_parts = split_autofill_uri(target)
+    if uri_parts is None or target_parts is None:
+        return False
+    is_app = "androidapp" in (uri_parts.scheme, target_parts.scheme)
+    if mode == "domain" and not is_app:
+        domain = get_registrable_domain(target_parts.hostname)
+        return uri_parts.hostname == domain or uri_parts.hostname.endswith(f".{domain}")
+    if uri_parts.hostname != target_parts.hostname:
+        return False
+    return (
+        uri_parts.port is None or
+        target_parts.port is None or
+        uri_parts.port == target_parts.port
+    )
+
+
+@contextlib.contextmanager
+def open_autofill_workload(path: pathlib.Path, preset: Preset, seed: int) -> Iterator:
+    """Index login URIs by registrable domain as entries are generated, then
+    write the targets with their expected matches for every mode.
+
+    Only URIs on a target's registrable domain can match it, so each target
+    is checked against its own domain's URIs instead of the whole vault.
+    """
+    targets = build_autofill_targets(preset.autofill_target_count, seed)
+    target_domains = {get_autofill_uri_domain(target) for target in targets}
+    uris_by_domain = collections.defaultdict(list)
+
+    def write(entry, node: int) -> None:
+        uris, _ = split_export_fields(get_string_fields(entry))
+        for uri in uris:
+            domain = get_autofill_uri_domain(uri)
+            if domain in target_domains:
+                uris_by_domain[domain].append((decode_entry_uuid(entry), uri))
+
+    yield write
+    workload = []
+    for target in targets:
+        candidates = uris_by_domain[get_autofill_uri_domain(target)]
+        workload.append(
+            {
+                "target": target,
+                "matches": {
+                    mode: sorted(
+                        {
+                            uuid_text
+                            for uuid_text, uri in candidates
+                            if match_autofill_uri(uri, target, mode)
+                        }
+                    )
+                    for mode in AUTOFILL_MATCH_MODES
+                },
+            }
+        )
+    path.write_text(
+        json.dumps(
+            {
+                "version": AUTOFILL_WORKLOAD_VERSION,
+                "preset": preset.name,
+                "seed": seed,
+                "roles": count_autofill_roles(preset),
+                "targets": workload,
+            },
+            indent=2,
+        ) + "\n",
+        encoding="utf-8",
+    )
+
+
+def get_string_fields(entry) -> dict[str, str]:
+    fields: dict[str, str] = {}
+    for string_element in entry.findall("String"):
+        key_element = string_element.find("Key")
+        value_element = string_element.find("Value")
+        if key_element is None or value_element is None or key_element.text is None:
+            continue
+        fields[key_element.text] = value_element.text or ""
+    return fields
+
+
+def count_entry_uris(fields: dict[str, str]) -> int:
+    uri_count = 1 if fields.get("URL") else 0
+    for key in fields:
+        if key.startswith(URI_FIELD_PREFIX):
+            ordinal = key.removeprefix(URI_FIELD_PREFIX)
+            if ordinal.isdigit():
+                uri_count += 1
+    return uri_count
+
+
+def count_generated_custom_fields(fields: dict[str, str]) -> int:
+    return sum(
+        1
+        for key in fields
+        if key != KEYGUARD_ENTRY_TYPE_KEY and key.startswith("field_")
+    )
+
+
+def iter_document_elements(document) -> Iterator:
+    """Stream the inner XML of `document`, yielding <Meta>, each finished
+    <Group> and each top-level <Entry>.
+
+    Protected values are decrypted in document order as they complete. Every
+    yielded element is cleared once the caller moves on, and spent entries
+    are detached, so memory stays flat for any number of entries.
+    """
+    from lxml import etree
+
+    for _, element in etree.iterparse(
+        document.xml,
+        events=("end",),
+        tag=("Value", "Meta", "Entry", "Group"),
+        huge_tree=True,
+    ):
+        if element.tag == "Value":
+            if element.get("Protected") == "True":
+                element.text = document.unprotect(element.text)
+            continue
+
+        parent = element.getparent()
+        if element.tag == "Entry" and parent.tag != "Group":
+            # History revisions are checked as part of their owning entry.
+            continue
+
+        yield element
+        element.clear()
+        if element.tag == "Entry":
+            parent.remove(element)
+
+
+@dataclass
+class ValidationStats:
+    group_found: bool = False
+    entry_count: int = 0
+    login_count: int = 0
+    secure_note_count: int = 0
+    entries_with_notes: int = 0
+    login_with_max_uris: bool = False
+    wide_entry_seen: bool = False
+    low_field_entry_count: int = 0
+    attachment_count: int = 0
+    referenced_blobs: set[int] = field(default_factory=set)
+    history_max_items: int | None = None
+    revision_count: int = 0
+    deepest_history: int = 0
+    group_count: int = 0
+    deepest_group: int = 0
+    tags_seen: set[int] = field(default_factory=set)
+    # Keyed by a short password digest to keep large vaults cheap to check.
+    password_counts: collections.Counter = field(default_factory=collections.Counter)
+    weak_password_count: int = 0
+    tfa_domain_count: int = 0
+    passkey_domain_count: int = 0
+    custom_icons: set[str] = field(default_factory=set)
+    custom_icon_reference_count: int = 0
+    # Expected (key, size, SHA-256) of each entry index's oversized value.
+    oversized_values: dict[int, tuple[str, int, str]] = field(default_factory=dict)
+    oversized_value_count: int = 0
+    # Observed values of each profile distribution, when the preset has one.
+    profile_counts: dict[str, collections.Counter] = field(
+        default_factory=lambda: collections.defaultdict(collections.Counter)
+    )
+    # Entries per group UUID, for the profile's group sizes.
+    group_sizes: collections.Counter = field(default_factory=collections.Counter)
+
+
+def check_custom_icons(meta, preset: Preset, stats: ValidationStats) -> None:
+    """Collect the Meta icon list, checking each icon is a PNG of a planned size."""
+    sizes = {size for size, _ in preset.custom_icon_size_buckets}
+    for icon in meta.iterfind("CustomIcons/Icon"):
+        data = base64.b64decode(icon.findtext("Data"))
+        if not data.startswith(PNG_SIGNATURE) or data[12:16] != b"IHDR":
+            raise ValueError(f"Custom icon {icon.findtext('UUID')!r} is not a PNG.")
+        width, height = struct.unpack(">II", data[16:24])
+        if width != height or width not in sizes:
+            raise ValueError(
+                f"Custom icon {icon.findtext('UUID')!r} is {width}x{height}, outside every "
+                "configured size bucket."
+            )
+        stats.custom_icons.add(icon.findtext("UUID"))
+    if len(stats.custom_icons) != preset.custom_icon_count:
+        raise ValueError(
+            f"Expected {preset.custom_icon_count} distinct custom icons, "
+            f"found {len(stats.custom_icons)}."
+        )
+
+
+def check_custom_icon_reference(element, stats: ValidationStats) -> None:
+    reference = element.findtext("CustomIconUUID")
+    if reference is None:
+        return
+    if reference not in stats.custom_icons:
+        name = element.findtext("Name") or get_string_fields(element).get("Title")
+        raise ValueError(
+            f"{element.tag} {name!r} references missing custom icon {reference!r}."
+        )
+    stats.custom_icon_reference_count += 1
+
+
+def check_oversized_value(fields: dict[str, str], stats: ValidationStats) -> None:
+    title = fields.get("Title") or ""
+    expected = stats.oversized_values.get(int(title.rpartition("-")[2]))
+    if expected is None:
+        return
+    key, size, digest = expected
+    data = fields.get(key, "").encode("utf-8")
+    if len(data) != size or hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(
+            f"Entry {title!r} has a {len(data)}-byte {key!r} value that does not match "
+            f"its {size}-byte oversized value."
+        )
+    stats.oversized_value_count += 1
+
+
+def check_attachments(entry, title: str | None, preset: Preset, stats: ValidationStats) -> None:
+    blob_count = count_attachment_blobs(preset)
+    for binary in entry.findall("Binary"):
+        reference = binary.find("Value").get("Ref")
+        if not (reference or "").isdigit() or int(reference) >= blob_count:
+            raise ValueError(
+                f"Entry {title!r} references missing "
+                f"attachment {reference!r}."
+            )
+        stats.attachment_count += 1
+        stats.referenced_blobs.add(int(reference))
+
+
+def check_history(
+    entry,
+    fields: dict[str, str],
+    preset: Preset,
+    stats: ValidationStats,
+) -> None:
+    title = fields.get("Title")
+    revisions = entry.findall("History/Entry")
+    lowest = min(preset.history_min, preset.history_max_items)
+    highest = min(preset.history_max, preset.history_max_items)
+    if not (lowest <= len(revisions) <= highest):
+        raise ValueError(
+            f"Entry {title!r} has {len(revisions)} history revisions; expected "
+            f"between {lowest} and {highest}."
+        )
+    stats.revision_count += len(revisions)
+    stats.deepest_history = max(stats.deepest_history, len(revisions))
+
+    uuid_text = entry.findtext("UUID")
+    newer_fields = fields
+    newer_time = entry.findtext("Times/LastModificationTime")
+    # Walk from the newest revision back, comparing each with its successor.
+    for revision in reversed(revisions):
+        revision_fields = get_string_fields(revision)
+        revision_time = revision.findtext("Times/LastModificationTime")
+        if revision.findtext("UUID") != uuid_text or revision.find("History") is not None:
+            raise ValueError(f"Entry {title!r} has a malformed history revision.")
+        if revision_fields == newer_fields:
+            raise ValueError(f"Entry {title!r} has a history revision without changes.")
+        if decode_kdbx_time(revision_time) >= decode_kdbx_time(newer_time):
+            raise ValueError(f"Entry {title!r} has history revisions out of order.")
+        newer_fields = revision_fields
+        newer_time = revision_time
+
+
+def get_preset_group_depth(element, preset: Preset) -> int | None:
+    """Return how many groups below the preset group `element` sits, or None
+    when it is outside the preset's tree."""
+    for depth, group in enumerate(element.iterancestors("Group")):
+        if group.findtext("Name") == preset.name:
+            return depth
+    return None
+
+
+def check_group(group, depth: int, preset: Preset, stats: ValidationStats) -> None:
+    child_count = len(group.findall("Group"))
+    expected = preset.group_fanout if depth < preset.group_depth else 0
+    if child_count != expected:
+        raise ValueError(
+            f"Group {group.findtext('Name')!r} at depth {depth} has {child_count} "
+            f"subgroups; expected {expected}."
+        )
+    check_custom_icon_reference(group, stats=stats)
+    if depth:
+        stats.group_count += 1
+        stats.deepest_group = max(stats.deepest_group, depth)
+
+
+def check_tags(entry, title: str | None, preset: Preset, stats: ValidationStats) -> None:
+    tags = [tag for tag in (entry.findtext("Tags") or "").split(";") if tag]
+    if len(tags) > preset.tags_per_entry_max:
+        raise ValueError(
+            f"Entry {title!r} has {len(tags)} tags; expected at most "
+            f"{preset.tags_per_entry_max}."
+        )
+    for tag in tags:
+        ordinal = tag.removeprefix("tag-")
+        if not ordinal.isdigit() or int(ordinal) >= preset.tag_vocabulary:
+            raise ValueError(f"Entry {title!r} has a tag outside the vocabulary: {tag!r}.")
+        stats.tags_seen.add(int(ordinal))
+
+
+@functools.lru_cache(maxsize=1)
+def load_watchtower_domain_sets() -> tuple[frozenset[str], frozenset[str]]:
+    """`load_watchtower_domains` as sets, for checking hosts without a scan."""
+    tfa_domains, passkey_domains = load_watchtower_domains()
+    return frozenset(tfa_domains), frozenset(passkey_domains)
+
+
+def check_watchtower_fields(fields: dict[str, str], stats: ValidationStats) -> None:
+    password = fields.get("Password", "")
+    digest = hashlib.blake2b(password.encode("utf-8"), digest_size=8).digest()
+    stats.password_counts[digest] += 1
+    if is_weak_password(password):
+        stats.weak_password_count += 1
+
+    tfa_domains, passkey_domains = load_watchtower_domain_sets()
+    hosts = {
+        urllib.parse.urlsplit(value).hostname
+        for key, value in fields.items()
+        if key == "URL" or key.startswith(URI_FIELD_PREFIX)
+    }
+    if not hosts.isdisjoint(tfa_domains):
+        stats.tfa_domain_count += 1
+    if not hosts.isdisjoint(passkey_domains):
+        stats.passkey_domain_count += 1
+
+
+def build_watchtower_findings(preset: Preset, seed: int) -> dict:
+    """Return the watchtower findings a client should report for the vault."""
+    counts = count_watchtower_roles(preset)
+    return {
+        "version": WATCHTOWER_FINDINGS_VERSION,
+        "preset": preset.name,
+        "seed": seed,
+        "logins": preset.login_count,
+        "reused_passwords": {
+            "entries": counts["reused"],
+            "groups": counts["reuse_groups"],
+        },
+        "weak_passwords": counts["weak"],
+        "inactive_tfa": counts["tfa"],
+        "inactive_passkey": counts["passkey"],
+    }
+
+
+def check_watchtower_totals(preset: Preset, stats: ValidationStats) -> None:
+    counts = count_watchtower_roles(preset)
+    reused_counts = [count for count in stats.password_counts.values() if count > 1]
+    found = {
+        "reused": sum(reused_counts),
+        "reuse_groups": len(reused_counts),
+        "weak": stats.weak_password_count,
+        "tfa": stats.tfa_domain_count,
+        "passkey": stats.passkey_domain_count,
+    }
+    if found != counts:
+        raise ValueError(f"Expected watchtower findings {counts}, found {found}.")
+
+
+def count_profile_values(
+    entry,
+    fields: dict[str, str],
+    custom_field_count: int,
+    stats: ValidationStats,
+) -> None:
+    """Tally the entry's share of every profile distribution but URI counts,
+    which only logins contribute, and group sizes, which are per group."""
+    stats.profile_counts["custom_fields"][custom_field_count] += 1
+    for key, value in fields.items():
+        if key.startswith("field_"):
+            stats.profile_counts["value_length"][len(value)] += 1
+    tags = [tag for tag in (entry.findtext("Tags") or "").split(";") if tag]
+    stats.profile_counts["tags"][len(tags)] += 1
+    stats.profile_counts["history"][len(entry.findall("History/Entry"))] += 1
+
+
+def check_entry(entry, preset: Preset, stats: ValidationStats) -> None:
+    fields = get_string_fields(entry)
+    stats.entry_count += 1
+    entry_type = fields.get(KEYGUARD_ENTRY_TYPE_KEY)
+    notes = fields.get("Notes", "")
+    if notes:
+        stats.entries_with_notes += 1
+
+    check_attachments(entry, title=fields.get("Title"), preset=preset, stats=stats)
+    check_custom_icon_reference(entry, stats=stats)
+    check_history(entry, fields=fields, preset=preset, stats=stats)
+    check_tags(entry, title=fields.get("Title"), preset=preset, stats=stats)
+    if preset.oversized_value_count:
+        check_oversized_value(fields, stats=stats)
+
+    generated_custom_fields = count_generated_custom_fields(fields)
+    if preset.profile is not None:
+        count_profile_values(entry, fields, generated_custom_fields, stats=stats)
+    if not (preset.custom_field_min <= generated_custom_fields <= preset.custom_field_max):
+        raise ValueError(
+            f"Entry {fields.get('Title')!r} has {generated_custom_fields} generated custom "
+            f"fields; expected between {preset.custom_field_min} and "
+            f"{preset.custom_field_max}."
+        )
+
+    if (
+        preset.name == "5k-wide-fields" and
+        generated_custom_fields >= min(200, preset.custom_field_max)
+    ):
+        stats.wide_entry_seen = True
+    if (
+        preset.low_field_upper_bound_exclusive is not None and
+        generated_custom_fields < preset.low_field_upper_bound_exclusive
+    ):
+        stats.low_field_entry_count += 1
+
+    if entry_type == "Login":
+        stats.login_count += 1
+        if has_watchtower_roles(preset):
+            check_watchtower_fields(fields, stats=stats)
+        uri_count = count_entry_uris(fields)
+        uri_count_max = get_uri_count_max(preset)
+        if not (0 <= uri_count <= uri_count_max):
+            raise ValueError(
+                f"Entry {fields.get('Title')!r} has {uri_count} URIs; expected 0 to "
+                f"{uri_count_max}."
+            )
+        if uri_count == uri_count_max:
+            stats.login_with_max_uris = True
+        if preset.profile is not None:
+            stats.profile_counts["uris"][uri_count] += 1
+    elif entry_type == "Note":
+        stats.secure_note_count += 1
+        if "UserName" in fields:
+            raise ValueError(
+                f"Secure note {fields.get('Title')!r} should not have a username."
+            )
+        if "Password" in fields:
+            raise ValueError(
+                f"Secure note {fields.get('Title')!r} should not have a password."
+            )
+        if "URL" in fields:
+            raise ValueError(
+                f"Secure note {fields.get('Title')!r} should not have a URL."
+            )
+        if not notes:
+            raise ValueError(f"Secure note {fields.get('Title')!r} must have notes.")
+    else:
+        raise ValueError(
+            f"Entry {fields.get('Title')!r} has unsupported type marker {entry_type!r}."
+        )
+
+
+def check_totals(preset: Preset, stats: ValidationStats) -> None:
+    if not stats.group_found:
+        raise ValueError(f"Could not find top-level group {preset.name!r}.")
+    if stats.entry_count != preset.entry_count:
+        raise ValueError(
+            f"Expected {preset.entry_count} entries, found {stats.entry_count}."
+        )
+    if stats.login_count != preset.login_count:
+        raise ValueError(
+            f"Expected {preset.login_count} login entries, found {stats.login_count}."
+        )
+    if stats.secure_note_count != preset.secure_note_count:
+        raise ValueError(
+            f"Expected {preset.secure_note_count} secure notes, "
+            f"found {stats.secure_note_count}."
+        )
+    if stats.entries_with_notes <= 0:
+        raise ValueError("Expected at least one entry with notes.")
+    if preset.login_count and not stats.login_with_max_uris:
+        raise ValueError(
+            f"Expected at least one login entry with {get_uri_count_max(preset)} URIs."
+        )
+    wide_entry_planned = (
+        preset.low_field_target_count is None or
+        preset.low_field_target_count < preset.entry_count
+    )
+    if preset.name == "5k-wide-fields" and wide_entry_planned and not stats.wide_entry_seen:
+        raise ValueError(
+            "Expected at least one wide entry with hundreds of custom fields."
+        )
+    if (
+        preset.low_field_target_count is not None and
+        stats.low_field_entry_count != preset.low_field_target_count
+    ):
+        raise ValueError(
+            f"Expected {preset.low_field_target_count} entries below "
+            f"{preset.low_field_upper_bound_exclusive} custom fields, found "
+            f"{stats.low_field_entry_count}."
+        )
+    if stats.attachment_count != preset.attachment_count:
+        raise ValueError(
+            f"Expected {preset.attachment_count} attachments, "
+            f"found {stats.attachment_count}."
+        )
+    if len(stats.referenced_blobs) != count_attachment_blobs(preset):
+        raise ValueError(
+            f"Expected attachments to reference {count_attachment_blobs(preset)} pool "
+            f"entries, found {len(stats.referenced_blobs)}."
+        )
+    if stats.oversized_value_count != preset.oversized_value_count:
+        raise ValueError(
+            f"Expected {preset.oversized_value_count} oversized values, "
+            f"found {stats.oversized_value_count}."
+        )
+    if stats.history_max_items != preset.history_max_items:
+        raise ValueError(
+            f"Expected HistoryMaxItems {preset.history_max_items}, "
+            f"found {stats.history_max_items}."
+        )
+    if stats.deepest_history != min(preset.history_max, preset.history_max_items):
+        raise ValueError(
+            f"Expected an entry with {min(preset.history_max, preset.history_max_items)} "
+            f"history revisions, found at most {stats.deepest_history}."
+        )
+    group_count = count_groups(preset.group_depth, preset.group_fanout)
+    if stats.group_count != group_count:
+        raise ValueError(f"Expected {group_count} subgroups, found {stats.group_count}.")
+    if group_count and stats.deepest_group != preset.group_depth:
+        raise ValueError(
+            f"Expected subgroups {preset.group_depth} levels deep, found "
+            f"{stats.deepest_group}."
+        )
+    if len(stats.tags_seen) < min(preset.tag_vocabulary, preset.entry_count):
+        raise ValueError(
+            f"Expected at least {min(preset.tag_vocabulary, preset.entry_count)} "
+            f"distinct tags, found {len(stats.tags_seen)}."
+        )
+    if stats.custom_icon_reference_count != count_custom_icon_references(preset):
+        raise ValueError(
+            f"Expected {count_custom_icon_references(preset)} custom icon references, "
+            f"found {stats.custom_icon_reference_count}."
+        )
+    if has_watchtower_roles(preset):
+        check_watchtower_totals(preset, stats=stats)
+
+
+def check_attachment_pool(preset: Preset, binaries: Sequence) -> None:
+    """Check that every attachment payload is stored once and has a planned size."""
+    blob_count = count_attachment_blobs(preset)
+    if len(binaries) != blob_count:
+        raise ValueError(
+            f"Expected {blob_count} pooled attachments, found {len(binaries)}."
+        )
+    if len({binary.sha256 for binary in binaries}) != blob_count:
+        raise ValueError("Expected every pooled attachment to be distinct.")
+    for blob, binary in enumerate(binaries):
+        if not any(
+            min_size <= binary.size <= max_size
+            for min_size, max_size, _ in preset.attachment_size_buckets
+        ):
+            raise ValueError(
+                f"Pooled attachment {blob} has {binary.size} bytes, outside every "
+                "configured size bucket."
+            )
+
+
+def check_kdf_parameters(header, kdf: KdfSettings) -> None:
+    expected = build_kdf_parameters(kdf, salt=header.kdf_parameters.get("S", b""))
+    if header.kdf_parameters != expected:
+        found = {key: value for key, value in header.kdf_parameters.items() if key != "S"}
+        raise ValueError(f"Expected KDF parameters {asdict(kdf)}, found {found}.")
+
+
+def describe_entry(entry) -> tuple:
+    return (
+        get_string_fields(entry),
+        entry.findtext("Tags"),
+        entry.findtext("CustomIconUUID"),
+        [
+            (binary.findtext("Key"), binary.find("Value").get("Ref"))
+            for binary in entry.findall("Binary")
+        ],
+        [get_string_fields(revision) for revision in entry.findall("History/Entry")],
+    )
+
+
+def build_spot_check(preset: Preset, seed: int, entry_count: int) -> dict[str, tuple]:
+    """Rebuild a seeded sample of v2 entries, keyed by their encoded UUID."""
+    rng = random.Random(derive_seed(seed, "v2", "spot-check"))
+    expected = {}
+    for index in rng.sample(range(preset.entry_count), min(entry_count, preset.entry_count)):
+        entry = entry_at(preset, seed=seed, index=index)
+        expected[entry.findtext("UUID")] = describe_entry(entry)
+    return expected
+
+
+def check_spot_check_entry(entry, expected: dict[str, tuple]) -> None:
+    described = expected.pop(entry.findtext("UUID"), None)
+    if described is not None and describe_entry(entry) != described:
+        raise ValueError(
+            f"Entry {get_string_fields(entry).get('Title')!r} does not match entry_at()."
+        )
+
+
+def validate_database(
+    path: pathlib.Path,
+    password: str,
+    preset: Preset,
+    kdf: KdfSettings | None = None,
+    transformed_key: bytes | None = None,
+    seed: int | None = None,
+    spot_check: int = 0,
+) -> ValidationStats:
+    """Validate a saved database against `preset` and return what was counted.
+
+    With a `seed`, `spot_check` sampled entries of a v2 vault are rebuilt
+    with `entry_at` and compared field by field. Oversized values need the
+    seed; they are compared by size and SHA-256.
+    """
+    stats = ValidationStats()
+    if preset.oversized_value_count:
+        if seed is None:
+            raise ValueError("Oversized values need the seed the database was generated with.")
+        stats.oversized_values = build_oversized_value_digests(preset, seed=seed)
+    expected = {}
+    if spot_check:
+        if seed is None:
+            raise ValueError("Spot checks need the seed the database was generated with.")
+        expected = build_spot_check(preset, seed=seed, entry_count=spot_check)
+    with kdbx_stream.open_document(path, password, transformed_key) as document:
+        if kdf is not None:
+            check_kdf_parameters(document.header, kdf)
+        if document.header.major_version != 3:
+            check_attachment_pool(preset, binaries=document.binaries)
+        for element in iter_document_elements(document):
+            if element.tag == "Meta":
+                if document.header.major_version == 3:
+                    check_attachment_pool(
+                        preset, binaries=kdbx_stream.read_meta_binaries(element)
+                    )
+                stats.history_max_items = int(element.findtext("HistoryMaxItems"))
+                check_custom_icons(element, preset=preset, stats=stats)
+            elif element.tag == "Group":
+                if element.findtext("Name") == preset.name:
+                    stats.group_found = True
+                    check_group(element, depth=0, preset=preset, stats=stats)
+                    continue
+                depth = get_preset_group_depth(element, preset)
+                if depth is not None:
+                    check_group(element, depth=depth + 1, preset=preset, stats=stats)
+            elif get_preset_group_depth(element, preset) is not None:
+                check_spot_check_entry(element, expected)
+                check_entry(element, preset=preset, stats=stats)
+                if preset.profile is not None:
+                    stats.group_sizes[element.getparent().findtext("UUID")] += 1
+    check_totals(preset=preset, stats=stats)
+    if expected:
+        raise ValueError(f"Could not find {len(expected)} spot-checked entries.")
+    if preset.profile is not None:
+        group_sizes = stats.profile_counts["entries_per_group"]
+        group_sizes.update(stats.group_sizes.values())
+        group_sizes[0] += (
+            count_groups(preset.group_depth, preset.group_fanout) + 1 - len(stats.group_sizes)
+        )
+    return stats
+
+
+@dataclass
+class ManifestCounts:
+    """Entry counts and histograms gathered from the generation loop."""
+
+    entry_types: collections.Counter = field(default_factory=collections.Counter)
+    string_fields: int = 0
+    custom_fields: collections.Counter = field(default_factory=collections.Counter)
+    uris: collections.Counter = field(default_factory=collections.Counter)
+    attachments: int = 0
+    history: collections.Counter = field(default_factory=collections.Counter)
+
+    def add(self, entry, node: int) -> None:
+        fields = get_string_fields(entry)
+        uris, custom_fields = split_export_fields(fields)
+        self.entry_types[fields.get(KEYGUARD_ENTRY_TYPE_KEY)] += 1
+        self.string_fields += len(fields)
+        self.custom_fields[len(custom_fields)] += 1
+        self.uris[len(uris)] += 1
+        self.attachments += len(entry.findall("Binary"))
+        self.history[len(entry.findall("History/Entry"))] += 1
+
+    # Only keys are counted, so the stream writer can pass entries whose
+    # oversized values are still placeholders.
+    add.reads_oversized_values = False
+
+
+def compute_file_sha256(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as stream:
+        while chunk := stream.read(kdbx_stream.READ_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_manifest_path(output_path: pathlib.Path) -> pathlib.Path:
+    return output_path.with_name(f"{output_path.name}.manifest.json")
+
+
+def describe_kdf_parameters(parameters: dict) -> dict:
+    names = {uuid_bytes: name for name, uuid_bytes in kdbx_stream.KDF_UUIDS.items()}
+    described = {"kdf": names.get(parameters["$UUID"], parameters["$UUID"].hex())}
+    for key, name in KDF_PARAMETER_NAMES.items():
+        if key in parameters:
+            described[name] = parameters[key]
+    return described
+
+
+def format_histogram(counter: collections.Counter) -> dict[str, int]:
+    return {str(value): counter[value] for value in sorted(counter)}
+
+
+def measure_profile_fit(profile: Profile, counts: dict[str, collections.Counter]) -> dict:
+    """Compare the values validation observed with each profile histogram.
+
+    `distance` is the total variation distance between the bins' weights and
+    the observed shares, with values outside every bin as one more bin: 0 is
+    an exact match and 1 means no overlap at all.
+    """
+    fit = {}
+    for distribution in PROFILE_DISTRIBUTIONS:
+        histogram = getattr(profile, distribution)
+        if not histogram:
+            continue
+        observed = counts.get(distribution, collections.Counter())
+        samples = sum(observed.values()) or 1
+        total_weight = sum(weight for _, _, weight in histogram)
+        bins = {}
+        for low, high, weight in histogram:
+            bins[str(low) if low == high else f"{low}-{high}"] = (
+                weight / total_weight,
+                sum(count for value, count in observed.items() if low <= value <= high)
+                / samples,
+            )
+        outside = max(0.0, 1 - sum(share for _, share in bins.values())) if observed else 0.0
+        fit[distribution] = {
+            "samples": sum(observed.values()),
+            "distance": round(
+                (sum(abs(expected - share) for expected, share in bins.values()) + outside) / 2,
+                4,
+            ),
+            "expected_mean": round(
+                sum((low + high) / 2 * weight for low, high, weight in histogram)
+                / total_weight,
+                2,
+            ),
+            "observed_mean": round(
+                sum(value * count for value, count in observed.items()) / samples, 2
+            ),
+            "bins": {
+                name: {"expected": round(expected, 4), "observed": round(share, 4)}
+                for name, (expected, share) in bins.items()
+            },
+        }
+    return fit
+
+
+def build_fixture_manifest(
+    path: pathlib.Path,
+    preset: Preset,
+    seed: int,
+    scheme: str,
+    writer: str,
+    counts: ManifestCounts,
+    report: GenerationReport,
+) -> dict:
+    """Describe a generated database from what its generation already knows.
+
+    Only the file's header is parsed; the payload is hashed, not decrypted.
+    """
+    digest = hashlib.sha256()
+    with path.open("rb") as stream:
+        header = kdbx_stream.read_header(stream)
+        stream.seek(0)
+        while chunk := stream.read(kdbx_stream.READ_CHUNK_SIZE):
+            digest.update(chunk)
+    ciphers = {uuid_bytes: name for name, uuid_bytes in kdbx_stream.CIPHER_UUIDS.items()}
+    custom_field_count = sum(
+        fields * entries for fields, entries in counts.custom_fields.items()
+    )
+    return {
+        "version": FIXTURE_MANIFEST_VERSION,
+        "generator_version": GENERATOR_VERSION,
+        "preset": asdict(preset),
+        "seed": seed,
+        "scheme": scheme,
+        "writer": writer,
+        "format": {
+            "kdbx_version": f"{header.major_version}.{header.minor_version}",
+            "cipher": ciphers.get(header.cipher_id, header.cipher_id.hex()),
+            "compression": "gzip" if header.compressed else "none",
+        },
+        "kdf": describe_kdf_parameters(header.kdf_parameters),
+        "file": {"bytes": path.stat().st_size, "sha256": digest.hexdigest()},
+        "counts": {
+            "entries": sum(counts.entry_types.values()),
+            "logins": counts.entry_types["Login"],
+            "secure_notes": counts.entry_types["Note"],
+            "groups": count_groups(preset.group_depth, preset.group_fanout) + 1,
+            "string_fields": counts.string_fields,
+            "custom_fields": custom_field_count,
+            "uris": sum(uris * entries for uris, entries in counts.uris.items()),
+            "attachments": counts.attachments,
+            "attachment_blobs": count_attachment_blobs(preset),
+            "history_revisions": sum(
+                revisions * entries for revisions, entries in counts.history.items()
+            ),
+            "custom_icons": preset.custom_icon_count,
+            "custom_icon_references": count_custom_icon_references(preset),
+            "oversized_values": preset.oversized_value_count,
+            "oversized_value_bytes": sum(
+                get_oversized_value_size(preset, seed=seed, value=value)
+                for value in range(preset.oversized_value_count)
+            ),
+        },
+        "histograms": {
+            "custom_fields": format_histogram(counts.custom_fields),
+            "uris": format_histogram(counts.uris),
+            "history": format_histogram(counts.history),
+        },
+        "timings": report.phases,
+    }
+
+
+def get_raw_xml_gzip_path(raw_xml_path: pathlib.Path) -> pathlib.Path:
+    return raw_xml_path.with_name(f"{raw_xml_path.name}.gz")
+
+
+def write_raw_xml(
+    database_path: pathlib.Path,
+    password: str,
+    transformed_key: bytes,
+    xml_path: pathlib.Path,
+    gzip_path: pathlib.Path,
+) -> dict:
+    """Copy the inner XML document of a saved database, byte for byte, to
+    `xml_path` and gzip-compressed to `gzip_path`.
+
+    Protected values stay encrypted with the inner stream cipher, whose
+    settings are returned for the manifest along with the document digest.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with contextlib.ExitStack() as stack:
+        document = stack.enter_context(
+            kdbx_stream.open_document(database_path, password, transformed_key)
+        )
+        xml_file = stack.enter_context(xml_path.open("wb"))
+        # A zero mtime keeps the compressed file reproducible.
+        gzip_file = stack.enter_context(gzip.GzipFile(gzip_path, "wb", mtime=0))
+        while chunk := document.xml.read(kdbx_stream.READ_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+            xml_file.write(chunk)
+            gzip_file.write(chunk)
+    return {
+        "bytes": size,
+        "sha256": digest.hexdigest(),
+        "gzip_bytes": gzip_path.stat().st_size,
+        "inner_stream_id": document.inner_stream_id,
+        "inner_stream_key": base64.b64encode(document.inner_stream_key).decode("ascii"),
+    }
+
+
+def resolve_writer(
+    preset: Preset,
+    writer: str | None,
+    scheme: str | None,
+) -> tuple[str, str]:
+    """Return the writer and scheme to use, filling in the defaults.
+
+    pykeepass holds the whole attachment pool and every value in memory, so
+    presets with attachments or oversized values default to the stream writer
+    and the v2 scheme it needs. `check_writer` rejects any other choice.
+    """
+    if (
+        writer is None and scheme in (None, "v2") and
+        (preset.attachment_count or preset.oversized_value_count)
+    ):
+        return "stream", "v2"
+    return writer or DEFAULT_WRITER, scheme or DEFAULT_GENERATION_SCHEME
+
+
+def check_writer(preset: Preset, writer: str, scheme: str) -> None:
+    if writer == "stream" and scheme != "v2":
+        raise ValueError("The stream writer needs --scheme v2.")
+    if writer != "stream" and (preset.attachment_count or preset.oversized_value_count):
+        raise ValueError(
+            f"Preset {preset.name} has attachments or oversized values, which the "
+            f"{writer} writer holds in memory all at once. Use --writer stream with "
+            "--scheme v2, which writes them one at a time; the v1 scheme only runs "
+            "on the pykeepass writer."
+        )
+
+
+def get_database_metadata(preset: Preset) -> dict[str, str]:
+    return {
+        "name": f"Keyguard test dataset: {preset.name}",
+        "description": f"Preset {preset.name} generated by scripts/keepass/create_test_db.py.",
+        "default_username": "test-user",
+    }
+
+
+def write_pykeepass_database(
+    path: pathlib.Path,
+    password: str,
+    preset: Preset,
+    seed: int,
+    kdf: KdfSettings | None,
+    workers: int,
+    report: GenerationReport,
+    scheme: str,
+    exporters: Sequence,
+) -> bytes:
+    """Build the vault in a pykeepass tree, save it and return its transformed key."""
+    with report.phase("open"):
+        kp = open_blank_database(path, password=password)
+    metadata = get_database_metadata(preset)
+    kp.database_name = metadata["name"]
+    kp.database_description = metadata["description"]
+    kp.default_username = metadata["default_username"]
+    kp.tree.find("Meta/HistoryMaxItems").text = str(preset.history_max_items)
+    create_entries(
+        kp=kp,
+        preset=preset,
+        seed=seed,
+        workers=workers,
+        report=report,
+        scheme=scheme,
+        exporters=exporters,
+    )
+    return save_database(kp, password=password, kdf=kdf, report=report)
+
+
+def build_meta_element(preset: Preset):
+    from lxml.builder import E
+
+    metadata = get_database_metadata(preset)
+    changed = encode_kdbx_time(build_timestamp(0))
+    return E.Meta(
+        E.Generator("Keyguard create_test_db.py"),
+        E.DatabaseName(metadata["name"]),
+        E.DatabaseNameChanged(changed),
+        E.DatabaseDescription(metadata["description"]),
+        E.DatabaseDescriptionChanged(changed),
+        E.DefaultUserName(metadata["default_username"]),
+        E.DefaultUserNameChanged(changed),
+        E.MemoryProtection(
+            E.ProtectTitle("False"),
+            E.ProtectUserName("False"),
+            E.ProtectPassword("True"),
+            E.ProtectURL("False"),
+            E.ProtectNotes("False"),
+        ),
+        E.CustomIcons(),
+        E.RecycleBinEnabled("False"),
+        E.HistoryMaxItems(str(preset.history_max_items)),
+        E.HistoryMaxSize("-1"),
+    )
+
+
+def build_root_group_element(preset: Preset):
+    from lxml.builder import E
+
+    return E.Group(
+        E.UUID(
+            encode_kdbx_uuid(uuid.uuid5(uuid.NAMESPACE_URL, f"keyguard/{preset.name}/root"))
+        ),
+        E.Name("Root"),
+        build_times_element(build_timestamp(0)),
+        E.IsExpanded("True"),
+    )
+
+
+def protect_values(element, protect) -> None:
+    """Encrypt the protected values below `element` in place, in document order."""
+    for value in element.iter("Value"):
+        if value.get("Protected") == "True":
+            value.text = protect(value.text or "")
+
+
+def write_streamed_group(
+    xml_file,
+    writer: kdbx_stream.KdbxWriter,
+    preset: Preset,
+    seed: int,
+    node: int,
+    entries: Iterator,
+    exporters: Sequence,
+) -> None:
+    """Write group `node` with its entries, then its subgroups, taking the
+    entries from `entries` in `iter_group_nodes` order.
+
+    Oversized values arrive as placeholders and are written chunk by chunk.
+    Exporters get a copy with the value filled in unless their
+    `reads_oversized_values` attribute is false.
+    """
+    group = build_group_element(preset, node)
+    apply_custom_icon(group, preset=preset, seed=seed, item=preset.entry_count + node)
+    with xml_file.element("Group"):
+        for element in group:
+            xml_file.write(element)
+        indexes = get_group_entries(preset, seed, node)
+        for index, entry in zip(indexes, itertools.islice(entries, len(indexes))):
+            value = get_entry_oversized_value(preset, index)
+            filled_entry = None
+            for export in exporters:
+                if value is None or not getattr(export, "reads_oversized_values", True):
+                    export(entry, node)
+                    continue
+                if filled_entry is None:
+                    filled_entry = copy.deepcopy(entry)
+                    apply_oversized_value(filled_entry, preset=preset, seed=seed, index=index)
+                export(filled_entry, node)
+            del filled_entry
+            protect_values(entry, writer.protect)
+            if value is None:
+                xml_file.write(entry)
+            else:
+                write_oversized_entry(xml_file, entry, preset, seed, value)
+        for child in get_child_groups(preset, node):
+            write_streamed_group(xml_file, writer, preset, seed, child, entries, exporters)
+
+
+def write_streamed_database(
+    path: pathlib.Path,
+    password: str,
+    preset: Preset,
+    seed: int,
+    kdf: KdfSettings | None,
+    workers: int,
+    report: GenerationReport,
+    scheme: str,
+    exporters: Sequence,
+) -> bytes:
+    """Write the preset's v2 vault with `kdbx_stream.KdbxWriter` and return
+    its transformed key.
+
+    Each group's entries are built with `entry_at` just before they are
+    written, group by group, so neither the XML tree nor the serialized
+    document is ever held in memory. Oversized values are written chunk by
+    chunk. Without `kdf`, the Argon2d defaults are used.
+    """
+    from lxml import etree
+    from lxml.builder import E
+
+    kdf = kdf or KdfSettings(
+        kdf="argon2d",
+        rounds=DEFAULT_ARGON2_ITERATIONS,
+        memory_mib=DEFAULT_ARGON2_MEMORY_MIB,
+        parallelism=DEFAULT_ARGON2_PARALLELISM,
+    )
+    parameters = build_kdf_parameters(kdf, salt=os.urandom(32))
+    with report.phase("kdf"):
+        transformed_key = kdbx_stream.transform_key(
+            parameters,
+            kdbx_stream.compute_composite_key(password),
+        )
+
+    group_entries = (get_group_entries(preset, seed, node) for node in iter_group_nodes(preset))
+    entries = iter_shard_elements(
+        iter_counter_shard_entries,
+        shards=(
+            dict(
+                preset=preset,
+                seed=seed,
+                start=start,
+                stop=min(start + SHARD_SIZE * indexes.step, indexes.stop),
+                step=indexes.step,
+                oversized_values=False,
+            )
+            for indexes in group_entries
+            for start in range(indexes.start, indexes.stop, SHARD_SIZE * indexes.step)
+        ),
+        workers=workers,
+    )
+    with kdbx_stream.open_writer(path, transformed_key, kdf_parameters=parameters) as writer:
+        # Compression, encryption and block writes run inside the other phases
+        # and are reported as phases of their own.
+        report.add_nested(None, writer.take_timings())
+        with report.phase("attachments"):
+            for blob in range(count_attachment_blobs(preset)):
+                size = get_attachment_blob_size(preset=preset, seed=seed, blob=blob)
+                writer.add_binary(size, iter_attachment_chunks(seed=seed, blob=blob, size=size))
+        report.add_nested("attachments", writer.take_timings())
+        with report.phase("icons"):
+            meta = build_meta_element(preset)
+            add_custom_icons(meta.find("CustomIcons"), preset=preset, seed=seed)
+        with report.phase("build"), etree.xmlfile(writer, encoding="utf-8") as xml_file:
+            xml_file.write_declaration(standalone=True)
+            with xml_file.element("KeePassFile"):
+                xml_file.write(meta)
+                with xml_file.element("Root"):
+                    with xml_file.element("Group"):
+                        for element in build_root_group_element(preset):
+                            xml_file.write(element)
+                        write_streamed_group(
+                            xml_file, writer, preset, seed, 0, entries, exporters,
+                        )
+                    xml_file.write(E.DeletedObjects())
+        report.add_nested("build", writer.take_timings())
+    report.add_nested(None, writer.take_timings())
+    return transformed_key
+
+
+def get_spot_check_entries(scheme: str, spot_check: int | None) -> int:
+    if scheme != "v2":
+        if spot_check:
+            raise ValueError("Spot checks need --scheme v2.")
+        return 0
+    return DEFAULT_SPOT_CHECK_ENTRIES if spot_check is None else spot_check
+
+
+def generate_database(
+    output_path: pathlib.Path,
+    password: str,
+    preset: Preset,
+    seed: int,
+    overwrite: bool,
+    workers: int = 1,
+    kdf: KdfSettings | None = None,
+    report: GenerationReport | None = None,
+    scheme: str = DEFAULT_GENERATION_SCHEME,
+    spot_check: int | None = None,
+    exports: dict[str, pathlib.Path] | None = None,
+    queries_per_kind: int = 0,
+    raw_xml_path: pathlib.Path | None = None,
+    writer: str = DEFAULT_WRITER,
+) -> None:
+    """Generate, save and validate a database, then move it to `output_path`.
+
+    `exports` maps `EXPORT_WRITERS` formats to paths. Each export is written
+    from the same generation loop and only moved into place once the database
+    has been validated. With `queries_per_kind`, a search workload is written
+    to `<output>.queries.json` the same way, as is `<output>.autofill.json`
+    for presets with autofill targets. `<output>.manifest.json` is always
+    written, from counts gathered in that loop. With `raw_xml_path`, the
+    saved file's inner XML is also written there, and gzipped next to it.
+    """
+    load_pykeepass()
+    report = report or GenerationReport()
+    exports = exports or {}
+    check_writer(preset, writer=writer, scheme=scheme)
+    check_exports(preset, exports, writer=writer)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if output_path.exists() and not overwrite:
+        raise FileExistsError(
+            f"Output file already exists: {output_path}. Pass --overwrite to replace it."
+        )
+
+    temp_file = tempfile.NamedTemporaryFile(
+        prefix=f"{preset.name}-",
+        suffix=".kdbx",
+        dir=output_path.parent,
+        delete=False,
+    )
+    temp_file.close()
+    temp_path = pathlib.Path(temp_file.name)
+    queries_path = output_path.with_name(f"{output_path.name}.queries.json")
+    autofill_path = output_path.with_name(f"{output_path.name}.autofill.json")
+    manifest_path = get_manifest_path(output_path)
+    sidecar_paths = [
+        manifest_path,
+        *([queries_path] if queries_per_kind else []),
+        *([autofill_path] if preset.autofill_target_count else []),
+        *(
+            [raw_xml_path, get_raw_xml_gzip_path(raw_xml_path)]
+            if raw_xml_path is not None
+            else []
+        ),
+    ]
+    temp_exports = {
+        export_path: export_path.with_name(f".{export_path.name}.{os.getpid()}.tmp")
+        for export_path in (*exports.values(), *sidecar_paths)
+    }
+
+    try:
+        counts = ManifestCounts()
+        with contextlib.ExitStack() as stack:
+            exporters = [counts.add]
+            for export_format, export_path in exports.items():
+                export_path.parent.mkdir(parents=True, exist_ok=True)
+                exporters.append(
+                    stack.enter_context(
+                        EXPORT_WRITERS[export_format](
+                            temp_exports[export_path], preset, seed=seed
+                        )
+                    )
+                )
+            if queries_per_kind:
+                exporters.append(
+                    stack.enter_context(
+                        open_query_workload(
+                            temp_exports[queries_path],
+                            seed=seed,
+                            queries_per_kind=queries_per_kind,
+                        )
+                    )
+                )
+            if preset.autofill_target_count:
+                exporters.append(
+                    stack.enter_context(
+                        open_autofill_workload(temp_exports[autofill_path], preset, seed=seed)
+                    )
+                )
+            write_database = (
+                write_streamed_database if writer == "stream" else write_pykeepass_database
+            )
+            transformed_key = write_database(
+                temp_path,
+                password=password,
+                preset=preset,
+                seed=seed,
+                kdf=kdf,
+                workers=workers,
+                report=report,
+                scheme=scheme,
+                exporters=exporters,
+            )
+
+        # Validate the saved file rather than the in-memory entry objects. This
+        # decrypts the file once and streams its XML.
+        with report.phase("validate"):
+            stats = validate_database(
+                path=temp_path,
+                password=password,
+                preset=preset,
+                kdf=kdf,
+                transformed_key=transformed_key,
+                seed=seed,
+                spot_check=get_spot_check_entries(scheme, spot_check),
+            )
+        manifest = build_fixture_manifest(
+            temp_path,
+            preset=preset,
+            seed=seed,
+            scheme=scheme,
+            writer=writer,
+            counts=counts,
+            report=report,
+        )
+        if preset.profile is not None:
+            manifest["profile_fit"] = measure_profile_fit(
+                preset.profile, counts=stats.profile_counts
+            )
+        if raw_xml_path is not None:
+            raw_xml_path.parent.mkdir(parents=True, exist_ok=True)
+            raw_xml = write_raw_xml(
+                temp_path,
+                password=password,
+                transformed_key=transformed_key,
+                xml_path=temp_exports[raw_xml_path],
+                gzip_path=temp_exports[get_raw_xml_gzip_path(raw_xml_path)],
+            )
+            manifest["raw_xml"] = {
+                "path": raw_xml_path.name,
+                "gzip_path": get_raw_xml_gzip_path(raw_xml_path).name,
+                **raw_xml,
+            }
+        temp_exports[manifest_path].write_text(
+            json.dumps(manifest, indent=2) + "\n",
+            encoding="utf-8",
+        )
+
+        if output_path.exists():
+            output_path.unlink()
+        os.replace(temp_path, output_path)
+        for export_path, temp_export_path in temp_exports.items():
+            os.replace(temp_export_path, export_path)
+    except Exception:
+        for path in (temp_path, *temp_exports.values()):
+            if path.exists():
+                path.unlink()
+        raise
+
+
+def build_cache_key(
+    preset: Preset,
+    seed: int,
+    password: str,
+    kdf: KdfSettings | None,
+    scheme: str = DEFAULT_GENERATION_SCHEME,
+    writer: str = DEFAULT_WRITER,
+) -> str:
+    material = {
+        "generator_version": GENERATOR_VERSION,
+        "scheme": scheme,
+        "preset": asdict(preset),
+        "seed": seed,
+        "password": password,
+        "kdf": None if kdf is None else asdict(kdf),
+    }
+    if kdf is None:
+        # The default KDF settings come from the pykeepass blank database.
+        material["pykeepass"] = importlib.metadata.version("pykeepass")
+    if writer != DEFAULT_WRITER:
+        # Keeps the keys of existing pykeepass entries unchanged.
+        material["writer"] = writer
+    encoded = json.dumps(material, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def place_file(source: pathlib.Path, target: pathlib.Path, link: bool) -> None:
+    temp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        if link:
+            try:
+                os.link(source, temp_path)
+            except OSError:
+                shutil.copyfile(source, temp_path)
+        else:
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def get_cache_entry_size(entry: pathlib.Path) -> int:
+    return sum(path.stat().st_size for path in entry.iterdir() if path.is_file())
+
+
+def evict_cache_entries(cache_dir: pathlib.Path, max_bytes: int, keep: pathlib.Path) -> None:
+    entries = sorted(
+        (path for path in cache_dir.iterdir() if path.is_dir() and path != keep),
+        key=lambda path: path.stat().st_mtime,
+    )
+    total = get_cache_entry_size(keep) + sum(get_cache_entry_size(path) for path in entries)
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        total -= get_cache_entry_size(entry)
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+def restore_cached_database(
+    cache_dir: pathlib.Path,
+    key: str,
+    output_path: pathlib.Path,
+    link: bool,
+) -> bool:
+    entry = cache_dir / key
+    cached_database = entry / CACHE_DATABASE_NAME
+    cached_manifest = entry / CACHE_MANIFEST_NAME
+    if not cached_database.is_file() or not cached_manifest.is_file():
+        return False
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    place_file(cached_database, output_path, link=link)
+    place_file(cached_manifest, get_manifest_path(output_path), link=False)
+    # Directory mtimes order the entries for LRU eviction.
+    os.utime(entry)
+    return True
+
+
+def store_cached_database(
+    cache_dir: pathlib.Path,
+    key: str,
+    database_path: pathlib.Path,
+    link: bool,
+    max_bytes: int,
+) -> None:
+    entry = cache_dir / key
+    entry.mkdir(parents=True, exist_ok=True)
+    place_file(database_path, entry / CACHE_DATABASE_NAME, link=link)
+    place_file(get_manifest_path(database_path), entry / CACHE_MANIFEST_NAME, link=False)
+    os.utime(entry)
+    evict_cache_entries(cache_dir, max_bytes=max_bytes, keep=entry)
+
+
+def find_vault_entries(root) -> list:
+    """Return the entries below `root`, without history revisions."""
+    return root.xpath("/KeePassFile/Root//Group/Entry")
+
+
+def find_latest_time(root) -> datetime:
+    seconds = max(
+        decode_kdbx_time(text) for text in root.xpath("//Times/LastModificationTime/text()")
+    )
+    return KDBX_EPOCH + timedelta(seconds=seconds)
+
+
+def get_history_max_items(root) -> int:
+    text = root.findtext("Meta/HistoryMaxItems")
+    return DEFAULT_HISTORY_MAX_ITEMS if text is None else int(text)
+
+
+def set_entry_times(entry, timestamp: datetime, *names: str) -> None:
+    encoded = encode_kdbx_time(timestamp)
+    for name in names:
+        entry.find(f"Times/{name}").text = encoded
+
+
+def append_group_entry(group, entry) -> None:
+    """Add `entry` to `group`, keeping entries ahead of subgroups."""
+    subgroup = group.find("Group")
+    if subgroup is None:
+        group.append(entry)
+    else:
+        subgroup.addprevious(entry)
+
+
+def push_history(entry, max_items: int) -> None:
+    """Store the current state of `entry` as its newest history revision.
+
+    The oldest revisions are dropped beyond `max_items`; a negative value
+    keeps them all, as in KeePass.
+    """
+    from lxml.builder import E
+
+    revision = copy.deepcopy(entry)
+    revision_history = revision.find("History")
+    if revision_history is not None:
+        revision.remove(revision_history)
+    history = entry.find("History")
+    if history is None:
+        history = E.History()
+        entry.append(history)
+    history.append(revision)
+    if max_items >= 0:
+        for stale in history.findall("Entry")[: max(len(history) - max_items, 0)]:
+            history.remove(stale)
+
+
+def edit_entry(
+    entry,
+    index: int,
+    timestamp: datetime,
+    rng: random.Random,
+    history_max_items: int,
+) -> str:
+    """Edit one field of `entry` after backing it up to its history.
+
+    Returns the key of the changed field.
+    """
+    push_history(entry, max_items=history_max_items)
+    key = mutate_revision(entry, index=index, rng=rng)
+    set_entry_times(entry, timestamp, "LastModificationTime", "LastAccessTime")
+    return key
+
+
+def delete_entry(root, entry, timestamp: datetime) -> None:
+    from lxml.builder import E
+
+    entry.getparent().remove(entry)
+    root.find("Root/DeletedObjects").append(
+        E.DeletedObject(
+            E.UUID(entry.findtext("UUID")),
+            E.DeletionTime(encode_kdbx_time(timestamp)),
+        )
+    )
+
+
+def move_entry(entry, target, timestamp: datetime) -> None:
+    entry.getparent().remove(entry)
+    append_group_entry(target, entry)
+    set_entry_times(entry, timestamp, "LocationChanged")
+
+
+def build_added_entry(
+    template,
+    seed: int,
+    step: int,
+    ordinal: int,
+    timestamp: datetime,
+    rng: random.Random,
+):
+    """Derive a new entry from `template` with its own UUID, title and password."""
+    entry = copy.deepcopy(template)
+    history = entry.find("History")
+    if history is not None:
+        entry.remove(history)
+    entry.find("UUID").text = encode_kdbx_uuid(
+        uuid.uuid5(uuid.NAMESPACE_URL, f"keyguard/mutate/{seed}/{step}/{ordinal}"),
+    )
+    entry.replace(entry.find("Times"), build_times_element(timestamp))
+    set_string_field(entry, "Title", f"Added {step:03d}-{ordinal:03d}")
+    if entry.find("String[Key='Password']") is not None:
+        set_string_field(entry, "Password", build_password(rng=rng, index=ordinal))
+    return entry
+
+
+def pick_move_target(
+    groups: Sequence,
+    group_positions: dict,
+    source,
+    rng: random.Random,
+):
+    """Pick a group other than `source` uniformly, without copying `groups`."""
+    position = rng.randrange(len(groups) - 1)
+    if position >= group_positions[source]:
+        position += 1
+    return groups[position]
+
+
+def apply_mutation_step(
+    tree,
+    seed: int,
+    step: int,
+    timestamp: datetime,
+    counts: dict[str, int],
+) -> dict:
+    """Apply one snapshot's changes to `tree` and return its change log entry.
+
+    Edited, deleted and moved entries are distinct; entries added in this
+    step are left alone until the next one.
+    """
+    rng = random.Random(derive_seed(seed, "mutate", step))
+    root = tree.getroot()
+    entries = find_vault_entries(root)
+    changed_count = counts["edits"] + counts["deletions"] + counts["moves"]
+    if changed_count > len(entries):
+        raise ValueError(
+            f"Snapshot {step} changes {changed_count} entries, "
+            f"but the vault only has {len(entries)}."
+        )
+    groups = root.xpath("/KeePassFile/Root//Group")
+    if counts["moves"] and len(groups) < 2:
+        raise ValueError("Moving entries needs at least two groups.")
+    group_positions = {group: position for position, group in enumerate(groups)}
+
+    positions = rng.sample(range(len(entries)), changed_count)
+    edit_positions = positions[: counts["edits"]]
+    delete_positions = positions[counts["edits"] : counts["edits"] + counts["deletions"]]
+    move_positions = positions[counts["edits"] + counts["deletions"] :]
+    history_max_items = get_history_max_items(root)
+    changes = {"edited": [], "added": [], "deleted": [], "moved": []}
+
+    for position in edit_positions:
+        entry = entries[position]
+        key = edit_entry(
+            entry,
+            index=position,
+            timestamp=timestamp,
+            rng=rng,
+            history_max_items=history_max_items,
+        )
+        changes["edited"].append({"uuid": decode_entry_uuid(entry), "field": key})
+
+    for ordinal in range(counts["additions"]):
+        template = entries[rng.randrange(len(entries))]
+        entry = build_added_entry(
+            template,
+            seed=seed,
+            step=step,
+            ordinal=ordinal,
+            timestamp=timestamp,
+            rng=rng,
+        )
+        group = template.getparent()
+        append_group_entry(group, entry)
+        changes["added"].append(
+            {"uuid": decode_entry_uuid(entry), "group": decode_entry_uuid(group)},
+        )
+
+    for position in delete_positions:
+        entry = entries[position]
+        delete_entry(root, entry, timestamp)
+        changes["deleted"].append(decode_entry_uuid(entry))
+
+    for position in move_positions:
+        entry = entries[position]
+        source = entry.getparent()
+        target = pick_move_target(groups, group_positions, source=source, rng=rng)
+        move_entry(entry, target, timestamp)
+        changes["moved"].append(
+            {
+                "uuid": decode_entry_uuid(entry),
+                "from": decode_entry_uuid(source),
+                "to": decode_entry_uuid(target),
+            }
+        )
+    return changes
+
+
+def check_snapshot(
+    path: pathlib.Path,
+    password: str,
+    transformed_key: bytes,
+    expected: dict[str, dict[str, str]],
+    entry_count: int,
+) -> None:
+    """Check that a saved snapshot holds `entry_count` entries and that the
+    entries in `expected` carry exactly those string fields."""
+    expected = dict(expected)
+    found = 0
+    with kdbx_stream.open_document(path, password, transformed_key) as document:
+        for element in iter_document_elements(document):
+            if element.tag != "Entry":
+                continue
+            found += 1
+            fields = expected.pop(decode_entry_uuid(element), None)
+            if fields is not None and fields != get_string_fields(element):
+                raise ValueError(f"{path.name}: {element.findtext('UUID')} does not match.")
+    if found != entry_count:
+        raise ValueError(f"{path.name}: expected {entry_count} entries, found {found}.")
+    if expected:
+        raise ValueError(f"{path.name}: {len(expected)} changed entries are missing.")
+
+
+def mutate_database(
+    input_path: pathlib.Path,
+    output_dir: pathlib.Path,
+    password: str,
+    seed: int,
+    snapshot_count: int,
+    counts: dict[str, int],
+    overwrite: bool = False,
+) -> dict:
+    """Write `snapshot_count` cumulative snapshots of `input_path` and return
+    the change log.
+
+    Each snapshot is the previous one plus `counts` edits, additions,
+    deletions and moves. The input's KDF settings and transformed key are
+    reused, so the KDF only runs when the input is opened.
+    """
+    paths = [output_dir / f"snapshot-{step:03d}.kdbx" for step in range(1, snapshot_count + 1)]
+    log_path = output_dir / "changes.json"
+    existing = [path for path in (*paths, log_path) if path.exists()]
+    if existing and not overwrite:
+        raise ValueError(
+            f"Output file already exists: {existing[0]}. Pass --overwrite to replace it."
+        )
+
+    kp = open_database(input_path, password=password)
+    transformed_key = kp.transformed_key
+    start_time = find_latest_time(kp.tree.getroot())
+    output_dir.mkdir(parents=True, exist_ok=True)
+    snapshots = []
+    for step, path in enumerate(paths, start=1):
+        timestamp = start_time + SNAPSHOT_INTERVAL * step
+        changes = apply_mutation_step(
+            kp.tree,
+            seed=seed,
+            step=step,
+            timestamp=timestamp,
+            counts=counts,
+        )
+        entries = find_vault_entries(kp.tree.getroot())
+        changed = {item["uuid"] for item in (*changes["edited"], *changes["added"])}
+        expected = {
+            uuid_text: get_string_fields(entry)
+            for entry in entries
+            if (uuid_text := decode_entry_uuid(entry)) in changed
+        }
+        kp.save(str(path), transformed_key=transformed_key)
+        check_snapshot(
+            path,
+            password=password,
+            transformed_key=transformed_key,
+            expected=expected,
+            entry_count=len(entries),
+        )
+        snapshots.append(
+            {
+                "snapshot": step,
+                "file": path.name,
+                "time": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "entry_count": len(entries),
+                **changes,
+            }
+        )
+
+    change_log = {
+        "version": MUTATION_LOG_VERSION,
+        "input": input_path.name,
+        "seed": seed,
+        "snapshots": snapshots,
+    }
+    log_path.write_text(json.dumps(change_log, indent=2) + "\n", encoding="utf-8")
+    return change_log
+
+
+def count_replica_conflicts(change_count: int, ratios: dict[str, float]) -> dict[str, int]:
+    counts = {kind: round(change_count * ratios[kind]) for kind in REPLICA_CONFLICTS}
+    if sum(counts.values()) > change_count:
+        raise ValueError("Replica conflict ratios add up to more than 1.")
+    return counts
+
+
+def plan_replica_changes(
+    entry_count: int,
+    change_count: int,
+    conflict_counts: dict[str, int],
+    rng: random.Random,
+) -> list[dict]:
+    """Pick the entries each replica changes.
+
+    Every replica changes `change_count` entries. Conflicting entries are
+    changed on both sides; the rest are split between the replicas.
+    """
+    own_count = change_count - sum(conflict_counts.values())
+    needed = change_count + own_count
+    if needed > entry_count:
+        raise ValueError(
+            f"The replicas change {needed} entries, but the vault only has {entry_count}."
+        )
+    positions = iter(rng.sample(range(entry_count), needed))
+    plan = []
+    for conflict, count in conflict_counts.items():
+        for _ in range(count):
+            changes = list(REPLICA_CONFLICTS[conflict])
+            rng.shuffle(changes)
+            plan.append(
+                {
+                    "position": next(positions),
+                    "conflict": conflict,
+                    "changes": dict(zip(REPLICA_NAMES, changes)),
+                    "newer": rng.choice(REPLICA_NAMES),
+                }
+            )
+    for replica in REPLICA_NAMES:
+        for ordinal in range(own_count):
+            changes = dict.fromkeys(REPLICA_NAMES)
+            changes[replica] = REPLICA_CHANGE_KINDS[ordinal % len(REPLICA_CHANGE_KINDS)]
+            plan.append(
+                {
+                    "position": next(positions),
+                    "conflict": None,
+                    "changes": changes,
+                    "newer": replica,
+                }
+            )
+    return plan
+
+
+def apply_replica_changes(
+    tree,
+    replica: str,
+    plan: Sequence[dict],
+    start_time: datetime,
+    rng: random.Random,
+) -> dict[str, datetime]:
+    """Apply `replica`'s side of `plan` to `tree` and return its deletion
+    times by entry UUID."""
+    root = tree.getroot()
+    entries = find_vault_entries(root)
+    groups = root.xpath("/KeePassFile/Root//Group")
+    group_positions = {group: position for position, group in enumerate(groups)}
+    history_max_items = get_history_max_items(root)
+    deleted = {}
+    for item in plan:
+        change = item["changes"][replica]
+        if change is None:
+            continue
+        entry = entries[item["position"]]
+        # The newer side of a conflict changes the entry an hour later.
+        timestamp = start_time + SNAPSHOT_INTERVAL * (2 if item["newer"] == replica else 1)
+        if change == "edit":
+            edit_entry(
+                entry,
+                index=item["position"],
+                timestamp=timestamp,
+                rng=rng,
+                history_max_items=history_max_items,
+            )
+        elif change == "delete":
+            delete_entry(root, entry, timestamp)
+            deleted[decode_entry_uuid(entry)] = timestamp
+        else:
+            source = entry.getparent()
+            target = pick_move_target(groups, group_positions, source=source, rng=rng)
+            move_entry(entry, target, timestamp)
+    return deleted
+
+
+def read_entry_time(entry, name: str) -> datetime:
+    return KDBX_EPOCH + timedelta(seconds=decode_kdbx_time(entry.findtext(f"Times/{name}")))
+
+
+def build_fields_digest(fields: dict[str, str]) -> str:
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def merge_replica_entry(
+    versions: Sequence,
+    deletion_times: Sequence[datetime | None],
+    history_max_items: int,
+) -> dict:
+    """Merge one entry the way KeePass synchronizes two databases.
+
+    A deletion wins unless the surviving version was modified after it. The
+    newest modification provides the fields, the newest location change
+    provides the group, and both histories plus the losing version are
+    merged by modification time.
+    """
+    alive = [version for version in versions if version is not None]
+    deleted_at = max((time for time in deletion_times if time is not None), default=None)
+    newest = max(alive, key=lambda version: read_entry_time(version, "LastModificationTime"))
+    if deleted_at is not None and read_entry_time(newest, "LastModificationTime") < deleted_at:
+        return {"result": "deleted"}
+
+    located = max(alive, key=lambda version: read_entry_time(version, "LocationChanged"))
+    revision_times = {
+        revision.findtext("Times/LastModificationTime")
+        for version in alive
+        for revision in version.findall("History/Entry")
+    }
+    revision_times.update(version.findtext("Times/LastModificationTime") for version in alive)
+    revision_times.discard(newest.findtext("Times/LastModificationTime"))
+    history_count = len(revision_times)
+    if history_max_items >= 0:
+        history_count = min(history_count, history_max_items)
+    return {
+        "result": "kept",
+        "group": decode_entry_uuid(located.getparent()),
+        "fields_sha256": build_fields_digest(get_string_fields(newest)),
+        "history": history_count,
+    }
+
+
+def write_replicas(
+    base_path: pathlib.Path,
+    password: str,
+    seed: int,
+    change_count: int,
+    conflict_ratios: dict[str, float],
+) -> dict:
+    """Write two replicas that diverged from `base_path` and return the
+    merge manifest.
+
+    Replicas go to `<base>.replica-a.kdbx` and `<base>.replica-b.kdbx`, the
+    manifest to `<base>.merge.json`.
+    """
+    kp = open_database(base_path, password=password)
+    transformed_key = kp.transformed_key
+    base_tree = kp.tree
+    base_root = base_tree.getroot()
+    base_entries = find_vault_entries(base_root)
+    conflict_counts = count_replica_conflicts(change_count, conflict_ratios)
+    plan = plan_replica_changes(
+        len(base_entries),
+        change_count=change_count,
+        conflict_counts=conflict_counts,
+        rng=random.Random(derive_seed(seed, "replicas")),
+    )
+    start_time = find_latest_time(base_root)
+    touched = [decode_entry_uuid(base_entries[item["position"]]) for item in plan]
+
+    replica_paths = {}
+    versions = {}
+    deletion_times = {}
+    for replica in REPLICA_NAMES:
+        tree = copy.deepcopy(base_tree)
+        deletion_times[replica] = apply_replica_changes(
+            tree,
+            replica=replica,
+            plan=plan,
+            start_time=start_time,
+            rng=random.Random(derive_seed(seed, "replica", replica)),
+        )
+        entries = find_vault_entries(tree.getroot())
+        by_uuid = {decode_entry_uuid(entry): entry for entry in entries}
+        versions[replica] = {uuid_text: by_uuid.get(uuid_text) for uuid_text in touched}
+        path = base_path.with_name(f"{base_path.name}.replica-{replica}.kdbx")
+        kp.payload.xml = tree
+        kp.save(str(path), transformed_key=transformed_key)
+        check_snapshot(
+            path,
+            password=password,
+            transformed_key=transformed_key,
+            expected={
+                uuid_text: get_string_fields(entry)
+                for uuid_text, entry in versions[replica].items()
+                if entry is not None
+            },
+            entry_count=len(entries),
+        )
+        replica_paths[replica] = path.name
+    kp.payload.xml = base_tree
+
+    history_max_items = get_history_max_items(base_root)
+    merged = []
+    for item, uuid_text in zip(plan, touched):
+        merged.append(
+            {
+                "uuid": uuid_text,
+                "conflict": item["conflict"],
+                "changes": item["changes"],
+                "newer": item["newer"],
+                **merge_replica_entry(
+                    [versions[replica][uuid_text] for replica in REPLICA_NAMES],
+                    [deletion_times[replica].get(uuid_text) for replica in REPLICA_NAMES],
+                    history_max_items=history_max_items,
+                ),
+            }
+        )
+    deleted_count = sum(entry["result"] == "deleted" for entry in merged)
+    manifest = {
+        "version": MERGE_MANIFEST_VERSION,
+        "seed": seed,
+        "base": base_path.name,
+        "replicas": replica_paths,
+        "base_entry_count": len(base_entries),
+        "merged_entry_count": len(base_entries) - deleted_count,
+        "conflicts": conflict_counts,
+        "entries": merged,
+    }
+    manifest_path = base_path.with_name(f"{base_path.name}.merge.json")
+    manifest_path.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    return manifest
 
 
-def build_uri_count(rng: random.Random, force_three: bool) -> int:
-    if force_three:
-        return 3
-    return rng.randint(0, 3)
+@dataclass(frozen=True)
+class MatrixVariant:
+    major_version: int
+    minor_version: int
+    cipher: str
+    compression: str
+    protected_share: float
 
+    @property
+    def name(self) -> str:
+        return (
+            f"kdbx{self.major_version}{self.minor_version}-{self.cipher}-"
+            f"{self.compression}-protected-{self.protected_share:g}"
+        )
 
-def build_uri(index: int, ordinal: int, rng: random.Random) -> str:
-    hosts = (
-        "vault.example.test",
-        "accounts.demo.test",
-        "services.acme.test",
-        "portal.internal.test",
-        "login.mail.test",
-    )
-    host = hosts[(index + ordinal + rng.randrange(len(hosts))) % len(hosts)]
-    path = f"/app/{index % 97}/{ordinal}"
-    query = f"?view={(index + ordinal) % 11}"
-    return f"https://{host}{path}{query}"
 
+def build_matrix_variants(protected_shares: Sequence[float]) -> list[MatrixVariant]:
+    return [
+        MatrixVariant(major_version, minor_version, cipher, compression, share)
+        for major_version, minor_version in MATRIX_FORMATS
+        for cipher in MATRIX_CIPHERS
+        for compression in MATRIX_COMPRESSIONS
+        for share in protected_shares
+    ]
 
-def build_custom_field_counts(preset: Preset, rng: random.Random) -> list[int]:
-    if preset.low_field_target_count is None:
-        counts = [
-            rng.randint(preset.custom_field_min, preset.custom_field_max)
-            for _ in range(preset.entry_count)
-        ]
-        counts[0] = preset.custom_field_max
-        return counts
 
-    low_field_upper_bound_exclusive = preset.low_field_upper_bound_exclusive
-    if low_field_upper_bound_exclusive is None:
-        raise ValueError("Preset is missing low-field bounds.")
+def get_matrix_dir(output_path: pathlib.Path) -> pathlib.Path:
+    return output_path.with_name(f"{output_path.name}.matrix")
 
-    low_bucket = [
-        rng.randint(preset.custom_field_min, low_field_upper_bound_exclusive - 1)
-        for _ in range(preset.low_field_target_count)
-    ]
-    high_bucket = [
-        rng.randint(low_field_upper_bound_exclusive, preset.custom_field_max)
-        for _ in range(preset.entry_count - preset.low_field_target_count)
-    ]
-    high_bucket[0] = max(200, min(321, preset.custom_field_max))
 
-    counts = low_bucket + high_bucket
-    rng.shuffle(counts)
-    return counts
+def is_protected_in_variant(entry_uuid: str, key: str, share: float) -> bool:
+    """Pick a stable `share` of (entry, field) pairs, the same in every revision."""
+    digest = hashlib.sha256(f"{entry_uuid}/{key}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") < share * (1 << 64)
 
 
-def build_custom_field_value(index: int, field_index: int, rng: random.Random) -> str:
-    words = (
-        "alpha",
-        "bravo",
-        "charlie",
-        "delta",
-        "echo",
-        "foxtrot",
-        "gamma",
-        "hotel",
-    )
-    word = words[(index + field_index + rng.randrange(len(words))) % len(words)]
-    return f"{word}-{index:05d}-{field_index:03d}"
+def reprotect_values(element, document, writer, share: float) -> int:
+    """Re-encrypt the string values below `element` for a matrix variant.
 
+    Values protected in the base are decrypted in document order, then every
+    string field is protected or not by `is_protected_in_variant`. Returns
+    the number of protected values written.
+    """
+    protected_count = 0
+    for value in element.iter("Value"):
+        text = value.text or ""
+        if value.get("Protected") == "True":
+            text = document.unprotect(text)
+        string = value.getparent()
+        if string.tag != "String":
+            continue
+        if is_protected_in_variant(
+            string.getparent().findtext("UUID"), string.findtext("Key"), share
+        ):
+            value.set("Protected", "True")
+            value.text = writer.protect(text)
+            protected_count += 1
+        else:
+            value.attrib.pop("Protected", None)
+            value.text = text
+    return protected_count
 
-def remove_string_field(entry, key: str) -> None:
-    field = entry._xpath(f'String/Key[text()="{key}"]/..', first=True)  # noqa: SLF001
-    if field is not None:
-        entry._element.remove(field)  # noqa: SLF001
 
+def write_matrix_meta(xml_file, meta, variant: MatrixVariant, preset: Preset, seed: int) -> None:
+    """Write <Meta>, adding the KDBX 3.1 attachment pool to it."""
+    with xml_file.element(meta.tag, meta.attrib):
+        for child in meta:
+            xml_file.write(child)
+        if variant.major_version == 3:
+            write_binary_pool(xml_file, preset, seed)
 
-def append_string_field(entry, key: str, value: str, protected: bool | None = None) -> None:
-    from lxml.builder import E
 
-    if protected is None:
-        entry._element.append(E.String(E.Key(key), E.Value(value)))  # noqa: SLF001
-        return
+def write_matrix_container(
+    xml_file,
+    events: Iterator,
+    container,
+    document,
+    writer,
+    variant: MatrixVariant,
+    preset: Preset,
+    seed: int,
+) -> int:
+    """Write the children of `container`, whose start event was just read,
+    and return how many values they protect.
 
-    entry._element.append(  # noqa: SLF001
-        E.String(E.Key(key), E.Value(value, Protected=str(protected))),
-    )
+    Child containers are opened and closed around their own children. Every
+    other child is re-encrypted, written whole and dropped.
+    """
+    protected_count = 0
+    for event, element in events:
+        if element is container:
+            return protected_count
+        if element.getparent() is not container:
+            continue
+        if element.tag in MATRIX_CONTAINER_TAGS:
+            with xml_file.element(element.tag, element.attrib):
+                protected_count += write_matrix_container(
+                    xml_file, events, element, document, writer, variant, preset, seed
+                )
+        elif event == "end":
+            protected_count += reprotect_values(
+                element, document, writer, variant.protected_share
+            )
+            if element.tag == "Meta":
+                write_matrix_meta(xml_file, element, variant, preset, seed)
+            else:
+                xml_file.write(element)
+        else:
+            continue
+        element.clear()
+        container.remove(element)
+    return protected_count
 
 
-def apply_stable_metadata(element, stable_uuid: uuid.UUID, timestamp: datetime) -> None:
-    element.uuid = stable_uuid
-    element.ctime = timestamp
-    element.mtime = timestamp
-    element.atime = timestamp
-    element.expiry_time = timestamp
-    element._set_times_property("LocationChanged", timestamp)  # noqa: SLF001
+def write_matrix_variant(
+    base_path: pathlib.Path,
+    path: pathlib.Path,
+    password: str,
+    preset: Preset,
+    seed: int,
+    variant: MatrixVariant,
+    base_key: bytes,
+    kdf_parameters: dict,
+    transformed_key: bytes,
+    spot_check: int,
+) -> dict:
+    """Transcode the base vault into `variant` at `path`, validate it and
+    describe it for the matrix summary.
 
+    The base is streamed with `iterparse` through `write_matrix_container`.
+    Attachments are rebuilt from the seed rather than read back.
+    `save_seconds` only counts the writer side: the time spent decrypting,
+    decompressing and parsing the base is left out.
+    """
+    from lxml import etree
 
-def add_entry_type_marker(entry, entry_type: str) -> None:
-    value = "Login" if entry_type == "login" else "Note"
-    append_string_field(entry, KEYGUARD_ENTRY_TYPE_KEY, value)
+    read_seconds = 0.0
 
+    def iter_base_events() -> Iterator:
+        nonlocal read_seconds
+        events = etree.iterparse(document.xml, events=("start", "end"), huge_tree=True)
+        while True:
+            read_started = time.perf_counter()
+            item = next(events, None)
+            read_seconds += time.perf_counter() - read_started
+            if item is None:
+                return
+            yield item
 
-def add_uris(entry, uri_count: int, index: int, rng: random.Random) -> None:
-    if uri_count <= 0:
-        return
+    with kdbx_stream.open_document(base_path, password, base_key) as document:
+        started = time.perf_counter()
+        with kdbx_stream.open_writer(
+            path,
+            transformed_key,
+            kdf_parameters=kdf_parameters,
+            cipher_id=kdbx_stream.CIPHER_UUIDS[variant.cipher],
+            compressed=variant.compression == "gzip",
+            major_version=variant.major_version,
+        ) as writer:
+            if variant.major_version != 3:
+                for blob in range(count_attachment_blobs(preset)):
+                    size = get_attachment_blob_size(preset=preset, seed=seed, blob=blob)
+                    writer.add_binary(
+                        size, iter_attachment_chunks(seed=seed, blob=blob, size=size)
+                    )
+            with etree.xmlfile(writer, encoding="utf-8") as xml_file:
+                xml_file.write_declaration(standalone=True)
+                events = iter_base_events()
+                _, root = next(events)
+                with xml_file.element(root.tag, root.attrib):
+                    protected_count = write_matrix_container(
+                        xml_file, events, root, document, writer, variant, preset, seed
+                    )
+        save_seconds = time.perf_counter() - started - read_seconds
 
-    append_string_field(entry, "URL", build_uri(index=index, ordinal=0, rng=rng))
-    for ordinal in range(1, uri_count):
-        append_string_field(
-            entry,
-            f"{URI_FIELD_PREFIX}{ordinal}",
-            build_uri(index=index, ordinal=ordinal, rng=rng),
-        )
+    started = time.perf_counter()
+    validate_database(
+        path,
+        password=password,
+        preset=preset,
+        transformed_key=transformed_key,
+        seed=seed,
+        spot_check=spot_check,
+    )
+    validate_seconds = time.perf_counter() - started
+    return {
+        "name": variant.name,
+        "path": f"{path.parent.name}/{path.name}",
+        "format": f"{variant.major_version}.{variant.minor_version}",
+        "cipher": variant.cipher,
+        "compression": variant.compression,
+        "protected_share": variant.protected_share,
+        "protected_values": protected_count,
+        "kdf": describe_kdf_parameters(kdf_parameters),
+        "bytes": path.stat().st_size,
+        "sha256": compute_file_sha256(path),
+        "save_seconds": save_seconds,
+        "validate_seconds": validate_seconds,
+    }
 
 
-def add_custom_fields(entry, custom_field_count: int, index: int, rng: random.Random) -> None:
-    for field_index in range(custom_field_count):
-        key = f"field_{field_index:03d}"
-        value = build_custom_field_value(index=index, field_index=field_index, rng=rng)
-        append_string_field(entry, key, value)
+def write_matrix(
+    base_path: pathlib.Path,
+    password: str,
+    preset: Preset,
+    seed: int,
+    protected_shares: Sequence[float],
+    workers: int,
+    spot_check: int = 0,
+) -> dict:
+    """Write every matrix variant of the validated vault at `base_path` and
+    return the matrix summary.
 
+    Variants go to `<base>.matrix/<name>.kdbx`, transcoded from the base by
+    up to `workers` processes, and each is validated like the base, with
+    `spot_check` entries rebuilt by `entry_at`. The summary goes to
+    `<base>.matrix.json`.
+    KDBX 4.0 variants keep the base KDF. KDBX 3.1 only has AES-KDF, so those
+    variants reuse the base KDF if it is AES-KDF and otherwise share one with
+    `DEFAULT_AES_KDF_ROUNDS` rounds.
+    """
+    with base_path.open("rb") as stream:
+        base_parameters = kdbx_stream.read_header(stream).kdf_parameters
+    composite_key = kdbx_stream.compute_composite_key(password)
+    base_key = kdbx_stream.transform_key(base_parameters, composite_key)
+    if base_parameters["$UUID"] == kdbx_stream.KDF_AES:
+        v3_parameters, v3_key = base_parameters, base_key
+    else:
+        v3_parameters = kdbx_stream.build_kdf_parameters(
+            "aeskdf", DEFAULT_AES_KDF_ROUNDS, 0, 0, salt=os.urandom(32)
+        )
+        v3_key = kdbx_stream.transform_key(v3_parameters, composite_key)
 
-def build_group_uuid(preset: Preset) -> uuid.UUID:
-    return uuid.uuid5(uuid.NAMESPACE_URL, f"keyguard/{preset.name}/group")
+    matrix_dir = get_matrix_dir(base_path)
+    if matrix_dir.exists():
+        shutil.rmtree(matrix_dir)
+    matrix_dir.mkdir()
+    variants = build_matrix_variants(protected_shares)
+    jobs = [
+        dict(
+            base_path=base_path,
+            path=matrix_dir / f"{variant.name}.kdbx",
+            password=password,
+            preset=preset,
+            seed=seed,
+            variant=variant,
+            base_key=base_key,
+            kdf_parameters=v3_parameters if variant.major_version == 3 else base_parameters,
+            transformed_key=v3_key if variant.major_version == 3 else base_key,
+            spot_check=spot_check,
+        )
+        for variant in variants
+    ]
+    if workers <= 1:
+        described = [write_matrix_variant(**job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(write_matrix_variant, **job) for job in jobs]
+            described = [future.result() for future in futures]
 
+    summary = {
+        "version": MATRIX_SUMMARY_VERSION,
+        "preset": preset.name,
+        "seed": seed,
+        "base": base_path.name,
+        "base_bytes": base_path.stat().st_size,
+        "variants": described,
+    }
+    summary_path = base_path.with_name(f"{base_path.name}.matrix.json")
+    summary_path.write_text(json.dumps(summary, indent=2) + "\n", encoding="utf-8")
+    return summary
 
-def build_entry_uuid(preset: Preset, entry_type: str, index: int) -> uuid.UUID:
-    return uuid.uuid5(
-        uuid.NAMESPACE_URL,
-        f"keyguard/{preset.name}/{entry_type}/{index}",
-    )
 
+@dataclass(frozen=True)
+class FleetVault:
+    name: str
+    preset: Preset
+    seed: int
+    password: str
+    kdf: KdfSettings | None
+    scheme: str
+    writer: str
 
-def build_timestamp(index: int) -> datetime:
-    return BASE_TIME + timedelta(minutes=index)
+    @property
+    def cache_key(self) -> str:
+        return build_cache_key(
+            preset=self.preset,
+            seed=self.seed,
+            password=self.password,
+            kdf=self.kdf,
+            scheme=self.scheme,
+            writer=self.writer,
+        )
 
 
-def create_entries(kp, preset: Preset, rng: random.Random) -> None:
-    group = kp.add_group(kp.root_group, preset.name)
-    apply_stable_metadata(
-        element=group,
-        stable_uuid=build_group_uuid(preset),
-        timestamp=build_timestamp(0),
-    )
-    entry_types = build_entry_types(preset, rng)
-    custom_field_counts = build_custom_field_counts(preset, rng)
-    forced_login_profile_applied = False
+def build_fleet_vaults(spec: dict) -> list[FleetVault]:
+    """Expand a fleet spec into its vaults.
 
-    for index, entry_type in enumerate(entry_types):
-        force_login_profile = entry_type == "login" and not forced_login_profile_applied
-        title = build_title(preset=preset, entry_type=entry_type, index=index)
-        notes = build_notes(
-            entry_type=entry_type,
-            index=index,
-            rng=rng,
-            force=index == 0 or force_login_profile,
+    Vault `i` uses preset `presets[i % len(presets)]`, and gets its own seed
+    and password derived from the spec's seed. With `entries` as [MIN, MAX],
+    its entry count is drawn log-uniformly from that range, so a fleet has
+    many small vaults and a few large ones.
+    """
+    unknown = sorted(set(spec) - set(FLEET_SPEC_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown fleet spec keys: {', '.join(unknown)}.")
+    vault_count = spec.get("vaults")
+    if not isinstance(vault_count, int) or vault_count < 1:
+        raise ValueError("The fleet spec needs a positive number of 'vaults'.")
+    seed = spec.get("seed", 0)
+    presets = spec.get("presets", [DEFAULT_FLEET_PRESET])
+    unknown = sorted(set(presets) - set(PRESETS))
+    if not presets or unknown:
+        raise ValueError(f"Unknown fleet presets: {', '.join(unknown) or 'none given'}.")
+    entries = spec.get("entries")
+    if isinstance(entries, int):
+        entries = [entries, entries]
+    if entries is not None and not (len(entries) == 2 and 1 <= entries[0] <= entries[1]):
+        raise ValueError(f"Expected fleet 'entries' as N or [MIN, MAX], got {entries!r}.")
+    kdf = spec.get("kdf")
+    if kdf is not None:
+        if kdf.get("kdf") not in KDF_NAMES:
+            raise ValueError(f"Expected a fleet 'kdf' with kdf one of {', '.join(KDF_NAMES)}.")
+        # Zeros are accepted as "unset", so KdfSettings dicts work as given.
+        kdf = build_kdf_settings(
+            kdf["kdf"],
+            rounds=kdf.get("rounds"),
+            memory_mib=kdf.get("memory_mib") or None,
+            parallelism=kdf.get("parallelism") or None,
         )
-        custom_field_count = custom_field_counts[index]
+    scheme = spec.get("scheme")
+    writer = spec.get("writer")
+    if scheme not in (None, *GENERATION_SCHEMES) or writer not in (None, *WRITERS):
+        raise ValueError(f"Unknown fleet scheme {scheme!r} or writer {writer!r}.")
 
-        if entry_type == "login":
-            entry = kp.add_entry(
-                group,
-                title=title,
-                username=build_username(rng=rng, index=index),
-                password=build_password(rng=rng, index=index),
-                notes=notes,
-            )
-            add_uris(
-                entry=entry,
-                uri_count=build_uri_count(rng=rng, force_three=force_login_profile),
-                index=index,
-                rng=rng,
+    vaults = []
+    for index in range(vault_count):
+        preset = PRESETS[presets[index % len(presets)]]
+        if entries is not None:
+            low, high = entries
+            rng = random.Random(derive_seed(seed, "fleet", index, "entries"))
+            preset = apply_preset_overrides(
+                preset, entry_count=round(low * (high / low) ** rng.random())
             )
-            forced_login_profile_applied = True
-        else:
-            entry = kp.add_entry(
-                group,
-                title=title,
-                username="",
-                password="",
-                notes=notes,
-            )
-            remove_string_field(entry, "UserName")
-            remove_string_field(entry, "Password")
-
-        add_entry_type_marker(entry, entry_type=entry_type)
-        add_custom_fields(
-            entry=entry,
-            custom_field_count=custom_field_count,
-            index=index,
-            rng=rng,
-        )
-        apply_stable_metadata(
-            element=entry,
-            stable_uuid=build_entry_uuid(
+        vault_writer, vault_scheme = resolve_writer(preset, writer=writer, scheme=scheme)
+        check_writer(preset, writer=vault_writer, scheme=vault_scheme)
+        vaults.append(
+            FleetVault(
+                name=f"vault-{index:03d}",
                 preset=preset,
-                entry_type=entry_type,
-                index=index,
-            ),
-            timestamp=build_timestamp(index + 1),
+                # Kept to 31 bits so any JSON reader can load the index.
+                seed=derive_seed(seed, "fleet", index, "seed") % (1 << 31),
+                password=f"fleet-{index:03d}-{derive_key(seed, 'fleet', index).hex()[:16]}",
+                kdf=kdf,
+                scheme=vault_scheme,
+                writer=vault_writer,
+            )
         )
+    return vaults
 
 
-def get_string_fields(entry) -> dict[str, str]:
-    fields: dict[str, str] = {}
-    for string_element in entry._element.findall("String"):  # noqa: SLF001
-        key_element = string_element.find("Key")
-        value_element = string_element.find("Value")
-        if key_element is None or value_element is None or key_element.text is None:
-            continue
-        fields[key_element.text] = value_element.text or ""
-    return fields
+def generate_fleet_vault(vault: FleetVault, output_dir: pathlib.Path) -> dict:
+    """Generate one fleet vault and describe it for the fleet index."""
+    path = output_dir / f"{vault.name}.kdbx"
+    started = time.perf_counter()
+    generate_database(
+        output_path=path,
+        password=vault.password,
+        preset=vault.preset,
+        seed=vault.seed,
+        overwrite=True,
+        kdf=vault.kdf,
+        scheme=vault.scheme,
+        writer=vault.writer,
+    )
+    generate_seconds = time.perf_counter() - started
+    manifest = json.loads(get_manifest_path(path).read_text(encoding="utf-8"))
+    return {
+        "name": vault.name,
+        "path": path.name,
+        "manifest": get_manifest_path(path).name,
+        "preset": vault.preset.name,
+        "seed": vault.seed,
+        "password": vault.password,
+        "scheme": vault.scheme,
+        "writer": vault.writer,
+        "kdf": manifest["kdf"],
+        "cache_key": vault.cache_key,
+        "bytes": manifest["file"]["bytes"],
+        "sha256": manifest["file"]["sha256"],
+        "counts": manifest["counts"],
+        "generate_seconds": generate_seconds,
+    }
 
 
-def count_entry_uris(fields: dict[str, str]) -> int:
-    uri_count = 1 if fields.get("URL") else 0
-    for key in fields:
-        if key.startswith(URI_FIELD_PREFIX):
-            ordinal = key.removeprefix(URI_FIELD_PREFIX)
-            if ordinal.isdigit():
-                uri_count += 1
-    return uri_count
+def get_fleet_record_paths(
+    output_dir: pathlib.Path,
+    record: dict,
+) -> tuple[pathlib.Path, pathlib.Path]:
+    """Return the vault and manifest paths of an index record, refusing any
+    that resolve outside `output_dir`."""
+    root = output_dir.resolve()
+    paths = (
+        (root / record["path"]).resolve(),
+        (root / record["manifest"]).resolve(),
+    )
+    for path in paths:
+        if path == root or not path.is_relative_to(root):
+            raise ValueError(
+                f"Fleet index entry {record.get('name')!r} points outside {output_dir}: {path}."
+            )
+    return paths
 
 
-def count_generated_custom_fields(fields: dict[str, str]) -> int:
-    return sum(
-        1
-        for key in fields
-        if key != KEYGUARD_ENTRY_TYPE_KEY and key.startswith("field_")
+def is_fleet_vault_unchanged(
+    output_dir: pathlib.Path,
+    vault: FleetVault,
+    record: dict | None,
+) -> bool:
+    """Tell whether the indexed `record` of `vault` is still on disk as written."""
+    if record is None or record.get("cache_key") != vault.cache_key:
+        return False
+    path, manifest_path = get_fleet_record_paths(output_dir, record)
+    return (
+        path == (output_dir / f"{vault.name}.kdbx").resolve() and
+        path.exists() and
+        manifest_path.exists() and
+        path.stat().st_size == record["bytes"] and
+        compute_file_sha256(path) == record["sha256"]
     )
 
 
-def validate_database(path: pathlib.Path, password: str, preset: Preset) -> None:
-    PyKeePass, _ = load_pykeepass()
-    kp = PyKeePass(str(path), password=password)
-    group = kp.find_groups(name=preset.name, first=True)
-    if group is None:
-        raise ValueError(f"Could not find top-level group {preset.name!r}.")
+def write_fleet(
+    spec: dict,
+    output_dir: pathlib.Path,
+    workers: int,
+    overwrite: bool = False,
+    skip_unchanged: bool = False,
+) -> dict:
+    """Generate the vaults of a fleet spec and return the fleet index.
+
+    Vaults are generated by up to `workers` processes, each vault in one
+    process. With `skip_unchanged`, a vault whose spec, file and manifest
+    match the existing index is kept as is, and any other is regenerated
+    even without `overwrite`. Vaults listed in the existing index but no
+    longer in the spec are removed, which also needs `overwrite` or
+    `skip_unchanged`; index paths outside `output_dir` are refused. The index
+    is written to `output_dir / FLEET_INDEX_NAME`.
+    """
+    vaults = build_fleet_vaults(spec)
+    index_path = output_dir / FLEET_INDEX_NAME
+    previous = {}
+    if index_path.exists():
+        previous = {
+            record["name"]: record
+            for record in json.loads(index_path.read_text(encoding="utf-8"))["vaults"]
+        }
 
-    entries = kp.find_entries(group=group, recursive=False)
-    if len(entries) != preset.entry_count:
+    names = {vault.name for vault in vaults}
+    stale_paths = [
+        path
+        for name, record in previous.items()
+        if name not in names
+        for path in get_fleet_record_paths(output_dir, record)
+    ]
+    if stale_paths and not (overwrite or skip_unchanged):
         raise ValueError(
-            f"Expected {preset.entry_count} entries, found {len(entries)}."
+            f"{index_path} lists vaults the spec no longer has. Pass --overwrite or "
+            "--skip-unchanged to remove them."
         )
 
-    login_count = 0
-    secure_note_count = 0
-    entries_with_notes = 0
-    login_with_three_uris = False
-    wide_entry_seen = False
-    low_field_entry_count = 0
-
-    for entry in entries:
-        fields = get_string_fields(entry)
-        entry_type = fields.get(KEYGUARD_ENTRY_TYPE_KEY)
-        notes = fields.get("Notes", "")
-        if notes:
-            entries_with_notes += 1
-
-        generated_custom_fields = count_generated_custom_fields(fields)
-        if not (preset.custom_field_min <= generated_custom_fields <= preset.custom_field_max):
+    records = {}
+    pending = []
+    for vault in vaults:
+        record = previous.get(vault.name)
+        if skip_unchanged and is_fleet_vault_unchanged(output_dir, vault, record):
+            records[vault.name] = {**record, "status": "unchanged"}
+            continue
+        path = output_dir / f"{vault.name}.kdbx"
+        if path.exists() and not (overwrite or skip_unchanged):
             raise ValueError(
-                f"Entry {fields.get('Title')!r} has {generated_custom_fields} generated custom "
-                f"fields; expected between {preset.custom_field_min} and "
-                f"{preset.custom_field_max}."
+                f"Output file already exists: {path}. Pass --overwrite or --skip-unchanged."
             )
+        pending.append(vault)
 
-        if preset.name == "5k-wide-fields" and generated_custom_fields >= 200:
-            wide_entry_seen = True
-        if (
-            preset.low_field_upper_bound_exclusive is not None and
-            generated_custom_fields < preset.low_field_upper_bound_exclusive
-        ):
-            low_field_entry_count += 1
-
-        if entry_type == "Login":
-            login_count += 1
-            uri_count = count_entry_uris(fields)
-            if not (0 <= uri_count <= 3):
-                raise ValueError(
-                    f"Entry {fields.get('Title')!r} has {uri_count} URIs; expected 0 to 3."
-                )
-            if uri_count == 3:
-                login_with_three_uris = True
-        elif entry_type == "Note":
-            secure_note_count += 1
-            if "UserName" in fields:
-                raise ValueError(
-                    f"Secure note {fields.get('Title')!r} should not have a username."
-                )
-            if "Password" in fields:
-                raise ValueError(
-                    f"Secure note {fields.get('Title')!r} should not have a password."
-                )
-            if "URL" in fields:
-                raise ValueError(
-                    f"Secure note {fields.get('Title')!r} should not have a URL."
-                )
-            if not notes:
-                raise ValueError(f"Secure note {fields.get('Title')!r} must have notes.")
-        else:
-            raise ValueError(
-                f"Entry {fields.get('Title')!r} has unsupported type marker {entry_type!r}."
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if workers <= 1 or len(pending) <= 1:
+        generated = [generate_fleet_vault(vault, output_dir) for vault in pending]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(workers, len(pending))
+        ) as executor:
+            futures = [
+                executor.submit(generate_fleet_vault, vault, output_dir) for vault in pending
+            ]
+            generated = [future.result() for future in futures]
+    for record in generated:
+        records[record["name"]] = {**record, "status": "generated"}
+
+    for stale_path in stale_paths:
+        stale_path.unlink(missing_ok=True)
+
+    ordered = [records[vault.name] for vault in vaults]
+    index = {
+        "version": FLEET_INDEX_VERSION,
+        "generator_version": GENERATOR_VERSION,
+        "spec": spec,
+        "vaults": ordered,
+        "totals": {
+            "vaults": len(ordered),
+            "generated": len(generated),
+            "unchanged": len(ordered) - len(generated),
+            "entries": sum(record["counts"]["entries"] for record in ordered),
+            "bytes": sum(record["bytes"] for record in ordered),
+        },
+    }
+    index_path.write_text(json.dumps(index, indent=2) + "\n", encoding="utf-8")
+    return index
+
+
+def run_generate(args: argparse.Namespace) -> None:
+    try:
+        preset = apply_preset_overrides(
+            PRESETS[args.preset],
+            entry_count=args.entries,
+            login_ratio=args.login_ratio,
+            custom_fields=args.custom_fields,
+            attachment_count=args.attachments,
+            attachment_duplicate_ratio=args.attachment_duplicate_ratio,
+            attachment_sizes=args.attachment_sizes,
+            history=args.history,
+            history_max_items=args.history_max_items,
+            group_depth=args.group_depth,
+            group_fanout=args.group_fanout,
+            tag_vocabulary=args.tags,
+            tags_per_entry_max=args.tags_per_entry,
+            tag_skew=args.tag_skew,
+            reused_password_ratio=args.reused_passwords,
+            reuse_group_size=args.reuse_group_size,
+            weak_password_ratio=args.weak_passwords,
+            tfa_domain_ratio=args.tfa_domains,
+            passkey_domain_ratio=args.passkey_domains,
+            autofill_target_count=args.autofill_targets,
+            autofill_hit_ratio=args.autofill_hits,
+            autofill_miss_ratio=args.autofill_misses,
+            custom_icon_count=args.custom_icons,
+            custom_icon_ratio=args.custom_icon_ratio,
+            custom_icon_sizes=args.custom_icon_sizes,
+            oversized_value_count=args.oversized_values,
+            oversized_value_sizes=args.oversized_value_sizes,
+            profile=(
+                None if args.profile is None
+                else load_profile(pathlib.Path(args.profile).expanduser())
+            ),
+        )
+        kdf = resolve_kdf_settings(args)
+        writer, scheme = resolve_writer(preset, writer=args.writer, scheme=args.scheme)
+        get_spot_check_entries(scheme, args.spot_check)
+        check_writer(preset, writer=writer, scheme=scheme)
+        exports = {
+            export_format: pathlib.Path(getattr(args, export_format)).expanduser().resolve()
+            for export_format in EXPORT_WRITERS
+            if getattr(args, export_format)
+        }
+        check_exports(preset, exports, writer=writer)
+        conflict_ratios = {
+            "edit": args.edit_conflicts,
+            "delete": args.delete_conflicts,
+            "move": args.move_conflicts,
+        }
+        count_replica_conflicts(args.replica_changes, conflict_ratios)
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from exc
+    output_path = pathlib.Path(args.output).expanduser().resolve()
+    seed = preset.default_seed if args.seed is None else args.seed
+    if output_path.exists() and not args.overwrite:
+        raise SystemExit(
+            f"Output file already exists: {output_path}. Pass --overwrite to replace it."
+        )
+
+    report = GenerationReport()
+    if args.report_json:
+        tracemalloc.start()
+    started = time.perf_counter()
+    cpu_started = get_cpu_seconds()
+
+    cache_dir = None
+    cache_key = None
+    cache_hit = False
+    if args.cache_dir:
+        cache_dir = pathlib.Path(args.cache_dir).expanduser().resolve()
+        cache_key = build_cache_key(
+            preset=preset,
+            seed=seed,
+            password=args.password,
+            kdf=kdf,
+            scheme=scheme,
+            writer=writer,
+        )
+        # Cache entries only hold the database and its manifest, so exports
+        # and workloads always regenerate.
+        regenerates_sidecars = bool(
+            exports or args.queries or args.raw_xml or preset.autofill_target_count
+        )
+        cache_hit = not regenerates_sidecars and restore_cached_database(
+            cache_dir,
+            cache_key,
+            output_path,
+            link=args.cache_link,
+        )
+
+    if cache_hit:
+        print(f"Restored {preset.name} at {output_path} from cache entry {cache_key}.")
+    else:
+        generate_database(
+            output_path=output_path,
+            password=args.password,
+            preset=preset,
+            seed=seed,
+            overwrite=args.overwrite,
+            workers=args.workers,
+            kdf=kdf,
+            report=report,
+            scheme=scheme,
+            writer=writer,
+            spot_check=args.spot_check,
+            exports=exports,
+            queries_per_kind=args.queries,
+            raw_xml_path=(
+                None if args.raw_xml is None
+                else pathlib.Path(args.raw_xml).expanduser().resolve()
+            ),
+        )
+        # The manifest of a raw XML run describes files the cache does not hold.
+        if cache_dir is not None and not args.raw_xml:
+            store_cached_database(
+                cache_dir,
+                cache_key,
+                output_path,
+                link=args.cache_link,
+                max_bytes=args.cache_max_mib * 1024 * 1024,
+            )
+        print(
+            f"Created {preset.name} at {output_path} "
+            f"with password {args.password!r} and seed {seed}."
+        )
+        if kdf is not None:
+            print(f"KDF: {asdict(kdf)}.")
+    print(f"Wrote fixture manifest to {get_manifest_path(output_path)}.")
+    if preset.profile is not None:
+        manifest = json.loads(get_manifest_path(output_path).read_text(encoding="utf-8"))
+        for distribution, fit in manifest["profile_fit"].items():
+            print(
+                f"Profile fit for {distribution}: distance {fit['distance']} over "
+                f"{fit['samples']} values, mean {fit['observed_mean']} "
+                f"(profile {fit['expected_mean']})."
             )
 
-    if login_count != preset.login_count:
-        raise ValueError(
-            f"Expected {preset.login_count} login entries, found {login_count}."
+    if has_watchtower_roles(preset):
+        findings_path = output_path.with_name(f"{output_path.name}.watchtower.json")
+        findings_path.write_text(
+            json.dumps(build_watchtower_findings(preset, seed=seed), indent=2) + "\n",
+            encoding="utf-8",
         )
-    if secure_note_count != preset.secure_note_count:
-        raise ValueError(
-            f"Expected {preset.secure_note_count} secure notes, found {secure_note_count}."
+        print(f"Wrote expected watchtower findings to {findings_path}.")
+
+    if args.replicas:
+        try:
+            manifest = write_replicas(
+                output_path,
+                password=args.password,
+                seed=seed,
+                change_count=args.replica_changes,
+                conflict_ratios=conflict_ratios,
+            )
+        except ValueError as exc:
+            raise SystemExit(str(exc)) from exc
+        print(
+            f"Wrote replicas {', '.join(manifest['replicas'].values())} "
+            f"and {output_path.name}.merge.json."
         )
-    if entries_with_notes <= 0:
-        raise ValueError("Expected at least one entry with notes.")
-    if not login_with_three_uris:
-        raise ValueError("Expected at least one login entry with 3 URIs.")
-    if preset.name == "5k-wide-fields" and not wide_entry_seen:
-        raise ValueError(
-            "Expected at least one wide entry with hundreds of custom fields."
+
+    if args.matrix:
+        try:
+            summary = write_matrix(
+                output_path,
+                password=args.password,
+                preset=preset,
+                seed=seed,
+                protected_shares=args.matrix_protected,
+                workers=args.workers,
+                spot_check=get_spot_check_entries(scheme, args.spot_check),
+            )
+        except ValueError as exc:
+            raise SystemExit(str(exc)) from exc
+        print(
+            f"Wrote {len(summary['variants'])} matrix variants to "
+            f"{get_matrix_dir(output_path)} and {output_path.name}.matrix.json."
         )
-    if (
-        preset.low_field_target_count is not None and
-        low_field_entry_count != preset.low_field_target_count
-    ):
-        raise ValueError(
-            f"Expected {preset.low_field_target_count} entries below "
-            f"{preset.low_field_upper_bound_exclusive} custom fields, found "
-            f"{low_field_entry_count}."
+
+    if args.report_json:
+        write_generation_report(
+            pathlib.Path(args.report_json).expanduser().resolve(),
+            build_generation_report(
+                report,
+                preset=preset,
+                seed=seed,
+                workers=args.workers,
+                scheme=scheme,
+                writer=writer,
+                kdf=kdf,
+                output_path=output_path,
+                wall_seconds=time.perf_counter() - started,
+                cpu_seconds=get_cpu_seconds() - cpu_started,
+                cache_hit=cache_hit,
+            ),
         )
+    check_rss_budget(args.max_rss)
 
 
-def generate_database(
-    output_path: pathlib.Path,
-    password: str,
+def build_generation_report(
+    report: GenerationReport,
     preset: Preset,
     seed: int,
-    overwrite: bool,
-) -> None:
-    PyKeePass, create_database = load_pykeepass()
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    workers: int,
+    scheme: str,
+    writer: str,
+    kdf: KdfSettings | None,
+    output_path: pathlib.Path,
+    wall_seconds: float,
+    cpu_seconds: float,
+    cache_hit: bool,
+) -> dict:
+    peak_rss = get_peak_rss_bytes()
+    return {
+        "version": REPORT_VERSION,
+        "generator_version": GENERATOR_VERSION,
+        "preset": asdict(preset),
+        "seed": seed,
+        "scheme": scheme,
+        "writer": writer,
+        "workers": workers,
+        "kdf": None if kdf is None else asdict(kdf),
+        "cache_hit": cache_hit,
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": cpu_seconds,
+        "entries_per_second": preset.entry_count / wall_seconds if wall_seconds else None,
+        "output_bytes": output_path.stat().st_size,
+        "peak_rss_bytes": None if peak_rss is None else peak_rss[0],
+        "peak_worker_rss_bytes": None if peak_rss is None else peak_rss[1],
+        "tracemalloc_peak_bytes": max(
+            (timing.get("tracemalloc_peak_bytes", 0) for timing in report.phases.values()),
+            default=None,
+        ),
+        "phases": report.phases,
+    }
 
-    if output_path.exists() and not overwrite:
-        raise FileExistsError(
-            f"Output file already exists: {output_path}. Pass --overwrite to replace it."
+
+def write_generation_report(path: pathlib.Path, report: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"Wrote generation report to {path}.")
+
+
+def check_rss_budget(max_rss_mib: int | None) -> None:
+    if max_rss_mib is None:
+        return
+    peak_rss = get_peak_rss_bytes()
+    if peak_rss is None:
+        raise SystemExit("--max-rss is not supported on this platform.")
+    peak_rss_mib = max(peak_rss) / (1024 * 1024)
+    if peak_rss_mib > max_rss_mib:
+        raise SystemExit(
+            f"Peak RSS {peak_rss_mib:.1f} MiB exceeded the --max-rss budget of "
+            f"{max_rss_mib} MiB."
         )
 
-    temp_file = tempfile.NamedTemporaryFile(
-        prefix=f"{preset.name}-",
-        suffix=".kdbx",
-        dir=output_path.parent,
-        delete=False,
+
+def run_calibrate(args: argparse.Namespace) -> None:
+    load_pykeepass()
+    output_path = pathlib.Path(args.output).expanduser().resolve()
+    grid = build_calibration_grid(
+        kdfs=args.kdf,
+        aes_rounds=args.aes_rounds,
+        argon2_iterations=args.argon2_iterations,
+        argon2_memory_mib=args.argon2_memory,
+        argon2_parallelism=args.argon2_parallelism,
     )
-    temp_file.close()
-    temp_path = pathlib.Path(temp_file.name)
+    table = calibrate(grid, repeat=args.repeat)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(table, indent=2) + "\n", encoding="utf-8")
+    print(f"Wrote {len(table['results'])} KDF measurements to {output_path}.")
 
+
+def run_mutate(args: argparse.Namespace) -> None:
+    input_path = pathlib.Path(args.input).expanduser().resolve()
+    output_dir = pathlib.Path(args.output_dir).expanduser().resolve()
     try:
-        rng = random.Random(seed)
-        kp = create_database(str(temp_path), password=password)
-        kp.database_name = f"Keyguard test dataset: {preset.name}"
-        kp.database_description = (
-            f"Preset {preset.name} generated by scripts/keepass/create_test_db.py."
+        change_log = mutate_database(
+            input_path=input_path,
+            output_dir=output_dir,
+            password=args.password,
+            seed=args.seed,
+            snapshot_count=args.snapshots,
+            counts={
+                "edits": args.edits,
+                "additions": args.additions,
+                "deletions": args.deletions,
+                "moves": args.moves,
+            },
+            overwrite=args.overwrite,
         )
-        kp.default_username = "test-user"
-        create_entries(kp=kp, preset=preset, rng=rng)
-        kp.save()
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from exc
+    print(
+        f"Wrote {len(change_log['snapshots'])} snapshots of {input_path.name} "
+        f"to {output_dir} with seed {args.seed}."
+    )
 
-        # Re-open the database to verify the resulting file shape, not just the
-        # in-memory entry objects.
-        _ = PyKeePass(str(temp_path), password=password)
-        validate_database(path=temp_path, password=password, preset=preset)
 
-        if output_path.exists():
-            output_path.unlink()
-        os.replace(temp_path, output_path)
-    except Exception:
-        if temp_path.exists():
-            temp_path.unlink()
-        raise
+def run_fleet(args: argparse.Namespace) -> None:
+    spec_path = pathlib.Path(args.spec).expanduser().resolve()
+    output_dir = pathlib.Path(args.output_dir).expanduser().resolve()
+    try:
+        spec = json.loads(spec_path.read_text(encoding="utf-8"))
+        index = write_fleet(
+            spec,
+            output_dir=output_dir,
+            workers=args.workers,
+            overwrite=args.overwrite,
+            skip_unchanged=args.skip_unchanged,
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from exc
+    totals = index["totals"]
+    print(
+        f"Wrote fleet of {totals['vaults']} vaults to {output_dir}: "
+        f"{totals['generated']} generated, {totals['unchanged']} unchanged."
+    )
 
 
 def main() -> None:
     args = parse_args()
-    preset = PRESETS[args.preset]
-    output_path = pathlib.Path(args.output).expanduser().resolve()
-    seed = preset.default_seed if args.seed is None else args.seed
-
-    generate_database(
-        output_path=output_path,
-        password=args.password,
-        preset=preset,
-        seed=seed,
-        overwrite=args.overwrite,
-    )
-
-    print(
-        f"Created {preset.name} at {output_path} "
-        f"with password {args.password!r} and seed {seed}."
-    )
+    if args.command == "calibrate":
+        run_calibrate(args)
+    elif args.command == "mutate":
+        run_mutate(args)
+    elif args.command == "fleet":
+        run_fleet(args)
+    else:
+        run_generate(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,868 @@
+"""Streaming KDBX 3.1 and 4 access for the KeePass test database generator.
+
+pykeepass decrypts, decompresses and parses a whole database into one lxml
+tree, and serializes one the same way. The helpers here read and write the
+payload block by block instead, so a generated vault can be written and
+checked in passes whose memory does not grow with the vault.
+"""
+
+import base64
+import hashlib
+import hmac
+import io
+import os
+import struct
+import time
+import zlib
+from collections.abc import Iterable
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+
+KDBX_SIGNATURE = b"\x03\xd9\xa2\x9a\x67\xfb\x4b\xb5"
+
+CIPHER_AES256 = bytes.fromhex("31c1f2e6bf714350be5805216afc5aff")
+CIPHER_CHACHA20 = bytes.fromhex("d6038a2b8b6f4cb5a524339a31dbb59a")
+CIPHER_TWOFISH = bytes.fromhex("ad68f29f576f4bb9a36ad47af965346c")
+CIPHER_UUIDS = {
+    "aes256": CIPHER_AES256,
+    "chacha20": CIPHER_CHACHA20,
+    "twofish": CIPHER_TWOFISH,
+}
+
+KDF_AES = bytes.fromhex("c9d9f39a628a4460bf740d08c18a4fea")
+KDF_ARGON2D = bytes.fromhex("ef636ddf8c29444b91f7a9a403e30a0c")
+KDF_ARGON2ID = bytes.fromhex("9e298b1956db4773b23dfc3ec6f0a1e6")
+KDF_UUIDS = {
+    "aeskdf": KDF_AES,
+    "argon2d": KDF_ARGON2D,
+    "argon2id": KDF_ARGON2ID,
+}
+ARGON2_VERSION = 0x13
+
+VARIANT_UINT32 = 0x04
+VARIANT_UINT64 = 0x05
+VARIANT_BYTES = 0x42
+KDF_PARAMETER_TYPES = {
+    "$UUID": VARIANT_BYTES,
+    "R": VARIANT_UINT64,
+    "S": VARIANT_BYTES,
+    "I": VARIANT_UINT64,
+    "M": VARIANT_UINT64,
+    "P": VARIANT_UINT32,
+    "V": VARIANT_UINT32,
+}
+
+OUTER_HEADER_END = 0
+OUTER_HEADER_CIPHER_ID = 2
+OUTER_HEADER_COMPRESSION_FLAGS = 3
+OUTER_HEADER_MASTER_SEED = 4
+OUTER_HEADER_TRANSFORM_SEED = 5
+OUTER_HEADER_TRANSFORM_ROUNDS = 6
+OUTER_HEADER_ENCRYPTION_IV = 7
+OUTER_HEADER_PROTECTED_STREAM_KEY = 8
+OUTER_HEADER_STREAM_START_BYTES = 9
+OUTER_HEADER_INNER_RANDOM_STREAM_ID = 10
+OUTER_HEADER_KDF_PARAMETERS = 11
+
+OUTER_HEADER_END_DATA = b"\r\n\r\n"
+
+INNER_HEADER_END = 0
+INNER_HEADER_STREAM_ID = 1
+INNER_HEADER_STREAM_KEY = 2
+INNER_HEADER_BINARY = 3
+
+INNER_STREAM_SALSA20 = 2
+INNER_STREAM_CHACHA20 = 3
+SALSA20_INNER_STREAM_NONCE = bytes.fromhex("e830094b97205d2a")
+
+READ_CHUNK_SIZE = 1 << 16
+# Payload bytes per HMAC block when writing, as KeePass uses.
+WRITE_BLOCK_SIZE = 1 << 20
+
+
+class KdbxFormatError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class KdbxHeader:
+    major_version: int
+    minor_version: int
+    cipher_id: bytes
+    compressed: bool
+    master_seed: bytes
+    encryption_iv: bytes
+    # KDBX 3.1 headers carry AES-KDF settings, returned in the KDBX 4 shape.
+    kdf_parameters: dict
+    data: bytes
+    # KDBX 3.1 keeps the protected stream settings in the outer header.
+    inner_stream_id: int | None = None
+    inner_stream_key: bytes | None = None
+    stream_start_bytes: bytes | None = None
+
+
+def read_exact(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise KdbxFormatError(f"Unexpected end of file: wanted {size} bytes, got {len(data)}.")
+    return data
+
+
+def parse_variant_dictionary(data: bytes) -> dict:
+    if len(data) < 2 or data[1] != 0x01:
+        raise KdbxFormatError("Unsupported KDF parameter dictionary version.")
+
+    values = {}
+    offset = 2
+    while True:
+        value_type = data[offset]
+        offset += 1
+        if value_type == 0:
+            return values
+        (key_length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        key = data[offset:offset + key_length].decode("utf-8")
+        offset += key_length
+        (value_length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        raw = data[offset:offset + value_length]
+        offset += value_length
+
+        if value_type in (0x04, 0x05):
+            values[key] = int.from_bytes(raw, "little")
+        elif value_type in (0x0C, 0x0D):
+            values[key] = int.from_bytes(raw, "little", signed=True)
+        elif value_type == 0x08:
+            values[key] = raw != b"\x00"
+        elif value_type == 0x18:
+            values[key] = raw.decode("utf-8")
+        else:
+            values[key] = raw
+
+
+def read_header(stream) -> KdbxHeader:
+    signature = read_exact(stream, 8)
+    if signature != KDBX_SIGNATURE:
+        raise KdbxFormatError("Not a KDBX file.")
+    version = read_exact(stream, 4)
+    minor_version, major_version = struct.unpack("<HH", version)
+    if major_version not in (3, 4):
+        raise KdbxFormatError(f"Unsupported KDBX version {major_version}.{minor_version}.")
+
+    # KDBX 3.1 header fields have 16-bit lengths.
+    field_format = "<BH" if major_version == 3 else "<BI"
+    data = bytearray(signature + version)
+    fields = {}
+    while True:
+        field_header = read_exact(stream, struct.calcsize(field_format))
+        field_id, field_length = struct.unpack(field_format, field_header)
+        field_data = read_exact(stream, field_length)
+        data += field_header + field_data
+        if field_id == OUTER_HEADER_END:
+            break
+        fields[field_id] = field_data
+
+    try:
+        if major_version == 3:
+            kdf_parameters = {
+                "$UUID": KDF_AES,
+                "R": struct.unpack("<Q", fields[OUTER_HEADER_TRANSFORM_ROUNDS])[0],
+                "S": fields[OUTER_HEADER_TRANSFORM_SEED],
+            }
+            inner_stream = dict(
+                inner_stream_id=struct.unpack(
+                    "<I", fields[OUTER_HEADER_INNER_RANDOM_STREAM_ID]
+                )[0],
+                inner_stream_key=fields[OUTER_HEADER_PROTECTED_STREAM_KEY],
+                stream_start_bytes=fields[OUTER_HEADER_STREAM_START_BYTES],
+            )
+        else:
+            kdf_parameters = parse_variant_dictionary(fields[OUTER_HEADER_KDF_PARAMETERS])
+            inner_stream = {}
+        return KdbxHeader(
+            major_version=major_version,
+            minor_version=minor_version,
+            cipher_id=fields[OUTER_HEADER_CIPHER_ID],
+            compressed=struct.unpack("<I", fields[OUTER_HEADER_COMPRESSION_FLAGS])[0] == 1,
+            master_seed=fields[OUTER_HEADER_MASTER_SEED],
+            encryption_iv=fields[OUTER_HEADER_ENCRYPTION_IV],
+            kdf_parameters=kdf_parameters,
+            data=bytes(data),
+            **inner_stream,
+        )
+    except KeyError as exc:
+        raise KdbxFormatError(f"KDBX header is missing field {exc.args[0]}.") from exc
+
+
+def compute_composite_key(password: str) -> bytes:
+    return hashlib.sha256(hashlib.sha256(password.encode("utf-8")).digest()).digest()
+
+
+def transform_key(kdf_parameters: dict, composite_key: bytes) -> bytes:
+    kdf_uuid = kdf_parameters["$UUID"]
+    if kdf_uuid in (KDF_ARGON2D, KDF_ARGON2ID):
+        from argon2.low_level import Type
+        from argon2.low_level import hash_secret_raw
+
+        return hash_secret_raw(
+            secret=composite_key,
+            salt=kdf_parameters["S"],
+            time_cost=kdf_parameters["I"],
+            memory_cost=kdf_parameters["M"] // 1024,
+            parallelism=kdf_parameters["P"],
+            hash_len=32,
+            type=Type.ID if kdf_uuid == KDF_ARGON2ID else Type.D,
+            version=kdf_parameters["V"],
+        )
+    if kdf_uuid == KDF_AES:
+        from Cryptodome.Cipher import AES
+
+        cipher = AES.new(kdf_parameters["S"], AES.MODE_ECB)
+        transformed = composite_key
+        for _ in range(kdf_parameters["R"]):
+            transformed = cipher.encrypt(transformed)
+        return hashlib.sha256(transformed).digest()
+    raise KdbxFormatError(f"Unsupported KDF {kdf_uuid.hex()}.")
+
+
+def build_kdf_parameters(
+    kdf: str,
+    rounds: int,
+    memory_kib: int,
+    parallelism: int,
+    salt: bytes,
+) -> dict:
+    """Return KDF parameters in the same shape `read_header` produces.
+
+    `rounds` is the AES-KDF round count or the Argon2 iteration count.
+    """
+    if kdf == "aeskdf":
+        return {"$UUID": KDF_AES, "R": rounds, "S": salt}
+    return {
+        "$UUID": KDF_UUIDS[kdf],
+        "I": rounds,
+        "M": memory_kib * 1024,
+        "P": parallelism,
+        "S": salt,
+        "V": ARGON2_VERSION,
+    }
+
+
+def compute_hmac_base_key(master_seed: bytes, transformed_key: bytes) -> bytes:
+    return hashlib.sha512(master_seed + transformed_key + b"\x01").digest()
+
+
+def compute_block_hmac_key(hmac_base_key: bytes, block_index: int) -> bytes:
+    return hashlib.sha512(struct.pack("<Q", block_index) + hmac_base_key).digest()
+
+
+def new_payload_cipher(cipher_id: bytes, key: bytes, iv: bytes):
+    if cipher_id == CIPHER_AES256:
+        from Cryptodome.Cipher import AES
+
+        return AES.new(key, AES.MODE_CBC, iv)
+    if cipher_id == CIPHER_CHACHA20:
+        from Cryptodome.Cipher import ChaCha20
+
+        return ChaCha20.new(key=key, nonce=iv)
+    if cipher_id == CIPHER_TWOFISH:
+        from pykeepass.kdbx_parsing.twofish import Twofish
+
+        return Twofish.new(key, mode=Twofish.MODE_CBC, IV=iv)
+    raise KdbxFormatError(f"Unsupported cipher {cipher_id.hex()}.")
+
+
+def new_inner_stream_cipher(stream_id: int, stream_key: bytes):
+    if stream_id == INNER_STREAM_SALSA20:
+        from Cryptodome.Cipher import Salsa20
+
+        return Salsa20.new(
+            key=hashlib.sha256(stream_key).digest(),
+            nonce=SALSA20_INNER_STREAM_NONCE,
+        )
+    if stream_id != INNER_STREAM_CHACHA20:
+        raise KdbxFormatError(f"Unsupported inner random stream {stream_id}.")
+
+    from Cryptodome.Cipher import ChaCha20
+
+    key_hash = hashlib.sha512(stream_key).digest()
+    return ChaCha20.new(key=key_hash[:32], nonce=key_hash[32:44])
+
+
+def iter_hmac_blocks(stream, hmac_base_key: bytes) -> Iterator[bytes]:
+    block_index = 0
+    while True:
+        expected_hmac = read_exact(stream, 32)
+        length_bytes = read_exact(stream, 4)
+        (length,) = struct.unpack("<I", length_bytes)
+        block = read_exact(stream, length)
+        index_bytes = struct.pack("<Q", block_index)
+        actual_hmac = hmac.new(
+            compute_block_hmac_key(hmac_base_key, block_index),
+            index_bytes + length_bytes + block,
+            hashlib.sha256,
+        ).digest()
+        if not hmac.compare_digest(expected_hmac, actual_hmac):
+            raise KdbxFormatError(f"Payload block {block_index} failed HMAC verification.")
+        if length == 0:
+            return
+        yield block
+        block_index += 1
+
+
+def iter_hashed_blocks(stream) -> Iterator[bytes]:
+    """Yield the SHA-256 checked blocks of a decrypted KDBX 3.1 payload."""
+    block_index = 0
+    while True:
+        index, expected_hash, length = struct.unpack("<I32sI", read_exact(stream, 40))
+        if index != block_index:
+            raise KdbxFormatError(f"Expected payload block {block_index}, found {index}.")
+        if length == 0:
+            return
+        block = read_exact(stream, length)
+        if hashlib.sha256(block).digest() != expected_hash:
+            raise KdbxFormatError(f"Payload block {block_index} failed hash verification.")
+        yield block
+        block_index += 1
+
+
+def iter_file_chunks(stream) -> Iterator[bytes]:
+    while chunk := stream.read(READ_CHUNK_SIZE):
+        yield chunk
+
+
+def iter_decrypted(blocks: Iterator[bytes], cipher, block_size: int) -> Iterator[bytes]:
+    """Decrypt a block stream, holding back the last cipher block for unpadding."""
+    if block_size == 1:
+        for block in blocks:
+            yield cipher.decrypt(block)
+        return
+
+    pending = b""
+    for block in blocks:
+        pending += block
+        usable = max(0, (len(pending) // block_size - 1) * block_size)
+        if usable:
+            yield cipher.decrypt(pending[:usable])
+            pending = pending[usable:]
+
+    if len(pending) != block_size:
+        raise KdbxFormatError("Encrypted payload is not block aligned.")
+    last = cipher.decrypt(pending)
+    padding = last[-1]
+    if not (1 <= padding <= block_size) or last[-padding:] != bytes([padding]) * padding:
+        raise KdbxFormatError("Invalid payload padding. Is the password correct?")
+    yield last[:-padding]
+
+
+def iter_decompressed(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+class ChunkStream(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks."""
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        super().__init__()
+        self._chunks = chunks
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+@dataclass(frozen=True)
+class BinaryInfo:
+    size: int
+    sha256: bytes
+    protected: bool
+
+
+@dataclass
+class KdbxDocument:
+    """Decrypted inner XML of a KDBX file, exposed as a byte stream.
+
+    Protected values stay encrypted in `xml`; pass each one, in document
+    order, to `unprotect` to recover its plaintext.
+    """
+
+    header: KdbxHeader
+    xml: io.BufferedReader
+    binaries: list[BinaryInfo]
+    inner_stream_id: int
+    inner_stream_key: bytes
+    inner_stream_cipher: object
+
+    def unprotect(self, text: str | None) -> str:
+        if not text:
+            return ""
+        return self.inner_stream_cipher.decrypt(base64.b64decode(text)).decode("utf-8")
+
+
+def read_binary_info(stream, length: int) -> BinaryInfo:
+    """Hash an inner-header binary chunk by chunk instead of loading it."""
+    flags = read_exact(stream, 1)
+    remaining = length - 1
+    digest = hashlib.sha256()
+    while remaining:
+        chunk = read_exact(stream, min(remaining, READ_CHUNK_SIZE))
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return BinaryInfo(size=length - 1, sha256=digest.digest(), protected=flags[0] & 0x01 == 1)
+
+
+def read_meta_binaries(meta) -> list[BinaryInfo]:
+    """Describe the KDBX 3.1 attachment pool kept in `meta`'s <Binaries>."""
+    binaries = []
+    for binary in meta.iterfind("Binaries/Binary"):
+        if binary.get("Protected") == "True":
+            raise KdbxFormatError("Protected Meta/Binaries entries are not supported.")
+        data = base64.b64decode(binary.text or "")
+        if binary.get("Compressed") == "True":
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        binaries.append(
+            BinaryInfo(size=len(data), sha256=hashlib.sha256(data).digest(), protected=False)
+        )
+    return binaries
+
+
+def read_inner_header(stream) -> tuple[int, bytes, list[BinaryInfo]]:
+    stream_id = None
+    stream_key = None
+    binaries = []
+    while True:
+        field_type, field_length = struct.unpack("<BI", read_exact(stream, 5))
+        if field_type == INNER_HEADER_BINARY:
+            binaries.append(read_binary_info(stream, field_length))
+            continue
+        field_data = read_exact(stream, field_length)
+        if field_type == INNER_HEADER_END:
+            break
+        if field_type == INNER_HEADER_STREAM_ID:
+            (stream_id,) = struct.unpack("<I", field_data)
+        elif field_type == INNER_HEADER_STREAM_KEY:
+            stream_key = field_data
+    if stream_id is None or stream_key is None:
+        raise KdbxFormatError("Inner header is missing the protected stream settings.")
+    return stream_id, stream_key, binaries
+
+
+@contextmanager
+def open_document(
+    path,
+    password: str,
+    transformed_key: bytes | None = None,
+) -> Iterator[KdbxDocument]:
+    """Open a KDBX 3.1 or 4 file and stream its decrypted inner XML.
+
+    The KDF runs at most once, and not at all when the caller already holds
+    the file's `transformed_key`. Header integrity and every payload block
+    HMAC (KDBX 4) or hash (KDBX 3.1) are checked as the payload is read.
+    """
+    with open(path, "rb") as stream:
+        header = read_header(stream)
+        if header.major_version == 3:
+            yield open_document_v3(stream, header, password, transformed_key)
+            return
+
+        header_sha256 = read_exact(stream, 32)
+        header_hmac = read_exact(stream, 32)
+        if hashlib.sha256(header.data).digest() != header_sha256:
+            raise KdbxFormatError("KDBX header checksum mismatch.")
+
+        if transformed_key is None:
+            transformed_key = transform_key(
+                header.kdf_parameters,
+                compute_composite_key(password),
+            )
+        hmac_base_key = compute_hmac_base_key(header.master_seed, transformed_key)
+        expected_header_hmac = hmac.new(
+            compute_block_hmac_key(hmac_base_key, 0xFFFF_FFFF_FFFF_FFFF),
+            header.data,
+            hashlib.sha256,
+        ).digest()
+        if not hmac.compare_digest(header_hmac, expected_header_hmac):
+            raise KdbxFormatError("KDBX header HMAC mismatch. Is the password correct?")
+
+        master_key = hashlib.sha256(header.master_seed + transformed_key).digest()
+        cipher = new_payload_cipher(header.cipher_id, master_key, header.encryption_iv)
+        chunks = iter_decrypted(
+            iter_hmac_blocks(stream, hmac_base_key),
+            cipher,
+            block_size=1 if header.cipher_id == CIPHER_CHACHA20 else 16,
+        )
+        if header.compressed:
+            chunks = iter_decompressed(chunks)
+
+        payload = io.BufferedReader(ChunkStream(chunks), buffer_size=READ_CHUNK_SIZE)
+        stream_id, stream_key, binaries = read_inner_header(payload)
+        yield KdbxDocument(
+            header=header,
+            xml=payload,
+            binaries=binaries,
+            inner_stream_id=stream_id,
+            inner_stream_key=stream_key,
+            inner_stream_cipher=new_inner_stream_cipher(stream_id, stream_key),
+        )
+
+
+def open_document_v3(
+    stream,
+    header: KdbxHeader,
+    password: str,
+    transformed_key: bytes | None,
+) -> KdbxDocument:
+    if transformed_key is None:
+        transformed_key = transform_key(header.kdf_parameters, compute_composite_key(password))
+    master_key = hashlib.sha256(header.master_seed + transformed_key).digest()
+    cipher = new_payload_cipher(header.cipher_id, master_key, header.encryption_iv)
+    plaintext = io.BufferedReader(
+        ChunkStream(
+            iter_decrypted(
+                iter_file_chunks(stream),
+                cipher,
+                block_size=1 if header.cipher_id == CIPHER_CHACHA20 else 16,
+            )
+        ),
+        buffer_size=READ_CHUNK_SIZE,
+    )
+    if plaintext.read(len(header.stream_start_bytes)) != header.stream_start_bytes:
+        raise KdbxFormatError("KDBX stream start bytes mismatch. Is the password correct?")
+
+    chunks = iter_hashed_blocks(plaintext)
+    if header.compressed:
+        chunks = iter_decompressed(chunks)
+    return KdbxDocument(
+        header=header,
+        xml=io.BufferedReader(ChunkStream(chunks), buffer_size=READ_CHUNK_SIZE),
+        # KDBX 3.1 keeps attachments as base64 text in Meta/Binaries.
+        binaries=[],
+        inner_stream_id=header.inner_stream_id,
+        inner_stream_key=header.inner_stream_key,
+        inner_stream_cipher=new_inner_stream_cipher(
+            header.inner_stream_id, header.inner_stream_key
+        ),
+    )
+
+
+def build_variant_dictionary(values: dict) -> bytes:
+    """Encode KDF parameters, the inverse of `parse_variant_dictionary`."""
+    data = bytearray(b"\x00\x01")
+    for key, value in values.items():
+        value_type = KDF_PARAMETER_TYPES[key]
+        if value_type == VARIANT_UINT32:
+            raw = struct.pack("<I", value)
+        elif value_type == VARIANT_UINT64:
+            raw = struct.pack("<Q", value)
+        else:
+            raw = value
+        encoded_key = key.encode("utf-8")
+        data += struct.pack("<BI", value_type, len(encoded_key)) + encoded_key
+        data += struct.pack("<I", len(raw)) + raw
+    data += b"\x00"
+    return bytes(data)
+
+
+def build_header(
+    cipher_id: bytes,
+    compressed: bool,
+    master_seed: bytes,
+    encryption_iv: bytes,
+    kdf_parameters: dict,
+) -> bytes:
+    data = bytearray(KDBX_SIGNATURE + struct.pack("<HH", 0, 4))
+    for field_id, field_data in (
+        (OUTER_HEADER_CIPHER_ID, cipher_id),
+        (OUTER_HEADER_COMPRESSION_FLAGS, struct.pack("<I", int(compressed))),
+        (OUTER_HEADER_MASTER_SEED, master_seed),
+        (OUTER_HEADER_ENCRYPTION_IV, encryption_iv),
+        (OUTER_HEADER_KDF_PARAMETERS, build_variant_dictionary(kdf_parameters)),
+        (OUTER_HEADER_END, OUTER_HEADER_END_DATA),
+    ):
+        data += struct.pack("<BI", field_id, len(field_data)) + field_data
+    return bytes(data)
+
+
+def build_header_v3(
+    cipher_id: bytes,
+    compressed: bool,
+    master_seed: bytes,
+    encryption_iv: bytes,
+    kdf_parameters: dict,
+    inner_stream_key: bytes,
+    stream_start_bytes: bytes,
+) -> bytes:
+    if kdf_parameters["$UUID"] != KDF_AES:
+        raise ValueError("KDBX 3.1 only supports AES-KDF.")
+    data = bytearray(KDBX_SIGNATURE + struct.pack("<HH", 1, 3))
+    for field_id, field_data in (
+        (OUTER_HEADER_CIPHER_ID, cipher_id),
+        (OUTER_HEADER_COMPRESSION_FLAGS, struct.pack("<I", int(compressed))),
+        (OUTER_HEADER_MASTER_SEED, master_seed),
+        (OUTER_HEADER_TRANSFORM_SEED, kdf_parameters["S"]),
+        (OUTER_HEADER_TRANSFORM_ROUNDS, struct.pack("<Q", kdf_parameters["R"])),
+        (OUTER_HEADER_ENCRYPTION_IV, encryption_iv),
+        (OUTER_HEADER_PROTECTED_STREAM_KEY, inner_stream_key),
+        (OUTER_HEADER_STREAM_START_BYTES, stream_start_bytes),
+        (OUTER_HEADER_INNER_RANDOM_STREAM_ID, struct.pack("<I", INNER_STREAM_SALSA20)),
+        (OUTER_HEADER_END, OUTER_HEADER_END_DATA),
+    ):
+        data += struct.pack("<BH", field_id, len(field_data)) + field_data
+    return bytes(data)
+
+
+class KdbxWriter:
+    """Write a KDBX 4 or KDBX 3.1 file in one pass.
+
+    KDBX 4 payload bytes run through a streaming gzip compressor and the
+    payload cipher into HMAC blocks of `WRITE_BLOCK_SIZE`. KDBX 3.1 payload
+    bytes are compressed into SHA-256 hashed blocks of the same size, which
+    are then encrypted. Either way only about one block is held in memory.
+    KDBX 4 attachments go first, through `add_binary`; everything passed to
+    `write` after that is the inner XML document, whose protected values
+    must each be passed through `protect` in document order.
+
+    `timings` accumulates the wall and CPU seconds spent compressing,
+    encrypting and writing blocks, each counted apart from the others.
+    """
+
+    def __init__(
+        self,
+        stream,
+        transformed_key: bytes,
+        kdf_parameters: dict,
+        cipher_id: bytes = CIPHER_AES256,
+        compressed: bool = True,
+        major_version: int = 4,
+    ) -> None:
+        if major_version not in (3, 4):
+            raise ValueError(f"Unsupported KDBX version {major_version}.")
+        master_seed = os.urandom(32)
+        encryption_iv = os.urandom(12 if cipher_id == CIPHER_CHACHA20 else 16)
+        self.timings = self._new_timings()
+        self._stream = stream
+        self._major_version = major_version
+        if major_version == 3:
+            stream_key = os.urandom(32)
+            stream_start_bytes = os.urandom(32)
+            self._stream.write(
+                build_header_v3(
+                    cipher_id,
+                    compressed,
+                    master_seed,
+                    encryption_iv,
+                    kdf_parameters,
+                    stream_key,
+                    stream_start_bytes,
+                )
+            )
+            inner_stream_id = INNER_STREAM_SALSA20
+        else:
+            stream_key = os.urandom(64)
+            header = build_header(
+                cipher_id, compressed, master_seed, encryption_iv, kdf_parameters
+            )
+            self._hmac_base_key = compute_hmac_base_key(master_seed, transformed_key)
+            self._stream.write(header)
+            self._stream.write(hashlib.sha256(header).digest())
+            self._stream.write(
+                hmac.new(
+                    compute_block_hmac_key(self._hmac_base_key, 0xFFFF_FFFF_FFFF_FFFF),
+                    header,
+                    hashlib.sha256,
+                ).digest()
+            )
+            inner_stream_id = INNER_STREAM_CHACHA20
+
+        master_key = hashlib.sha256(master_seed + transformed_key).digest()
+        self._cipher = new_payload_cipher(cipher_id, master_key, encryption_iv)
+        self._cipher_block_size = 1 if cipher_id == CIPHER_CHACHA20 else 16
+        self._compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compressed else None
+        self._plaintext = bytearray()
+        self._ciphertext = bytearray()
+        self._block_data = bytearray()
+        self._block_index = 0
+        self._xml_started = False
+        self._inner_stream_cipher = new_inner_stream_cipher(inner_stream_id, stream_key)
+
+        if major_version == 3:
+            self._encrypt(stream_start_bytes)
+        else:
+            self._write_payload(
+                struct.pack("<BII", INNER_HEADER_STREAM_ID, 4, INNER_STREAM_CHACHA20) +
+                struct.pack("<BI", INNER_HEADER_STREAM_KEY, len(stream_key)) + stream_key
+            )
+
+    def add_binary(self, size: int, chunks: Iterable[bytes], protected: bool = True) -> None:
+        """Append an attachment of `size` bytes to the inner header's pool."""
+        if self._major_version == 3:
+            raise ValueError("KDBX 3.1 binaries belong in the XML document's Meta/Binaries.")
+        if self._xml_started:
+            raise ValueError("Binaries must be added before the XML document.")
+        self._write_payload(struct.pack("<BIB", INNER_HEADER_BINARY, size + 1, protected))
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            self._write_payload(chunk)
+        if written != size:
+            raise ValueError(f"Binary has {written} bytes, expected {size}.")
+
+    def write(self, data: bytes) -> int:
+        if not self._xml_started:
+            self._xml_started = True
+            if self._major_version == 4:
+                self._write_payload(struct.pack("<BI", INNER_HEADER_END, 0))
+        self._write_payload(data)
+        return len(data)
+
+    def protect(self, text: str) -> str:
+        if not text:
+            return ""
+        encrypted = self._inner_stream_cipher.encrypt(text.encode("utf-8"))
+        return base64.b64encode(encrypted).decode("ascii")
+
+    def take_timings(self) -> dict[str, dict[str, float]]:
+        """Return the timings so far and start counting from zero again."""
+        timings, self.timings = self.timings, self._new_timings()
+        return timings
+
+    def close(self) -> None:
+        self.write(b"")
+        if self._compressor is not None:
+            with self._timed("compress"):
+                data = self._compressor.flush()
+            self._write_compressed(data)
+        if self._major_version == 3:
+            while self._block_data:
+                self._write_hashed_block(self._block_data[:WRITE_BLOCK_SIZE])
+                del self._block_data[:WRITE_BLOCK_SIZE]
+            self._write_hashed_block(b"")
+        if self._cipher_block_size > 1:
+            padding = self._cipher_block_size - len(self._plaintext) % self._cipher_block_size
+            self._encrypt(bytes([padding]) * padding)
+        while self._ciphertext:
+            self._write_block(self._ciphertext[:WRITE_BLOCK_SIZE])
+            del self._ciphertext[:WRITE_BLOCK_SIZE]
+        if self._major_version == 4:
+            self._write_block(b"")
+
+    @staticmethod
+    def _new_timings() -> dict[str, dict[str, float]]:
+        return {
+            name: {"wall_seconds": 0.0, "cpu_seconds": 0.0}
+            for name in ("compress", "encrypt", "write")
+        }
+
+    @contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        try:
+            yield
+        finally:
+            timing = self.timings[name]
+            timing["wall_seconds"] += time.perf_counter() - wall_started
+            timing["cpu_seconds"] += time.process_time() - cpu_started
+
+    def _write_payload(self, data: bytes) -> None:
+        if self._compressor is not None:
+            with self._timed("compress"):
+                data = self._compressor.compress(data)
+        if data:
+            self._write_compressed(data)
+
+    def _write_compressed(self, data: bytes) -> None:
+        if self._major_version == 4:
+            self._encrypt(data)
+            return
+        self._block_data += data
+        while len(self._block_data) >= WRITE_BLOCK_SIZE:
+            self._write_hashed_block(self._block_data[:WRITE_BLOCK_SIZE])
+            del self._block_data[:WRITE_BLOCK_SIZE]
+
+    def _write_hashed_block(self, block: bytes) -> None:
+        with self._timed("write"):
+            block_hash = hashlib.sha256(block).digest() if block else bytes(32)
+        self._encrypt(
+            struct.pack("<I32sI", self._block_index, block_hash, len(block)) + block
+        )
+        self._block_index += 1
+
+    def _encrypt(self, data: bytes) -> None:
+        self._plaintext += data
+        usable = len(self._plaintext) - len(self._plaintext) % self._cipher_block_size
+        if not usable:
+            return
+        with self._timed("encrypt"):
+            self._ciphertext += self._cipher.encrypt(bytes(self._plaintext[:usable]))
+        del self._plaintext[:usable]
+        while len(self._ciphertext) >= WRITE_BLOCK_SIZE:
+            self._write_block(self._ciphertext[:WRITE_BLOCK_SIZE])
+            del self._ciphertext[:WRITE_BLOCK_SIZE]
+
+    def _write_block(self, block: bytes) -> None:
+        with self._timed("write"):
+            self._write_authenticated_block(block)
+
+    def _write_authenticated_block(self, block: bytes) -> None:
+        if self._major_version == 3:
+            # KDBX 3.1 ciphertext is written as is; the hashed blocks are inside it.
+            self._stream.write(block)
+            return
+        index_bytes = struct.pack("<Q", self._block_index)
+        length_bytes = struct.pack("<I", len(block))
+        block_hmac = hmac.new(
+            compute_block_hmac_key(self._hmac_base_key, self._block_index),
+            index_bytes + length_bytes + block,
+            hashlib.sha256,
+        ).digest()
+        self._stream.write(block_hmac + length_bytes + block)
+        self._block_index += 1
+
+
+@contextmanager
+def open_writer(
+    path,
+    transformed_key: bytes,
+    kdf_parameters: dict,
+    cipher_id: bytes = CIPHER_AES256,
+    compressed: bool = True,
+    major_version: int = 4,
+) -> Iterator[KdbxWriter]:
+    """Create a KDBX 4 or KDBX 3.1 file and stream its payload.
+
+    The caller derives `transformed_key` from `kdf_parameters`, whose salt
+    is written to the header as given. The file is only complete once the
+    context exits without an error.
+    """
+    with open(path, "wb") as stream:
+        writer = KdbxWriter(
+            stream,
+            transformed_key=transformed_key,
+            kdf_parameters=kdf_parameters,
+            cipher_id=cipher_id,
+            compressed=compressed,
+            major_version=major_version,
+        )
+        yield writer
+        writer.close()
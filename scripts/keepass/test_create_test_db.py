@@ -0,0 +1,1208 @@
+"""Tests for the deterministic KeePass test database generator."""
+
+from __future__ import annotations
+
+import base64
+import collections
+import csv
+import dataclasses
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import re
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+from urllib.parse import urlsplit
+from xml.etree import ElementTree
+from unittest.mock import patch
+
+from scripts.keepass.create_test_db import (
+    CALIBRATION_TABLE_VERSION,
+    PRESETS,
+    KdfSettings,
+    GenerationReport,
+    IndexPermutation,
+    Preset,
+    QueryIndex,
+    apply_preset_overrides,
+    build_cache_key,
+    build_fields_digest,
+    build_oversized_value_digests,
+    build_custom_field_counts,
+    build_entry_types,
+    build_watchtower_findings,
+    check_exports,
+    check_writer,
+    check_rss_budget,
+    count_attachment_blobs,
+    count_custom_icon_references,
+    entry_at,
+    generate_database,
+    get_attachment_blob,
+    get_attachment_blob_size,
+    get_registrable_domain,
+    get_entry_attachments,
+    get_string_fields,
+    iter_document_elements,
+    iter_oversized_value_chunks,
+    kdbx_stream,
+    load_profile,
+    match_autofill_uri,
+    mutate_database,
+    parse_args,
+    pick_calibrated_kdf,
+    resolve_writer,
+    restore_cached_database,
+    store_cached_database,
+    validate_database,
+    write_fleet,
+    write_matrix,
+    write_pykeepass_database,
+    write_replicas,
+)
+
+HAS_PYKEEPASS = importlib.util.find_spec("pykeepass") is not None
+PASSWORD = "test-password"
+# Keeps the KDF out of test wall time.
+FAST_KDF = KdfSettings(kdf="aeskdf", rounds=1)
+
+
+class PresetOverridesTest(unittest.TestCase):
+    def test_scales_counts_to_the_requested_entry_count(self) -> None:
+        preset = apply_preset_overrides(PRESETS["5k-wide-fields"], entry_count=1_000)
+
+        self.assertEqual(800, preset.login_count)
+        self.assertEqual(200, preset.secure_note_count)
+        self.assertEqual(900, preset.low_field_target_count)
+
+    def test_custom_fields_override_replaces_the_distribution(self) -> None:
+        preset = apply_preset_overrides(
+            PRESETS["10k-small-fields"],
+            entry_count=500,
+            login_ratio=0.5,
+            custom_fields=(2, 40, 450),
+        )
+
+        self.assertEqual(250, preset.login_count)
+        self.assertEqual(30, preset.low_field_upper_bound_exclusive)
+        counts = build_custom_field_counts(preset, random.Random(1))
+        self.assertEqual(500, len(counts))
+        self.assertEqual(450, sum(1 for count in counts if count < 30))
+        self.assertTrue(all(2 <= count <= 40 for count in counts))
+
+    def test_rejects_a_range_that_misses_the_low_field_bound(self) -> None:
+        with self.assertRaises(ValueError):
+            apply_preset_overrides(PRESETS["5k-wide-fields"], custom_fields=(0, 20, 10))
+
+    def test_large_presets_plan_compactly(self) -> None:
+        preset = PRESETS["1m-small-fields"]
+        entry_types = build_entry_types(preset, random.Random(preset.default_seed))
+
+        self.assertEqual(preset.entry_count, entry_types.itemsize * len(entry_types))
+        self.assertEqual(preset.secure_note_count, sum(entry_types))
+
+    def test_attachments_share_pool_entries_at_the_duplicate_ratio(self) -> None:
+        preset = PRESETS["1k-attachments"]
+        seed = preset.default_seed
+        attachments = [
+            attachment
+            for index in range(preset.entry_count)
+            for attachment in get_entry_attachments(preset, index)
+        ]
+        blobs = {get_attachment_blob(preset, seed, attachment) for attachment in attachments}
+
+        self.assertEqual(list(range(preset.attachment_count)), attachments)
+        self.assertEqual(210, count_attachment_blobs(preset))
+        self.assertEqual(set(range(210)), blobs)
+        self.assertGreaterEqual(get_attachment_blob_size(preset, seed, 0), 64 << 20)
+
+
+class CounterSchemeTest(unittest.TestCase):
+    def test_index_permutation_is_a_bijection(self) -> None:
+        for size in (1, 2, 3, 17, 1_000):
+            with self.subTest(size=size):
+                permutation = IndexPermutation(size=size, key=b"k" * 32)
+                self.assertEqual(
+                    list(range(size)),
+                    sorted(permutation.forward(index) for index in range(size)),
+                )
+
+    def test_entry_at_keeps_preset_totals_and_ignores_order(self) -> None:
+        preset = small_preset()
+        entries = [entry_at(preset, seed=3, index=index) for index in range(preset.entry_count)]
+        fields = [get_string_fields(entry) for entry in entries]
+
+        notes = [entry for entry in fields if entry["Keyguard: Entry Type"] == "Note"]
+        self.assertEqual(preset.secure_note_count, len(notes))
+        self.assertEqual(
+            preset.low_field_target_count,
+            sum(1 for entry in fields if sum(key.startswith("field_") for key in entry) < 30),
+        )
+        self.assertEqual(fields[150], get_string_fields(entry_at(preset, seed=3, index=150)))
+        self.assertNotEqual(fields[150], get_string_fields(entry_at(preset, seed=4, index=150)))
+
+
+def small_preset(name: str = "5k-wide-fields", **overrides) -> Preset:
+    preset = apply_preset_overrides(PRESETS[name], entry_count=200)
+    return dataclasses.replace(preset, **overrides)
+
+
+@unittest.skipUnless(HAS_PYKEEPASS, "pykeepass is not installed")
+class KdfSettingsTest(unittest.TestCase):
+    def test_generate_is_the_default_command(self) -> None:
+        args = parse_args(["--preset", "10k-small-fields", "--output", "out.kdbx"])
+
+        self.assertEqual("generate", args.command)
+        self.assertEqual("10k-small-fields", args.preset)
+
+    def test_attachment_presets_default_to_the_stream_writer(self) -> None:
+        args = parse_args(["--preset", "1k-attachments", "--output", "out.kdbx"])
+        attachments = PRESETS["1k-attachments"]
+
+        self.assertEqual(
+            ("stream", "v2"),
+            resolve_writer(attachments, writer=args.writer, scheme=args.scheme),
+        )
+        self.assertEqual(("pykeepass", "v1"), resolve_writer(attachments, None, "v1"))
+        self.assertEqual(
+            ("pykeepass", "v1"),
+            resolve_writer(PRESETS["10k-small-fields"], None, None),
+        )
+        for writer, scheme in (("pykeepass", "v2"), ("pykeepass", "v1")):
+            with self.assertRaisesRegex(ValueError, "in memory all at once"):
+                check_writer(attachments, writer=writer, scheme=scheme)
+        with self.assertRaisesRegex(ValueError, "in memory all at once"):
+            check_writer(PRESETS["1k-oversized-values"], writer="pykeepass", scheme="v1")
+        check_writer(PRESETS["10k-small-fields"], writer="pykeepass", scheme="v1")
+
+    def test_picks_the_closest_calibrated_parameters(self) -> None:
+        table = {
+            "version": CALIBRATION_TABLE_VERSION,
+            "results": [
+                dict(kdf="argon2id", rounds=1, memory_mib=16, parallelism=1, unlock_ms=40),
+                dict(kdf="argon2id", rounds=4, memory_mib=64, parallelism=2, unlock_ms=310),
+                dict(kdf="aeskdf", rounds=60_000, memory_mib=0, parallelism=0, unlock_ms=250),
+            ],
+        }
+
+        self.assertEqual(
+            KdfSettings(kdf="argon2id", rounds=4, memory_mib=64, parallelism=2),
+            pick_calibrated_kdf(table, kdf="argon2id", target_ms=250),
+        )
+
+
+class FixtureCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temporary_directory.name)
+        self.cache_dir = self.directory / "cache"
+
+    def tearDown(self) -> None:
+        self.temporary_directory.cleanup()
+
+    def test_key_covers_every_content_input(self) -> None:
+        preset = PRESETS["10k-small-fields"]
+        key = build_cache_key(preset=preset, seed=1, password=PASSWORD, kdf=FAST_KDF)
+
+        self.assertEqual(
+            key,
+            build_cache_key(preset=preset, seed=1, password=PASSWORD, kdf=FAST_KDF),
+        )
+        variants = [
+            dict(preset=small_preset("10k-small-fields"), seed=1, password=PASSWORD, kdf=FAST_KDF),
+            dict(preset=preset, seed=2, password=PASSWORD, kdf=FAST_KDF),
+            dict(preset=preset, seed=1, password="other", kdf=FAST_KDF),
+            dict(preset=preset, seed=1, password=PASSWORD, kdf=KdfSettings("aeskdf", 2)),
+        ]
+        for variant in variants:
+            with self.subTest(variant=variant):
+                self.assertNotEqual(key, build_cache_key(**variant))
+
+    def test_restores_hits_and_evicts_least_recently_used_entries(self) -> None:
+        source = self.directory / "source.kdbx"
+        source_manifest = self.directory / "source.kdbx.manifest.json"
+        source_manifest.write_text("{}", encoding="utf-8")
+        for age, key in enumerate(("old", "used", "new")):
+            source.write_bytes(key.encode("ascii") * 100)
+            store_cached_database(self.cache_dir, key, source, link=False, max_bytes=10_000)
+            os.utime(self.cache_dir / key, (age, age))
+
+        output = self.directory / "out" / "restored.kdbx"
+        self.assertTrue(restore_cached_database(self.cache_dir, "used", output, link=False))
+        self.assertEqual(b"used" * 100, output.read_bytes())
+        self.assertEqual("{}", output.with_name("restored.kdbx.manifest.json").read_text())
+        self.assertFalse(restore_cached_database(self.cache_dir, "missing", output, link=False))
+        (self.cache_dir / "new" / "manifest.json").unlink()
+        self.assertFalse(restore_cached_database(self.cache_dir, "new", output, link=False))
+
+        source.write_bytes(b"x" * 400)
+        store_cached_database(self.cache_dir, "latest", source, link=False, max_bytes=1_000)
+        self.assertEqual(
+            ["latest", "used"],
+            sorted(path.name for path in self.cache_dir.iterdir()),
+        )
+
+
+@unittest.skipUnless(HAS_PYKEEPASS, "pykeepass is not installed")
+class CreateTestDbTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temporary_directory.name)
+
+    def tearDown(self) -> None:
+        self.temporary_directory.cleanup()
+
+    def generate(self, preset: Preset, name: str = "test.kdbx", seed: int = 7, **kwargs) -> Path:
+        output_path = self.directory / name
+        generate_database(
+            output_path=output_path,
+            password=PASSWORD,
+            preset=preset,
+            seed=seed,
+            overwrite=True,
+            **{"kdf": FAST_KDF, **kwargs},
+        )
+        return output_path
+
+    @staticmethod
+    def read_entries(path: Path) -> dict[str, dict[str, str]]:
+        from pykeepass import PyKeePass
+
+        kp = PyKeePass(str(path), password=PASSWORD)
+        return {
+            str(entry.uuid): get_string_fields(entry._element)  # noqa: SLF001
+            for entry in kp.entries
+        }
+
+    def test_generates_every_entry_without_duplicate_lookups(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset()
+        original_add_entry = PyKeePass.add_entry
+        PyKeePass.add_entry = None
+        try:
+            path = self.generate(preset)
+        finally:
+            PyKeePass.add_entry = original_add_entry
+
+        entries = self.read_entries(path)
+        self.assertEqual(preset.entry_count, len(entries))
+        secure_notes = [
+            fields for fields in entries.values()
+            if fields["Keyguard: Entry Type"] == "Note"
+        ]
+        self.assertEqual(preset.secure_note_count, len(secure_notes))
+        self.assertTrue(all("Password" not in fields for fields in secure_notes))
+
+    def test_output_does_not_depend_on_worker_count(self) -> None:
+        preset = small_preset()
+        with patch("scripts.keepass.create_test_db.SHARD_SIZE", 64):
+            single = self.generate(preset, name="single.kdbx")
+            sharded = self.generate(preset, name="sharded.kdbx", workers=3)
+
+        self.assertEqual(self.read_entries(single), self.read_entries(sharded))
+
+    def test_v2_output_is_spot_checked_against_entry_at(self) -> None:
+        preset = small_preset()
+        with patch("scripts.keepass.create_test_db.SHARD_SIZE", 64):
+            single = self.generate(preset, name="single.kdbx", scheme="v2")
+            sharded = self.generate(preset, name="sharded.kdbx", scheme="v2", workers=3)
+
+        self.assertEqual(self.read_entries(single), self.read_entries(sharded))
+        validate_database(path=single, password=PASSWORD, preset=preset, seed=7, spot_check=200)
+        with self.assertRaisesRegex(ValueError, "entry_at"):
+            validate_database(path=single, password=PASSWORD, preset=preset, seed=8, spot_check=5)
+
+    def test_spreads_entries_over_a_group_tree_with_tags(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset("10k-deep-groups", group_depth=3, tag_vocabulary=20)
+        path = self.generate(preset)
+
+        kp = PyKeePass(str(path), password=PASSWORD)
+        groups = [group for group in kp.groups if group.path[:1] == [preset.name]]
+        self.assertEqual(1 + 2 + 4 + 8, len(groups))
+        self.assertEqual(4, max(len(group.path) for group in groups))
+        self.assertTrue(all(group.entries for group in groups))
+        tags = {tag for entry in kp.entries for tag in entry.tags or []}
+        self.assertEqual(20, len(tags))
+        with self.assertRaisesRegex(ValueError, "subgroups"):
+            validate_database(
+                path=path,
+                password=PASSWORD,
+                preset=dataclasses.replace(preset, group_fanout=3),
+            )
+
+    def test_watchtower_preset_matches_its_expected_findings(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset("10k-watchtower")
+        findings = build_watchtower_findings(preset, seed=7)
+        self.assertEqual(
+            (24, 8, 16, 40, 16),
+            (
+                findings["reused_passwords"]["entries"],
+                findings["reused_passwords"]["groups"],
+                findings["weak_passwords"],
+                findings["inactive_tfa"],
+                findings["inactive_passkey"],
+            ),
+        )
+
+        for scheme in ("v1", "v2"):
+            with self.subTest(scheme=scheme):
+                path = self.generate(preset, scheme=scheme)
+                kp = PyKeePass(str(path), password=PASSWORD)
+                passwords = [entry.password for entry in kp.entries if entry.password]
+                self.assertEqual(
+                    findings["reused_passwords"]["entries"],
+                    sum(passwords.count(password) > 1 for password in passwords),
+                )
+                with self.assertRaisesRegex(ValueError, "watchtower"):
+                    validate_database(
+                        path=path,
+                        password=PASSWORD,
+                        preset=dataclasses.replace(preset, weak_password_ratio=0.2),
+                    )
+
+    def test_exports_match_the_generated_database(self) -> None:
+        from lxml import etree
+
+        preset = small_preset("5k-history")
+        exports = {
+            "bitwarden_json": self.directory / "export.json",
+            "keepass_xml": self.directory / "export.xml",
+            "csv": self.directory / "export.csv",
+        }
+        path = self.generate(preset, exports=exports)
+        titles = sorted(fields["Title"] for fields in self.read_entries(path).values())
+
+        bitwarden = json.loads(exports["bitwarden_json"].read_text(encoding="utf-8"))
+        self.assertEqual(titles, sorted(item["name"] for item in bitwarden["items"]))
+        self.assertEqual(1, len(bitwarden["folders"]))
+        self.assertTrue(any(item["passwordHistory"] for item in bitwarden["items"]))
+
+        with exports["csv"].open(newline="", encoding="utf-8") as stream:
+            rows = list(csv.DictReader(stream))
+        self.assertEqual(titles, sorted(row["name"] for row in rows))
+
+        root = etree.parse(str(exports["keepass_xml"])).getroot()
+        self.assertEqual(
+            titles,
+            sorted(
+                get_string_fields(entry)["Title"] for entry in root.iterfind("Root/Group/Entry")
+            ),
+        )
+
+        with self.assertRaisesRegex(ValueError, "group trees"):
+            check_exports(small_preset("10k-deep-groups"), exports, writer="pykeepass")
+        check_exports(small_preset("10k-deep-groups"), exports, writer="stream")
+
+    def test_keepass_xml_export_nests_groups_and_keeps_references(self) -> None:
+        from lxml import etree
+        from pykeepass import PyKeePass
+
+        preset = small_preset(
+            "1k-attachments",
+            attachment_count=8,
+            attachment_size_buckets=((1, 4 << 10, 1),),
+            group_depth=2,
+            group_fanout=3,
+            custom_icon_count=4,
+            custom_icon_ratio=0.5,
+            custom_icon_size_buckets=((16, 1),),
+        )
+        export_path = self.directory / "export.xml"
+        path = self.generate(
+            preset, scheme="v2", writer="stream", exports={"keepass_xml": export_path}
+        )
+
+        kp = PyKeePass(str(path), password=PASSWORD)
+        expected = sorted(
+            (
+                entry.group.path,
+                entry.title,
+                [(attachment.filename, attachment.data) for attachment in entry.attachments],
+                entry._element.findtext("CustomIconUUID"),  # noqa: SLF001
+            )
+            for entry in kp.entries
+        )
+        root = etree.parse(str(export_path)).getroot()
+        pool = {
+            binary.get("ID"): base64.b64decode(binary.text)
+            for binary in root.iterfind("Meta/Binaries/Binary")
+        }
+        icons = {icon.findtext("UUID") for icon in root.iterfind("Meta/CustomIcons/Icon")}
+
+        def get_path(element) -> list[str]:
+            return [group.findtext("Name") for group in element.iterancestors("Group")][::-1]
+
+        exported = sorted(
+            (
+                get_path(entry),
+                get_string_fields(entry)["Title"],
+                [
+                    (binary.findtext("Key"), pool[binary.find("Value").get("Ref")])
+                    for binary in entry.iterfind("Binary")
+                ],
+                entry.findtext("CustomIconUUID"),
+            )
+            for entry in root.iterfind(".//Group/Entry")
+        )
+        self.assertEqual(expected, exported)
+        self.assertEqual(count_attachment_blobs(preset), len(pool))
+        self.assertEqual(4, len(icons))
+        self.assertLessEqual({element.text for element in root.iter("CustomIconUUID")}, icons)
+        self.assertEqual(
+            sorted(group.path for group in kp.groups if group.path[:1] == [preset.name]),
+            sorted(get_path(group) + [group.findtext("Name")] for group in root.iter("Group")),
+        )
+
+    def test_mutate_writes_cumulative_snapshots_and_a_change_log(self) -> None:
+        from pykeepass import PyKeePass
+
+        path = self.generate(small_preset())
+        counts = {"edits": 4, "additions": 3, "deletions": 2, "moves": 1}
+        change_logs = [
+            mutate_database(
+                input_path=path,
+                output_dir=self.directory / "snapshots",
+                password=PASSWORD,
+                seed=3,
+                snapshot_count=2,
+                counts=counts,
+                overwrite=True,
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(change_logs[0], change_logs[1])
+
+        snapshots = change_logs[0]["snapshots"]
+        self.assertEqual([201, 202], [snapshot["entry_count"] for snapshot in snapshots])
+        kp = PyKeePass(str(self.directory / "snapshots/snapshot-002.kdbx"), password=PASSWORD)
+        entries = {str(entry.uuid): entry for entry in kp.entries}
+        self.assertEqual(202, len(entries))
+        self.assertEqual(4, len(kp.tree.find("Root/DeletedObjects")))
+        for snapshot in snapshots:
+            self.assertEqual(counts["edits"], len(snapshot["edited"]))
+            self.assertTrue(all(uuid_text not in entries for uuid_text in snapshot["deleted"]))
+        # Changes within one snapshot never overlap.
+        moved = snapshots[1]["moved"][0]
+        self.assertEqual(moved["to"], str(entries[moved["uuid"]].group.uuid))
+        self.assertTrue(entries[snapshots[1]["edited"][0]["uuid"]].history)
+
+        with self.assertRaisesRegex(ValueError, "already exists"):
+            mutate_database(
+                input_path=path,
+                output_dir=self.directory / "snapshots",
+                password=PASSWORD,
+                seed=3,
+                snapshot_count=2,
+                counts=counts,
+            )
+
+    def test_replicas_diverge_with_the_requested_conflicts(self) -> None:
+        path = self.generate(small_preset())
+        ratios = {"edit": 0.2, "delete": 0.1, "move": 0.1}
+        manifests = [
+            write_replicas(
+                path,
+                password=PASSWORD,
+                seed=5,
+                change_count=20,
+                conflict_ratios=ratios,
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(manifests[0], manifests[1])
+
+        manifest = manifests[0]
+        self.assertEqual({"edit": 4, "delete": 2, "move": 2}, manifest["conflicts"])
+        # Conflicts touch one entry on both sides, other changes one entry each.
+        self.assertEqual(8 + 2 * 12, len(manifest["entries"]))
+        replicas = {
+            replica: self.read_entries(path.with_name(name))
+            for replica, name in manifest["replicas"].items()
+        }
+        for entry in manifest["entries"]:
+            if entry["result"] == "deleted":
+                self.assertIn("delete", entry["changes"].values())
+                continue
+            # The newer edit provides the fields; a move alone keeps them.
+            editors = [
+                replica for replica, change in entry["changes"].items() if change == "edit"
+            ]
+            if editors:
+                source = entry["newer"] if entry["conflict"] == "edit" else editors[0]
+                self.assertEqual(
+                    build_fields_digest(replicas[source][entry["uuid"]]),
+                    entry["fields_sha256"],
+                )
+        deleted = sum(entry["result"] == "deleted" for entry in manifest["entries"])
+        self.assertEqual(200 - deleted, manifest["merged_entry_count"])
+
+    def test_substring_lookup_matches_a_vocabulary_scan(self) -> None:
+        preset = small_preset("10k-deep-groups")
+        index = QueryIndex()
+        for entry_index in range(preset.entry_count):
+            index.add(entry_at(preset, seed=7, index=entry_index))
+        rng = random.Random(3)
+        texts = ["", "zzzz", *(rng.choice(index.token_list)[:length] for length in range(1, 6))]
+        texts += [token[1:4] for token in rng.sample(index.token_list, 20)]
+
+        for text in texts:
+            with self.subTest(text=text):
+                self.assertEqual(
+                    sorted(token for token in index.tokens if text in token),
+                    sorted(index.find_substring_tokens(text)),
+                )
+
+    def test_query_hits_match_a_scan_of_the_vault(self) -> None:
+        from pykeepass import PyKeePass
+
+        path = self.generate(small_preset("10k-deep-groups"), queries_per_kind=4)
+        workload = json.loads(
+            path.with_name(f"{path.name}.queries.json").read_text(encoding="utf-8"),
+        )
+        self.assertEqual(
+            {"prefix", "substring", "token", "custom_field", "url_host"},
+            {query["kind"] for query in workload["queries"]},
+        )
+        self.assertGreater(len({query["hit_count"] for query in workload["queries"]}), 5)
+
+        searchable = {}
+        for entry in PyKeePass(str(path), password=PASSWORD).entries:
+            fields = get_string_fields(entry._element)  # noqa: SLF001
+            fields.pop("Password", None)
+            fields.pop("Keyguard: Entry Type", None)
+            fields["Tags"] = ";".join(entry.tags or ())
+            searchable[str(entry.uuid)] = fields
+
+        def matches(fields: dict[str, str], kind: str, text: str) -> bool:
+            if kind == "custom_field":
+                key, _, token = text.partition(":")
+                return token in re.findall(r"[a-z0-9]+", fields.get(key, "").lower())
+            if kind == "url_host":
+                return any(
+                    urlsplit(value).hostname == text
+                    for key, value in fields.items()
+                    if key == "URL" or key.startswith("KP2A_URL_")
+                )
+            tokens = re.findall(r"[a-z0-9]+", " ".join(fields.values()).lower())
+            if kind == "token":
+                return text in tokens
+            if kind == "prefix":
+                return any(token.startswith(text) for token in tokens)
+            return any(text in token for token in tokens)
+
+        for query in workload["queries"]:
+            with self.subTest(kind=query["kind"], query=query["query"]):
+                expected = sorted(
+                    uuid_text
+                    for uuid_text, fields in searchable.items()
+                    if matches(fields, query["kind"], query["query"])
+                )
+                self.assertEqual(len(expected), query["hit_count"])
+                self.assertEqual(expected, query["hits"])
+
+    def test_autofill_matches_agree_with_a_scan_of_every_uri(self) -> None:
+        self.assertEqual("example.co.uk", get_registrable_domain("login.example.co.uk"))
+        self.assertEqual("user.github.io", get_registrable_domain("a.user.github.io"))
+        self.assertEqual("b.c.kawasaki.jp", get_registrable_domain("a.b.c.kawasaki.jp"))
+        self.assertEqual("city.kawasaki.jp", get_registrable_domain("www.city.kawasaki.jp"))
+
+        preset = dataclasses.replace(small_preset("10k-autofill"), autofill_target_count=10)
+        path = self.generate(preset)
+        workload = json.loads(
+            path.with_name(f"{path.name}.autofill.json").read_text(encoding="utf-8"),
+        )
+        self.assertEqual({"hits": 48, "misses": 16}, workload["roles"])
+
+        uris = [
+            (uuid_text, value)
+            for uuid_text, fields in self.read_entries(path).items()
+            for key, value in fields.items()
+            if key == "URL" or key.startswith("KP2A_URL_")
+        ]
+        matched = set()
+        for target in workload["targets"]:
+            for mode, hits in target["matches"].items():
+                with self.subTest(target=target["target"], mode=mode):
+                    expected = sorted(
+                        {
+                            uuid_text
+                            for uuid_text, uri in uris
+                            if match_autofill_uri(uri, target["target"], mode)
+                        }
+                    )
+                    self.assertEqual(expected, hits)
+                    matched.update(hits)
+        self.assertEqual(48, len(matched))
+        first_matches = workload["targets"][0]["matches"]
+        self.assertEqual([], first_matches["never"])
+        self.assertTrue(all(first_matches[mode] for mode in ("domain", "host", "exact")))
+
+    def test_manifest_matches_the_generated_database(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset("5k-history", group_depth=1, group_fanout=3)
+        report = GenerationReport()
+        path = self.generate(preset, report=report)
+
+        manifest = json.loads(path.with_name(f"{path.name}.manifest.json").read_text())
+        self.assertEqual(hashlib.sha256(path.read_bytes()).hexdigest(), manifest["file"]["sha256"])
+        self.assertEqual(path.stat().st_size, manifest["file"]["bytes"])
+        self.assertEqual({"kdf": "aeskdf", "rounds": 1}, manifest["kdf"])
+        self.assertEqual(
+            {"kdbx_version": "4.0", "cipher": "aes256", "compression": "gzip"},
+            manifest["format"],
+        )
+        self.assertEqual(list(report.phases), list(manifest["timings"]))
+
+        kp = PyKeePass(str(path), password=PASSWORD)
+        entries = kp.entries
+        fields = [get_string_fields(entry._element) for entry in entries]  # noqa: SLF001
+        counts = manifest["counts"]
+        self.assertEqual(preset.entry_count, counts["entries"])
+        self.assertEqual(preset.login_count, counts["logins"])
+        self.assertEqual(1 + 3, counts["groups"])
+        self.assertEqual(sum(map(len, fields)), counts["string_fields"])
+        self.assertEqual(
+            sum(len(entry.history) for entry in entries),
+            counts["history_revisions"],
+        )
+        self.assertEqual(
+            collections.Counter(str(len(entry.history)) for entry in entries),
+            manifest["histograms"]["history"],
+        )
+        standard_fields = {"Title", "UserName", "Password", "URL", "Notes"}
+        self.assertEqual(
+            collections.Counter(
+                str(len(set(entry_fields) - standard_fields - {
+                    key for key in entry_fields if key.startswith("KP2A_URL_")
+                }))
+                for entry_fields in fields
+            ),
+            manifest["histograms"]["custom_fields"],
+        )
+
+    def test_raw_xml_is_the_inner_document_of_the_vault(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset()
+        raw_xml_path = self.directory / "raw" / "inner.xml"
+        path = self.generate(preset, raw_xml_path=raw_xml_path)
+
+        raw_xml = raw_xml_path.read_bytes()
+        gzip_path = raw_xml_path.with_name("inner.xml.gz")
+        self.assertEqual(raw_xml, gzip.decompress(gzip_path.read_bytes()))
+        document = ElementTree.fromstring(raw_xml)
+        self.assertEqual(preset.entry_count, len(document.findall(".//Group/Entry")))
+        manifest = json.loads(path.with_name(f"{path.name}.manifest.json").read_text())
+        self.assertEqual(hashlib.sha256(raw_xml).hexdigest(), manifest["raw_xml"]["sha256"])
+        self.assertEqual("inner.xml.gz", manifest["raw_xml"]["gzip_path"])
+
+        # The inner stream cipher runs over protected values in document order.
+        protected = document.find(".//Value[@Protected='True']")
+        cipher = kdbx_stream.new_inner_stream_cipher(
+            manifest["raw_xml"]["inner_stream_id"],
+            base64.b64decode(manifest["raw_xml"]["inner_stream_key"]),
+        )
+        kp = PyKeePass(str(path), password=PASSWORD)
+        self.assertIn(
+            cipher.decrypt(base64.b64decode(protected.text)).decode("utf-8"),
+            {entry.password for entry in kp.entries},
+        )
+
+    def test_stream_writer_matches_the_pykeepass_writer(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset(
+            "1k-attachments",
+            attachment_count=10,
+            attachment_size_buckets=((1, 4 << 10, 1),),
+            group_depth=2,
+            group_fanout=3,
+            custom_icon_count=5,
+            custom_icon_ratio=0.5,
+            custom_icon_size_buckets=((16, 1),),
+        )
+        # generate_database refuses pykeepass for attachment presets, so the
+        # reference is built by its writer directly.
+        pykeepass_path = self.directory / "pykeepass.kdbx"
+        write_pykeepass_database(
+            pykeepass_path,
+            password=PASSWORD,
+            preset=preset,
+            seed=7,
+            kdf=FAST_KDF,
+            workers=1,
+            report=GenerationReport(),
+            scheme="v2",
+            exporters=(),
+        )
+        report = GenerationReport()
+        with (
+            patch("scripts.keepass.create_test_db.SHARD_SIZE", 8),
+            patch.object(kdbx_stream, "WRITE_BLOCK_SIZE", 4096),
+        ):
+            stream_path = self.generate(
+                preset,
+                name="stream.kdbx",
+                scheme="v2",
+                writer="stream",
+                workers=2,
+                report=report,
+            )
+
+        def describe(path: Path) -> tuple:
+            kp = PyKeePass(str(path), password=PASSWORD)
+            return (
+                sorted(
+                    (
+                        str(entry.uuid),
+                        entry.group.path,
+                        get_string_fields(entry._element),  # noqa: SLF001
+                        [attachment.data for attachment in entry.attachments],
+                        [revision.password for revision in entry.history],
+                        entry._element.findtext("CustomIconUUID"),  # noqa: SLF001
+                    )
+                    for entry in kp.entries
+                ),
+                sorted(group.path for group in kp.groups if group.path[:1] == [preset.name]),
+            )
+
+        self.assertEqual(describe(pykeepass_path), describe(stream_path))
+        self.assertEqual(
+            ["kdf", "compress", "encrypt", "write", "attachments", "icons", "build", "validate"],
+            list(report.phases),
+        )
+        self.assertGreater(report.phases["compress"]["wall_seconds"], 0)
+        self.assertGreater(report.phases["write"]["wall_seconds"], 0)
+        manifest = json.loads(stream_path.with_name("stream.kdbx.manifest.json").read_text())
+        self.assertEqual("stream", manifest["writer"])
+        with self.assertRaisesRegex(ValueError, "v2"):
+            self.generate(preset, name="v1.kdbx", writer="stream")
+
+    def test_oversized_values_match_their_digests(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset(
+            "10k-small-fields",
+            oversized_value_count=6,
+            oversized_value_size_buckets=((1 << 10, 8 << 10, 1), (40 << 10, 64 << 10, 1)),
+        )
+        with patch("scripts.keepass.create_test_db.OVERSIZED_VALUE_CHUNK_SIZE", 4096):
+            path = self.generate(preset, scheme="v2", writer="stream")
+            digests = build_oversized_value_digests(preset, seed=7)
+            chunks = list(iter_oversized_value_chunks(seed=7, value=0, size=digests[0][1]))
+            with self.assertRaisesRegex(ValueError, "oversized value"):
+                validate_database(path, PASSWORD, preset, seed=8)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk.encode("utf-8")) <= 4096 for chunk in chunks))
+        self.assertGreaterEqual(digests[0][1], 40 << 10)
+        fields = {
+            int(entry.title.rpartition("-")[2]): get_string_fields(entry._element)  # noqa: SLF001
+            for entry in PyKeePass(str(path), password=PASSWORD).entries
+        }
+        values = {}
+        for value, (index, (key, size, digest)) in enumerate(sorted(digests.items())):
+            self.assertEqual("Notes" if value % 2 == 0 else f"oversized_{value:06d}", key)
+            data = fields[index][key].encode("utf-8")
+            self.assertEqual((size, digest), (len(data), hashlib.sha256(data).hexdigest()))
+            values[value] = fields[index][key]
+        self.assertIn("\n", values[0])
+        self.assertNotIn("\n", values[1])
+        self.assertGreater(len(values[2].encode("utf-8")), 2 * len(values[2]))
+        manifest = json.loads(path.with_name("test.kdbx.manifest.json").read_text())
+        self.assertEqual(6, manifest["counts"]["oversized_values"])
+        self.assertEqual(
+            sum(size for _, size, _ in digests.values()),
+            manifest["counts"]["oversized_value_bytes"],
+        )
+
+    def test_validates_vaults_at_the_edges_of_the_overrides(self) -> None:
+        presets = [
+            apply_preset_overrides(PRESETS["10k-small-fields"], entry_count=50, login_ratio=0),
+            apply_preset_overrides(PRESETS["5k-wide-fields"], entry_count=3),
+            apply_preset_overrides(PRESETS["5k-wide-fields"], entry_count=1),
+        ]
+
+        self.assertEqual(
+            (2, 0),
+            (presets[1].low_field_target_count, presets[2].low_field_target_count),
+        )
+        for preset in presets:
+            for scheme in ("v1", "v2"):
+                with self.subTest(entries=preset.entry_count, scheme=scheme):
+                    self.generate(preset, scheme=scheme)
+
+    def test_mutate_edits_oversized_values(self) -> None:
+        preset = apply_preset_overrides(
+            PRESETS["1k-oversized-values"],
+            entry_count=20,
+            oversized_value_count=10,
+            oversized_value_sizes=((1 << 10, 4 << 10, 1),),
+        )
+        path = self.generate(preset, scheme="v2", writer="stream")
+        change_log = mutate_database(
+            input_path=path,
+            output_dir=self.directory / "snapshots",
+            password=PASSWORD,
+            seed=3,
+            snapshot_count=20,
+            counts={"edits": 20, "additions": 0, "deletions": 0, "moves": 0},
+        )
+
+        edited_keys = {
+            edit["field"] for snapshot in change_log["snapshots"] for edit in snapshot["edited"]
+        }
+        self.assertTrue(any(key.startswith("oversized_") for key in edited_keys))
+
+    def test_mutate_and_replicas_open_values_above_the_parser_limit(self) -> None:
+        size = 12 << 20
+        preset = apply_preset_overrides(
+            PRESETS["1k-oversized-values"],
+            entry_count=4,
+            oversized_value_count=1,
+            oversized_value_sizes=((size, size, 1),),
+        )
+        report = GenerationReport()
+        tracemalloc.start()
+        try:
+            with patch("scripts.keepass.create_test_db.OVERSIZED_VALUE_CHUNK_SIZE", 64 << 10):
+                path = self.generate(preset, scheme="v2", writer="stream", report=report)
+        finally:
+            tracemalloc.stop()
+        # The value is streamed into the vault chunk by chunk, so building the
+        # vault never holds as much as the value itself.
+        self.assertLess(report.phases["build"]["tracemalloc_peak_bytes"], size)
+        mutate_database(
+            input_path=path,
+            output_dir=self.directory / "snapshots",
+            password=PASSWORD,
+            seed=3,
+            snapshot_count=1,
+            counts={"edits": 0, "additions": 1, "deletions": 0, "moves": 0},
+        )
+        manifest = write_replicas(
+            path,
+            password=PASSWORD,
+            seed=5,
+            change_count=1,
+            conflict_ratios={"edit": 0.0, "delete": 0.0, "move": 0.0},
+        )
+
+        for output in (
+            self.directory / "snapshots" / "snapshot-001.kdbx",
+            *(path.with_name(name) for name in manifest["replicas"].values()),
+        ):
+            with kdbx_stream.open_document(output, PASSWORD) as document:
+                notes = [
+                    get_string_fields(element).get("Notes", "")
+                    for element in iter_document_elements(document)
+                    if element.tag == "Entry"
+                ]
+            self.assertEqual(size, max(len(note.encode("utf-8")) for note in notes))
+
+    def test_profile_histograms_shape_the_vault(self) -> None:
+        histograms = {
+            "entries_per_group": {"0": 1, "5-15": 2, "30-40": 1},
+            "custom_fields": {"0": 3, "6-8": 1},
+            "value_length": {"1-4": 1, "60-80": 1},
+            "uris": {"0": 1, "5": 1},
+            "tags": {"0": 1, "3": 1},
+            "history": {"0": 1, "2": 1},
+        }
+        profile_path = self.directory / "profile.json"
+        profile_path.write_text(json.dumps(histograms), encoding="utf-8")
+        profile = load_profile(profile_path)
+        # 21 groups of 13.75 entries on average.
+        preset = apply_preset_overrides(
+            PRESETS["10k-small-fields"],
+            entry_count=300,
+            group_depth=2,
+            group_fanout=4,
+            tag_vocabulary=10,
+            profile=profile,
+        )
+
+        rng = random.Random(1)
+        draws = collections.Counter(
+            profile.alias_tables["value_length"].sample(rng) > 4 for _ in range(20_000)
+        )
+        self.assertAlmostEqual(0.5, draws[True] / 20_000, delta=0.02)
+        self.assertEqual(
+            (0, 8, 3),
+            (preset.custom_field_min, preset.custom_field_max, preset.tags_per_entry_max),
+        )
+        manifests = [
+            json.loads(
+                self.generate(preset, name=f"{writer}.kdbx", scheme="v2", writer=writer)
+                .with_name(f"{writer}.kdbx.manifest.json")
+                .read_text()
+            )
+            for writer in ("pykeepass", "stream")
+        ]
+
+        fit = manifests[0]["profile_fit"]
+        self.assertEqual(fit, manifests[1]["profile_fit"])
+        self.assertEqual(set(histograms), set(fit))
+        self.assertEqual(21, fit["entries_per_group"]["samples"])
+        for distribution in set(histograms) - {"entries_per_group"}:
+            with self.subTest(distribution=distribution):
+                self.assertLess(fit[distribution]["distance"], 0.1)
+        with self.assertRaisesRegex(ValueError, "replace --custom-fields"):
+            apply_preset_overrides(preset, custom_fields=(0, 2, None), profile=profile)
+
+    def test_fleet_skips_unchanged_vaults(self) -> None:
+        from pykeepass import PyKeePass
+
+        spec = {
+            "vaults": 3,
+            "seed": 4,
+            "entries": [20, 60],
+            "kdf": dataclasses.asdict(FAST_KDF),
+            "scheme": "v2",
+            "writer": "stream",
+        }
+        output_dir = self.directory / "fleet"
+        index = write_fleet(spec, output_dir=output_dir, workers=2)
+
+        records = index["vaults"]
+        self.assertEqual(["generated"] * 3, [record["status"] for record in records])
+        self.assertEqual(3, len({record["seed"] for record in records}))
+        self.assertEqual(3, len({record["password"] for record in records}))
+        for record in records:
+            kp = PyKeePass(str(output_dir / record["path"]), password=record["password"])
+            self.assertEqual(record["counts"]["entries"], len(kp.entries))
+            self.assertTrue(20 <= record["counts"]["entries"] <= 60)
+        self.assertEqual(
+            index, json.loads((output_dir / "fleet.json").read_text(encoding="utf-8"))
+        )
+
+        with self.assertRaisesRegex(ValueError, "already exists"):
+            write_fleet(spec, output_dir=output_dir, workers=2)
+        with (output_dir / records[1]["path"]).open("ab") as stream:
+            stream.write(b"\0")
+        index = write_fleet(
+            {**spec, "vaults": 2}, output_dir=output_dir, workers=2, skip_unchanged=True
+        )
+        self.assertEqual(
+            ["unchanged", "generated"], [record["status"] for record in index["vaults"]]
+        )
+        self.assertEqual({**records[0], "status": "unchanged"}, index["vaults"][0])
+        self.assertEqual(
+            hashlib.sha256((output_dir / records[1]["path"]).read_bytes()).hexdigest(),
+            index["vaults"][1]["sha256"],
+        )
+        self.assertFalse((output_dir / records[2]["path"]).exists())
+
+        outside = self.directory / "outside.kdbx"
+        outside.write_bytes(b"keep")
+        index["vaults"][1] = {**index["vaults"][1], "path": "../outside.kdbx"}
+        (output_dir / "fleet.json").write_text(json.dumps(index), encoding="utf-8")
+        with self.assertRaisesRegex(ValueError, "points outside"):
+            write_fleet({**spec, "vaults": 1}, output_dir=output_dir, workers=1, overwrite=True)
+        self.assertEqual(b"keep", outside.read_bytes())
+
+    def test_matrix_variants_hold_the_same_vault(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = dataclasses.replace(
+            apply_preset_overrides(PRESETS["1k-attachments"], entry_count=24),
+            attachment_count=3,
+            attachment_size_buckets=((1, 4 << 10, 1),),
+        )
+        path = self.generate(preset, scheme="v2", writer="stream")
+        with patch.object(kdbx_stream, "WRITE_BLOCK_SIZE", 4096):
+            summary = write_matrix(
+                path,
+                password=PASSWORD,
+                preset=preset,
+                seed=7,
+                protected_shares=(0.0, 1.0),
+                workers=2,
+                spot_check=4,
+            )
+
+        def describe(kp) -> list:
+            return sorted(
+                (
+                    str(entry.uuid),
+                    get_string_fields(entry._element),  # noqa: SLF001
+                    [attachment.data for attachment in entry.attachments],
+                )
+                for entry in kp.entries
+            )
+
+        expected = describe(PyKeePass(str(path), password=PASSWORD))
+        self.assertEqual(
+            json.loads(path.with_name("test.kdbx.matrix.json").read_text()), summary
+        )
+        self.assertEqual(24, len(summary["variants"]))
+        for variant in summary["variants"]:
+            with self.subTest(variant=variant["name"]):
+                kp = PyKeePass(str(path.parent / variant["path"]), password=PASSWORD)
+                self.assertEqual(expected, describe(kp))
+                self.assertEqual(variant["format"], "{}.{}".format(*kp.version))
+                protected = kp.tree.findall(".//String/Value[@Protected='True']")
+                self.assertEqual(variant["protected_values"], len(protected))
+                self.assertEqual(variant["protected_share"] == 0, not protected)
+                self.assertGreater(variant["save_seconds"], 0)
+
+    def test_streaming_reader_matches_pykeepass(self) -> None:
+        preset = small_preset()
+        path = self.generate(preset)
+
+        with kdbx_stream.open_document(path, PASSWORD) as document:
+            streamed = {
+                element.findtext("UUID"): get_string_fields(element)
+                for element in iter_document_elements(document)
+                if element.tag == "Entry"
+            }
+
+        expected = self.read_entries(path)
+        self.assertEqual(len(expected), len(streamed))
+        self.assertEqual(
+            sorted(expected.values(), key=lambda fields: fields["Title"]),
+            sorted(streamed.values(), key=lambda fields: fields["Title"]),
+        )
+
+    def test_validation_rejects_wrong_password_and_counts(self) -> None:
+        preset = small_preset()
+        path = self.generate(preset)
+
+        with self.assertRaisesRegex(ValueError, "password"):
+            validate_database(path=path, password="wrong", preset=preset)
+        with self.assertRaisesRegex(ValueError, "Expected 201 entries"):
+            validate_database(
+                path=path,
+                password=PASSWORD,
+                preset=dataclasses.replace(preset, entry_count=201),
+            )
+
+    def test_stores_duplicate_attachments_once(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset(
+            "1k-attachments",
+            attachment_count=40,
+            attachment_size_buckets=((1, 4 << 10, 9), (8 << 10, 16 << 10, 1)),
+        )
+        path = self.generate(preset, scheme="v2", writer="stream")
+
+        kp = PyKeePass(str(path), password=PASSWORD)
+        attachments = [attachment for entry in kp.entries for attachment in entry.attachments]
+        self.assertEqual(40, len(attachments))
+        self.assertEqual(count_attachment_blobs(preset), len(kp.binaries))
+        self.assertEqual(len(kp.binaries), len(set(kp.binaries)))
+        self.assertEqual(
+            len(kp.binaries),
+            len({attachment.id for attachment in attachments}),
+        )
+        with self.assertRaisesRegex(ValueError, "attachments"):
+            validate_database(
+                path=path,
+                password=PASSWORD,
+                preset=dataclasses.replace(preset, attachment_count=41),
+            )
+
+    def test_custom_icons_are_pngs_referenced_by_entries_and_groups(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset(
+            "5k-custom-icons",
+            custom_icon_count=30,
+            custom_icon_size_buckets=((16, 9), (48, 1)),
+        )
+        path = self.generate(preset, scheme="v2", spot_check=50)
+
+        kp = PyKeePass(str(path), password=PASSWORD)
+        icons = kp.tree.findall("Meta/CustomIcons/Icon")
+        self.assertEqual(30, len(icons))
+        sizes = collections.Counter(
+            int.from_bytes(base64.b64decode(icon.findtext("Data"))[16:20], "big")
+            for icon in icons
+        )
+        self.assertEqual({16, 48}, set(sizes))
+        self.assertGreater(sizes[16], sizes[48])
+        references = collections.Counter(
+            element.findtext("CustomIconUUID")
+            for element in kp.tree.iterfind(".//Group/Entry")
+        )
+        references.update(
+            group.findtext("CustomIconUUID") for group in kp.tree.iterfind(".//Group")
+        )
+        references.pop(None)
+        self.assertEqual({icon.findtext("UUID") for icon in icons}, set(references))
+        self.assertEqual(count_custom_icon_references(preset), sum(references.values()))
+        with self.assertRaisesRegex(ValueError, "custom icon references"):
+            validate_database(
+                path=path,
+                password=PASSWORD,
+                preset=dataclasses.replace(preset, custom_icon_ratio=0.5),
+            )
+
+    def test_writes_capped_history_revisions(self) -> None:
+        from pykeepass import PyKeePass
+
+        preset = small_preset("5k-history", history_max_items=5)
+        path = self.generate(preset)
+
+        kp = PyKeePass(str(path), password=PASSWORD)
+        self.assertEqual(5, int(kp.tree.findtext("Meta/HistoryMaxItems")))
+        depths = [len(entry.history) for entry in kp.entries]
+        self.assertEqual(5, max(depths))
+        self.assertIn(0, depths)
+        entry = max(kp.entries, key=lambda entry: len(entry.history))
+        self.assertEqual(
+            sorted(revision.mtime for revision in entry.history),
+            [revision.mtime for revision in entry.history],
+        )
+        self.assertLess(entry.history[-1].mtime, entry.mtime)
+        with self.assertRaisesRegex(ValueError, "history revisions"):
+            validate_database(
+                path=path,
+                password=PASSWORD,
+                preset=dataclasses.replace(preset, history_max=3, history_max_items=3),
+            )
+
+    def test_reports_each_generation_phase(self) -> None:
+        report = GenerationReport()
+        self.generate(small_preset(), report=report)
+
+        self.assertEqual(
+            ["open", "plan", "build", "attachments", "icons", "kdf", "save", "validate"],
+            list(report.phases),
+        )
+        self.assertTrue(all(timing["wall_seconds"] >= 0 for timing in report.phases.values()))
+        check_rss_budget(1 << 20)
+        with self.assertRaisesRegex(SystemExit, "--max-rss"):
+            check_rss_budget(1)
+
+    def test_writes_the_requested_argon2_parameters(self) -> None:
+        preset = small_preset()
+        kdf = KdfSettings(kdf="argon2id", rounds=2, memory_mib=8, parallelism=1)
+        path = self.generate(preset, kdf=kdf)
+
+        with path.open("rb") as stream:
+            parameters = kdbx_stream.read_header(stream).kdf_parameters
+        self.assertEqual(kdbx_stream.KDF_ARGON2ID, parameters["$UUID"])
+        self.assertEqual(
+            (2, 8 * 1024 * 1024, 1),
+            (parameters["I"], parameters["M"], parameters["P"]),
+        )
+        validate_database(path=path, password=PASSWORD, preset=preset, kdf=kdf)
+        with self.assertRaisesRegex(ValueError, "KDF parameters"):
+            validate_database(path=path, password=PASSWORD, preset=preset, kdf=FAST_KDF)
+
+
+if __name__ == "__main__":
+    unittest.main()